@@ -166,6 +166,164 @@ SOCIALACCOUNT_PROVIDERS = {
 # Ensure tokens are stored
 SOCIALACCOUNT_STORE_TOKENS = True
 
+# Google API fetch settings
+# The Home view fetches Gmail, Tasks and Calendar concurrently on a bounded
+# pool. Each source gets its own deadline (seconds) and the whole fan-out is
+# capped by a page budget; late sources are marked pending for lazy-loading.
+# Queue time counts against those deadlines, so Home has a pool of its own:
+# 'api' serves the per-section API views, 'refresh' background task syncs,
+# 'swr' stale-while-revalidate refreshes and 'calendar' the per-calendar
+# fan-out inside a calendar fetch. Pools not listed get GOOGLE_FETCH_MAX_WORKERS.
+GOOGLE_FETCH_MAX_WORKERS = 8
+GOOGLE_FETCH_POOL_SIZES = {
+    'home': 24,
+    'api': 32,
+    'refresh': 4,
+    'swr': 4,
+    'calendar': 16,
+}
+GOOGLE_FETCH_TIMEOUT = 3.0
+GOOGLE_FETCH_TIMEOUTS = {
+    'emails': 3.0,
+    'tasks': 2.5,
+    'events': 2.5,
+}
+GOOGLE_FETCH_BUDGET = 4.0
+
+# Under ASGI, stream the Home page: the shell is sent at once and each data
+# section follows as soon as it loads instead of after the slowest source
+HOME_STREAMING = True
+
+# Directory of '<api>.<version>.json' discovery documents to prefer over the
+# copies bundled with google-api-python-client (optional).
+GOOGLE_DISCOVERY_CACHE_DIR = os.environ.get('GOOGLE_DISCOVERY_CACHE_DIR')
+
+# Refresh cached Google access tokens this many seconds before they expire
+GOOGLE_TOKEN_REFRESH_MARGIN = 300
+
+# HTTP transports for Google APIs: socket timeout (seconds), how long a
+# thread's keep-alive transport may sit idle before it is replaced, and the
+# connection pool size of the shared session used for OAuth token refreshes
+GOOGLE_HTTP_TIMEOUT = 10
+GOOGLE_HTTP_MAX_IDLE = 60
+GOOGLE_HTTP_POOL_SIZE = 10
+
+# Client-side quota for Google APIs, per second: per-user and per-project
+# token buckets matched to Google's published limits (Gmail counts quota
+# units, Calendar and Tasks count calls). Calls that would wait longer than
+# GOOGLE_QUOTA_MAX_WAIT seconds fail fast as a local 429.
+GOOGLE_API_QUOTAS = {
+    'gmail': {'user_rate': 250, 'project_rate': 20000},
+    'calendar': {'user_rate': 10, 'project_rate': 166},
+    'tasks': {'user_rate': 5, 'project_rate': 50},
+}
+GOOGLE_QUOTA_MAX_WAIT = 2.0
+
+# Retries for rate-limited, 5xx and transport failures: attempts after the
+# first, and the jittered exponential backoff base and ceiling (seconds)
+GOOGLE_API_MAX_RETRIES = 3
+GOOGLE_API_BACKOFF_BASE = 0.5
+GOOGLE_API_BACKOFF_MAX = 8.0
+
+# Circuit breakers for Google APIs: consecutive failures (errors or calls
+# slower than GOOGLE_CIRCUIT_LATENCY_SLO seconds) before a breaker opens,
+# seconds before a half-open probe, and whether breakers are per user
+# rather than per API. Open breakers serve mirrored data marked stale.
+# Google's per-user rate limit only ever trips that user's own breaker.
+GOOGLE_CIRCUIT_FAILURES = 5
+GOOGLE_CIRCUIT_LATENCY_SLO = 5.0
+GOOGLE_CIRCUIT_RESET_TIMEOUT = 30
+GOOGLE_CIRCUIT_PER_USER = False
+
+# Background sync worker (manage.py sync_google): concurrent jobs, which users
+# count as active (logged in within this many days), how early a source is
+# re-synced relative to its *_SYNC_INTERVAL, how much slower users idle for
+# SYNC_WORKER_IDLE_AFTER_HOURS are refreshed, the random extra delay as a
+# fraction of the interval, how often (seconds) the user list is reloaded,
+# how often mirrors marked dirty by push notifications are looked for, and
+# how often (seconds) Google quota usage is logged
+SYNC_WORKER_MAX_WORKERS = 4
+SYNC_WORKER_ACTIVE_DAYS = 7
+SYNC_WORKER_LEAD = 0.8
+SYNC_WORKER_IDLE_AFTER_HOURS = 24
+SYNC_WORKER_IDLE_MULTIPLIER = 10
+SYNC_WORKER_JITTER = 0.1
+SYNC_WORKER_USER_REFRESH = 60
+SYNC_WORKER_DIRTY_CHECK = 5
+SYNC_WORKER_STATS_INTERVAL = 300
+
+# Answer Google API calls with canned empty responses (local development)
+GOOGLE_FAKE_TRANSPORT = False
+GOOGLE_FAKE_TRANSPORT_LATENCY = 0
+
+# Google push notifications (manage.py renew_push_channels opens and renews
+# them). Gmail publishes to a Pub/Sub topic whose push subscription posts to
+# /api/push/gmail/?token=<GMAIL_PUSH_VERIFICATION_TOKEN>; Calendar channels
+# post to GOOGLE_PUSH_BASE_URL + /api/push/calendar/, which must be HTTPS.
+# While a channel is live, polling drops to GOOGLE_PUSH_SAFETY_INTERVAL.
+GMAIL_PUSH_TOPIC = os.environ.get('GMAIL_PUSH_TOPIC', '')
+GMAIL_PUSH_VERIFICATION_TOKEN = os.environ.get('GMAIL_PUSH_VERIFICATION_TOKEN', '')
+GOOGLE_PUSH_BASE_URL = os.environ.get('GOOGLE_PUSH_BASE_URL', '')
+GOOGLE_PUSH_CHANNEL_TTL = 7 * 86400
+GOOGLE_PUSH_RENEW_BEFORE = 86400
+GOOGLE_PUSH_SAFETY_INTERVAL = 3600
+
+# Live dashboard events (/api/stream/): the broker class, how many recent
+# events per user can be replayed on reconnect, how many may queue for one
+# slow connection, seconds between heartbeats, how long one connection is
+# kept open, and the browser's reconnect delay in milliseconds
+EVENT_BROKER = 'Core.events.InProcessBroker'
+SSE_REPLAY_BUFFER = 200
+SSE_QUEUE_SIZE = 100
+SSE_HEARTBEAT = 15
+SSE_STREAM_MAX_AGE = 300
+SSE_RETRY_MS = 3000
+
+# Local memory is per process: with several web processes, or sync_google
+# running separately, invalidation only reaches the process that made the
+# change. Use a shared backend (Redis, Memcached, DatabaseCache) there.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Per-user response cache for /api/emails/, /api/tasks/ and /api/calendar/:
+# seconds a response is served as fresh, then how many more seconds it may be
+# served while a background refresh replaces it
+API_CACHE_TTLS = {
+    'emails': 30,
+    'tasks': 15,
+    'calendar': 60,
+}
+API_CACHE_STALE_WINDOW = 300
+
+# Gmail inbox mirror: how many messages to keep per user and how often
+# (seconds) reads may trigger an incremental history sync
+GMAIL_MIRROR_SIZE = 100
+GMAIL_SYNC_INTERVAL = 60
+
+# Email bodies are fetched when a message is opened: how many bytes of a body
+# are decoded, and the in-process LRU cache's entry count, total size
+# (characters) and lifetime (seconds)
+GMAIL_BODY_MAX_BYTES = 256 * 1024
+GMAIL_BODY_CACHE_SIZE = 200
+GMAIL_BODY_CACHE_MAX_CHARS = 4_000_000
+GMAIL_BODY_CACHE_TTL = 600
+
+# Calendar event store: the window of events kept per calendar (days), how
+# often reads may trigger a syncToken sync, and how often (seconds) the window
+# is rebuilt with a full sync
+CALENDAR_SYNC_PAST_DAYS = 30
+CALENDAR_SYNC_FUTURE_DAYS = 180
+CALENDAR_SYNC_INTERVAL = 60
+CALENDAR_FULL_SYNC_INTERVAL = 86400
+
+# Google Tasks mirror: reads older than TASKS_SYNC_INTERVAL seconds trigger a
+# background updatedMin sync; a full sweep reconciles deletions periodically
+TASKS_SYNC_INTERVAL = 30
+TASKS_FULL_SYNC_INTERVAL = 3600
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -7,3 +7,6 @@ class CoreConfig(AppConfig):
 
     def ready(self):
         import Core.signals
+        from Core.google_client import preload_discovery_documents
+
+        preload_discovery_documents()
@@ -0,0 +1,121 @@
+"""
+Circuit breakers for Google APIs.
+
+A breaker trips open after ``GOOGLE_CIRCUIT_FAILURES`` consecutive failed
+calls. Server errors, transport errors, upstream rate limiting, and calls
+slower than ``GOOGLE_CIRCUIT_LATENCY_SLO`` seconds all count as failures.
+While open, calls fail immediately instead of tying up a worker for the full
+HTTP timeout, and the service classes fall back to their local mirrors.
+After ``GOOGLE_CIRCUIT_RESET_TIMEOUT`` seconds a single probe call is let
+through (half-open). Success closes the breaker; failure opens it again.
+
+Google's per-user rate limit (``userRateLimitExceeded``) says nothing about
+the upstream's health. It only counts against that user's own breaker
+(``get_user_breaker``), so one busy user cannot cut everyone else off.
+"""
+import json
+import logging
+import threading
+import time
+
+import httplib2
+from django.conf import settings
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(HttpError):
+    """Raised instead of calling an API whose breaker is open; looks like a 503."""
+
+    def __init__(self, name, retry_after):
+        resp = httplib2.Response({'status': 503, 'retry-after': str(int(retry_after) + 1)})
+        content = json.dumps({'error': {'code': 503, 'message': f'Circuit open for {name}'}})
+        super().__init__(resp, content.encode())
+
+
+class CircuitBreaker:
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go ahead now"""
+        reset_timeout = getattr(settings, 'GOOGLE_CIRCUIT_RESET_TIMEOUT', 30)
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            waited = time.monotonic() - self.opened_at
+            if self.state == OPEN and waited >= reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                logger.info("Circuit %s half-open; sending a probe request", self.name)
+                return
+            raise CircuitOpenError(self.name, max(0.0, reset_timeout - waited))
+
+    def record(self, failed):
+        """Record the outcome of a call allowed by before_call"""
+        threshold = getattr(settings, 'GOOGLE_CIRCUIT_FAILURES', 5)
+        with self._lock:
+            was_probe = self._probing
+            self._probing = False
+            if not failed:
+                if self.state != CLOSED:
+                    logger.info("Circuit %s closed", self.name)
+                self.state = CLOSED
+                self.failures = 0
+                return
+            self.failures += 1
+            if was_probe or self.failures >= threshold:
+                if self.state != OPEN:
+                    logger.warning("Circuit %s open after %d failures", self.name, self.failures)
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def cancel(self):
+        """Give up a call allowed by before_call without recording an outcome"""
+        with self._lock:
+            self._probing = False
+
+    def is_open(self):
+        with self._lock:
+            return self.state != CLOSED
+
+
+def get_breaker(api, user_id=None):
+    """Return the breaker for an API, scoped per user when GOOGLE_CIRCUIT_PER_USER is set"""
+    return _get((api, user_id if getattr(settings, 'GOOGLE_CIRCUIT_PER_USER', False) else None))
+
+
+def get_user_breaker(api, user_id):
+    """Return the breaker tracking one user's own rate limits for an API"""
+    return _get((api, user_id))
+
+
+def _get(key):
+    api, user_id = key
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _breakers_lock:
+            name = api if user_id is None else f'{api}:{user_id}'
+            breaker = _breakers.setdefault(key, CircuitBreaker(name))
+    return breaker
+
+
+def is_degraded(api, user_id=None):
+    """True while calls to ``api`` are being short-circuited, so data served is stale"""
+    if get_breaker(api, user_id).is_open():
+        return True
+    return user_id is not None and get_user_breaker(api, user_id).is_open()
@@ -0,0 +1,131 @@
+"""
+Loaders and serializers for the goals, achievements, time tracking and
+habits sections, shared by their own endpoints and /api/dashboard/.
+
+Each loader runs a single query however much data the user has. Habit
+streaks are read from the counters stored on Habit, and time tracking
+aggregates are computed in Python from rows that are loaded anyway.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Achievement, Goal, Habit, TimeTracking
+
+
+def serialize_goal(goal):
+    return {
+        'id': goal.id,
+        'title': goal.title,
+        'description': goal.description,
+        'target_value': float(goal.target_value),
+        'current_value': float(goal.current_value),
+        'unit': goal.unit,
+        'status': goal.status,
+        'category': goal.category,
+        'deadline': goal.deadline.isoformat() if goal.deadline else None,
+        'progress_percentage': float(goal.progress_percentage),
+        'is_overdue': goal.is_overdue,
+        'created_at': goal.created_at.isoformat(),
+        'updated_at': goal.updated_at.isoformat(),
+    }
+
+
+def serialize_achievement(achievement):
+    return {
+        'id': achievement.id,
+        'title': achievement.title,
+        'description': achievement.description,
+        'icon': achievement.icon,
+        'unlocked_at': achievement.unlocked_at.isoformat(),
+    }
+
+
+def serialize_time_entry(entry):
+    return {
+        'id': entry.id,
+        'activity_type': entry.activity_type,
+        'description': entry.description,
+        'start_time': entry.start_time.isoformat(),
+        'end_time': entry.end_time.isoformat() if entry.end_time else None,
+        'duration_minutes': entry.duration_minutes,
+        'created_at': entry.created_at.isoformat(),
+    }
+
+
+def serialize_habit(habit, today=None):
+    today = today or timezone.now().date()
+    return {
+        'id': habit.id,
+        'name': habit.name,
+        'description': habit.description,
+        'frequency': habit.frequency,
+        'target_count': habit.target_count,
+        'color': habit.color,
+        'icon': habit.icon,
+        'is_active': habit.is_active,
+        'current_streak': habit.streak_as_of(today),
+        'longest_streak': habit.longest_streak,
+        'last_completed_date': habit.last_completed_date.isoformat() if habit.last_completed_date else None,
+        'total_completions': habit.total_completions,
+        'created_at': habit.created_at.isoformat(),
+    }
+
+
+def load_goals(user):
+    return [serialize_goal(goal) for goal in Goal.objects.filter(user=user)]
+
+
+def load_achievements(user):
+    return [serialize_achievement(achievement) for achievement in Achievement.objects.filter(user=user)]
+
+
+def load_time_tracking(user, days=30):
+    """Entries from the last ``days`` days with their analytics"""
+    start_date = timezone.now() - timedelta(days=days)
+    entries = list(TimeTracking.objects.filter(user=user, start_time__gte=start_date).order_by('-start_time'))
+
+    total_minutes = 0
+    daily = defaultdict(int)
+    activity_data = defaultdict(int)
+    for entry in entries:
+        minutes = entry.duration_minutes or 0
+        total_minutes += minutes
+        # Same day boundaries as the database's start_time__date
+        daily[timezone.localtime(entry.start_time).date()] += minutes
+        activity_data[entry.activity_type] += minutes
+
+    # Weekly averages
+    weeks = days // 7 if days >= 7 else 1
+    avg_daily_minutes = total_minutes / days if days > 0 else 0
+    avg_weekly_hours = (total_minutes / weeks) / 60 if weeks > 0 else 0
+
+    return {
+        'entries': [serialize_time_entry(entry) for entry in entries],
+        'analytics': {
+            'total_minutes': total_minutes,
+            'total_hours': round(total_minutes / 60, 2),
+            'avg_daily_minutes': round(avg_daily_minutes, 2),
+            'avg_weekly_hours': round(avg_weekly_hours, 2),
+            'daily_breakdown': [
+                {'date': day.isoformat(), 'total_minutes': minutes}
+                for day, minutes in sorted(daily.items())
+            ],
+            'activity_breakdown': dict(activity_data),
+        },
+    }
+
+
+def load_habits(user):
+    today = timezone.now().date()
+    return [serialize_habit(habit, today) for habit in Habit.objects.filter(user=user)]
+
+
+# section name -> loader(user, days)
+SECTIONS = {
+    'goals': lambda user, days: load_goals(user),
+    'achievements': lambda user, days: load_achievements(user),
+    'time_tracking': load_time_tracking,
+    'habits': lambda user, days: load_habits(user),
+}
@@ -0,0 +1,25 @@
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+
+
+def async_login_required(view):
+    """
+    ``login_required`` for async views.
+
+    Django 5.0's decorator checks ``request.user`` synchronously, which would
+    hit the database from the event loop. This resolves the user with
+    ``request.auser()`` once and stores it back on the request so the view
+    (and anything it hands the request to) can use ``request.user`` freely.
+    """
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), settings.LOGIN_URL)
+        request.user = user
+        return await view(request, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,213 @@
+"""
+Per-user change events for the live dashboard stream (/api/stream/).
+
+Views, push receivers and syncs call ``publish`` whenever a user's data
+changes. Each open tab listens over server-sent events and refetches only
+the section an event names, instead of polling every endpoint.
+
+Every event gets an ID of the form ``<epoch>-<n>``, with ``n`` counting per
+user. A reconnecting browser sends the last ID it saw as Last-Event-ID, and
+the events it missed are replayed from a short per-user buffer. When they
+can no longer be replayed (buffer overflow, a server restart, or a client
+too slow to keep up), the listener gets a single ``resync`` event and
+refetches everything.
+
+The default ``InProcessBroker`` only reaches listeners in the same process.
+Deployments with several web processes, or with ``sync_google`` running
+separately, point ``EVENT_BROKER`` at a class backed by an external
+broker. That class must provide the same ``publish``, ``listen`` and
+``listen_sync`` methods.
+"""
+import asyncio
+import json
+import logging
+import queue
+import threading
+import uuid
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+RESYNC = 'resync'
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class _Subscriber:
+    """One open stream; events may be delivered to it from any thread"""
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        maxsize = getattr(settings, 'SSE_QUEUE_SIZE', 100)
+        self.queue = asyncio.Queue(maxsize) if loop else queue.Queue(maxsize)
+        self.overflowed = False
+
+    def deliver(self, event):
+        if self.loop:
+            try:
+                self.loop.call_soon_threadsafe(self._put, event)
+            except RuntimeError:
+                # The stream's event loop has already shut down
+                pass
+        else:
+            self._put(event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except (asyncio.QueueFull, queue.Full):
+            self.overflowed = True
+
+    def clear_overflow(self):
+        """Drop queued events after an overflow; the listener resyncs instead"""
+        self.overflowed = False
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # IDs from a previous process can never be resumed against this one
+        self._epoch = uuid.uuid4().hex[:8]
+        self._counters = defaultdict(int)
+        self._history = defaultdict(lambda: deque(maxlen=getattr(settings, 'SSE_REPLAY_BUFFER', 200)))
+        self._subscribers = defaultdict(set)
+
+    def publish(self, user_id, event_type, data):
+        with self._lock:
+            self._counters[user_id] += 1
+            event = {
+                'id': f'{self._epoch}-{self._counters[user_id]}',
+                'type': event_type,
+                'data': data,
+            }
+            self._history[user_id].append(event)
+            subscribers = list(self._subscribers.get(user_id, ()))
+
+        for subscriber in subscribers:
+            subscriber.deliver(event)
+        return event
+
+    async def listen(self, user_id, last_event_id=None, heartbeat=15):
+        """
+        Yield the user's events as they are published, starting with any
+        missed since ``last_event_id``. Yields None after ``heartbeat``
+        seconds without an event so the caller can keep the connection alive.
+        """
+        subscriber, backlog = self._subscribe(user_id, last_event_id, asyncio.get_running_loop())
+        try:
+            for event in backlog:
+                yield event
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield self._resync(user_id, subscriber) if subscriber.overflowed else event
+        finally:
+            self._unsubscribe(user_id, subscriber)
+
+    def listen_sync(self, user_id, last_event_id=None, heartbeat=15):
+        """Blocking version of ``listen`` for streams served over WSGI"""
+        subscriber, backlog = self._subscribe(user_id, last_event_id)
+        try:
+            yield from backlog
+            while True:
+                try:
+                    event = subscriber.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield None
+                    continue
+                yield self._resync(user_id, subscriber) if subscriber.overflowed else event
+        finally:
+            self._unsubscribe(user_id, subscriber)
+
+    def _resync(self, user_id, subscriber):
+        with self._lock:
+            subscriber.clear_overflow()
+            return self._resync_event(user_id)
+
+    def _resync_event(self, user_id):
+        return {'id': f'{self._epoch}-{self._counters.get(user_id, 0)}', 'type': RESYNC, 'data': {}}
+
+    def _subscribe(self, user_id, last_event_id, loop=None):
+        subscriber = _Subscriber(loop)
+        # Register and snapshot the backlog together so nothing published in
+        # between is either lost or delivered twice
+        with self._lock:
+            self._subscribers[user_id].add(subscriber)
+            backlog = self._backlog(user_id, last_event_id)
+        return subscriber, backlog
+
+    def _unsubscribe(self, user_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def _backlog(self, user_id, last_event_id):
+        """Events after ``last_event_id``, or a lone resync event if they are gone"""
+        if not last_event_id:
+            return []
+
+        history = self._history.get(user_id) or deque()
+        latest = self._counters.get(user_id, 0)
+        epoch, _, number = last_event_id.partition('-')
+        try:
+            number = int(number)
+        except ValueError:
+            number = None
+
+        oldest = history[0]['id'].rsplit('-', 1)[1] if history else None
+        if epoch != self._epoch or number is None or number > latest or (
+            number < latest and (oldest is None or int(oldest) > number + 1)
+        ):
+            return [self._resync_event(user_id)]
+        return [event for event in history if int(event['id'].rsplit('-', 1)[1]) > number]
+
+
+def format_sse(event):
+    """Encode one event, or a heartbeat for None, in the text/event-stream format"""
+    if event is None:
+        return ': keepalive\n\n'
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def get_broker():
+    """Return the process-wide broker configured by ``EVENT_BROKER``"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = import_string(getattr(settings, 'EVENT_BROKER', 'Core.events.InProcessBroker'))
+                _broker = broker_class()
+    return _broker
+
+
+def publish(user_id, section, action='changed', object_id=None, origin=None, **extra):
+    """
+    Tell the user's open tabs that ``section`` changed.
+
+    ``origin`` is the X-Client-Id of the tab that caused the change, so it
+    can skip refetching data it already has. Publishing never raises; a
+    lost event only delays an update until the next refetch.
+    """
+    data = {'action': action, 'at': timezone.now().isoformat(), **extra}
+    if object_id is not None:
+        data['object_id'] = object_id
+    if origin:
+        data['origin'] = origin
+    try:
+        return get_broker().publish(user_id, section, data)
+    except Exception as e:
+        logger.error(f"Failed to publish {section} event for user {user_id}: {e}", exc_info=True)
+        return None
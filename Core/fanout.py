@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import wraps
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def get_executor(pool='google') -> ThreadPoolExecutor:
+    """
+    Return a process-wide worker pool used for Google fetches.
+
+    Each pool is bounded by its entry in ``GOOGLE_FETCH_POOL_SIZES`` (falling
+    back to ``GOOGLE_FETCH_MAX_WORKERS``) so a burst of page loads cannot
+    spawn an unbounded number of threads; work that does not fit simply
+    queues until a worker frees up. Each kind of work gets its own pool:
+    Home fan-out never queues behind API reads or background refreshes, and
+    work that itself fans out (such as syncing several calendars from inside
+    a Home fetch) never waits on a slot held by its own caller.
+    """
+    executor = _executors.get(pool)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(pool)
+            if executor is None:
+                sizes = getattr(settings, 'GOOGLE_FETCH_POOL_SIZES', {})
+                executor = ThreadPoolExecutor(
+                    max_workers=sizes.get(pool, getattr(settings, 'GOOGLE_FETCH_MAX_WORKERS', 8)),
+                    thread_name_prefix=f'{pool}-fetch',
+                )
+                _executors[pool] = executor
+    return executor
+
+
+def _with_db_cleanup(func):
+    """Close stale DB connections around work running on pool threads."""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return wrapper
+
+
+def submit(func, *args, pool='google', **kwargs):
+    """Schedule ``func`` on a shared pool and return its future."""
+    return get_executor(pool).submit(_with_db_cleanup(func), *args, **kwargs)
+
+
+def fetch_all(sources, timeouts=None, budget=None, pool='google'):
+    """
+    Run several independent loaders concurrently and collect what finishes in time.
+
+    ``sources`` maps a section name to a zero-argument callable. Each section
+    gets its own deadline from ``timeouts`` (falling back to
+    ``GOOGLE_FETCH_TIMEOUT``), and no section may outlive the overall ``budget``
+    (``GOOGLE_FETCH_BUDGET``) measured from when the fan-out started.
+
+    Returns ``(results, pending)`` where ``results`` holds the value of every
+    loader that finished, and ``pending`` lists the sections that missed their
+    deadline. Loaders that raise are logged and reported as ``None``.
+    """
+    timeouts = timeouts or {}
+    default_timeout = getattr(settings, 'GOOGLE_FETCH_TIMEOUT', 3.0)
+    if budget is None:
+        budget = getattr(settings, 'GOOGLE_FETCH_BUDGET', 4.0)
+
+    started = time.monotonic()
+    page_deadline = started + budget
+    futures = {name: submit(loader, pool=pool) for name, loader in sources.items()}
+
+    results = {}
+    pending = []
+    # Wait on the tightest deadlines first so a slow source never delays
+    # collecting a faster one that is already done.
+    ordered = sorted(futures, key=lambda name: timeouts.get(name, default_timeout))
+    for name in ordered:
+        deadline = min(started + timeouts.get(name, default_timeout), page_deadline)
+        remaining = max(0.0, deadline - time.monotonic())
+        future = futures[name]
+        try:
+            results[name] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            logger.warning("Google fetch for %s missed its %.2fs deadline", name, remaining)
+            pending.append(name)
+        except Exception as exc:
+            logger.error("Google fetch for %s failed: %s", name, exc, exc_info=True)
+            results[name] = None
+
+    return results, pending
+
+
+async def run_in_pool(func, *args, pool='google', **kwargs):
+    """Await ``func`` running on a shared pool without blocking the event loop."""
+    return await asyncio.wrap_future(submit(func, *args, pool=pool, **kwargs))
+
+
+# Result reported by as_ready for a section that missed its deadline
+MISSED = object()
+
+
+async def as_ready(sources, timeouts=None, budget=None, pool='google'):
+    """
+    Async counterpart of ``fetch_all`` that yields ``(name, result)`` as soon
+    as each loader finishes instead of waiting for the slowest.
+
+    The loaders still run on the shared pool, so the Google client, quota
+    executor and circuit breakers behave exactly as in ``fetch_all``, with
+    the same per-section deadlines and overall budget. A section that misses
+    its deadline is yielded with ``MISSED``; one whose loader raised, with None.
+    Time spent queued for a worker counts against the deadline, and a loader
+    still queued when its deadline passes is dropped rather than run late.
+    """
+    timeouts = timeouts or {}
+    default_timeout = getattr(settings, 'GOOGLE_FETCH_TIMEOUT', 3.0)
+    if budget is None:
+        budget = getattr(settings, 'GOOGLE_FETCH_BUDGET', 4.0)
+
+    async def load(name, loader, timeout):
+        future = submit(loader, pool=pool)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            # Cancelling the wrapper only cancels a future no worker picked up
+            if future.cancelled():
+                logger.warning("Google fetch for %s was still queued on the %s pool at its deadline", name, pool)
+            raise
+
+    timeouts_by_name = {name: min(timeouts.get(name, default_timeout), budget) for name in sources}
+    tasks = {
+        asyncio.ensure_future(load(name, loader, timeouts_by_name[name])): name
+        for name, loader in sources.items()
+    }
+    try:
+        while tasks:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = tasks.pop(task)
+                try:
+                    yield name, task.result()
+                except asyncio.TimeoutError:
+                    logger.warning("Google fetch for %s missed its %.2fs deadline", name, timeouts_by_name[name])
+                    yield name, MISSED
+                except Exception as exc:
+                    logger.error("Google fetch for %s failed: %s", name, exc, exc_info=exc)
+                    yield name, None
+    finally:
+        # The consumer went away early (e.g. the client disconnected)
+        for task in tasks:
+            task.cancel()
+
+
+async def gather_all(sources, timeouts=None, budget=None, pool='google'):
+    """Await every loader under ``as_ready``; returns ``(results, pending)`` like ``fetch_all``."""
+    results = {}
+    pending = []
+    async for name, result in as_ready(sources, timeouts=timeouts, budget=budget, pool=pool):
+        if result is MISSED:
+            pending.append(name)
+        else:
+            results[name] = result
+    return results, pending
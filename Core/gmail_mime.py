@@ -0,0 +1,193 @@
+"""
+Helpers for reading Gmail API message payloads.
+
+Gmail returns a message as a tree of MIME parts whose bodies are
+base64url-encoded strings. These helpers walk that tree to find the most
+readable text part and decode it a chunk at a time, stopping once a byte
+budget is spent, so one oversized message never has to be decoded whole.
+"""
+from datetime import datetime, timezone as dt_timezone
+from email.message import Message
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+import base64
+import binascii
+import codecs
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Base64 characters decoded per step; a multiple of 4 so chunks stay aligned
+DECODE_CHUNK_SIZE = 64 * 1024
+
+# Deeper nesting than this is treated as malformed and not walked further
+MAX_DEPTH = 20
+
+DEFAULT_CHARSET = 'utf-8'
+
+BLOCK_TAGS = {
+    'address', 'article', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'footer',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'ol', 'p', 'pre',
+    'section', 'table', 'tr', 'ul',
+}
+HIDDEN_TAGS = {'head', 'script', 'style', 'template', 'title'}
+
+
+def extract_text(payload, max_bytes=None):
+    """
+    Return the readable text of a message payload.
+
+    The first ``text/plain`` part wins; failing that the first ``text/html``
+    part is converted to plain text. At most ``max_bytes`` bytes of the chosen
+    part are decoded. Malformed encodings and unknown charsets are tolerated,
+    so this never raises on bad input and returns '' when there is no text.
+    """
+    plain, html = _find_text_parts(payload or {})
+    part = plain or html
+    if part is None:
+        return ''
+
+    text = decode_part(part, max_bytes)
+    if part is html:
+        text = html_to_text(text)
+    return text.strip()
+
+
+def decode_part(part, max_bytes=None):
+    """Decode a part's inline body in its declared charset, up to max_bytes bytes"""
+    data = (part.get('body') or {}).get('data') or ''
+    charset = _part_headers(part).get_content_charset() or DEFAULT_CHARSET
+    try:
+        decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+    except LookupError:
+        logger.info(f"Unknown charset {charset!r} in Gmail message part; decoding as {DEFAULT_CHARSET}")
+        decoder = codecs.getincrementaldecoder(DEFAULT_CHARSET)(errors='replace')
+
+    chunks = []
+    remaining = max_bytes
+    for start in range(0, len(data), DECODE_CHUNK_SIZE):
+        chunk = data[start:start + DECODE_CHUNK_SIZE]
+        try:
+            raw = base64.urlsafe_b64decode(chunk + '=' * (-len(chunk) % 4))
+        except (binascii.Error, ValueError):
+            logger.warning("Malformed base64 in Gmail message part; keeping what decoded cleanly")
+            break
+        if remaining is not None:
+            raw = raw[:remaining]
+            remaining -= len(raw)
+        chunks.append(decoder.decode(raw))
+        if remaining is not None and remaining <= 0:
+            # Drop a multi-byte character cut in half by the budget
+            return ''.join(chunks)
+    chunks.append(decoder.decode(b'', final=True))
+    return ''.join(chunks)
+
+
+def html_to_text(html):
+    """Convert an HTML fragment to plain text with line breaks at block elements"""
+    parser = _TextExtractor()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception as e:
+        # HTMLParser is lenient, but keep whatever was extracted before a failure
+        logger.warning(f"Could not fully parse HTML email body: {e}")
+    return parser.get_text()
+
+
+def message_date(message):
+    """
+    Return when Gmail received a message as an aware datetime.
+
+    ``internalDate`` (milliseconds since the epoch) is preferred because
+    Date headers are set by the sender and are often missing or malformed.
+    """
+    internal_date = message.get('internalDate')
+    if internal_date:
+        try:
+            return datetime.fromtimestamp(int(internal_date) / 1000, tz=dt_timezone.utc)
+        except (TypeError, ValueError, OverflowError):
+            pass
+
+    headers = (message.get('payload') or {}).get('headers', [])
+    date_str = next((h['value'] for h in headers if h['name'].lower() == 'date'), '')
+    try:
+        date = parsedate_to_datetime(date_str)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=dt_timezone.utc)
+    return date
+
+
+def _find_text_parts(part, depth=0):
+    """Return the first inline text/plain and text/html parts found depth-first"""
+    if depth > MAX_DEPTH:
+        return None, None
+
+    mime_type = (part.get('mimeType') or '').lower()
+    if mime_type.startswith('multipart/'):
+        plain = html = None
+        for child in part.get('parts') or []:
+            child_plain, child_html = _find_text_parts(child, depth + 1)
+            plain = plain or child_plain
+            html = html or child_html
+            if plain:
+                break
+        return plain, html
+
+    if _is_attachment(part) or not (part.get('body') or {}).get('data'):
+        return None, None
+    if mime_type == 'text/plain':
+        return part, None
+    if mime_type == 'text/html':
+        return None, part
+    return None, None
+
+
+def _is_attachment(part):
+    if part.get('filename'):
+        return True
+    return _part_headers(part).get_content_disposition() == 'attachment'
+
+
+def _part_headers(part):
+    """Load a part's headers into an email.message.Message for parameter parsing"""
+    headers = Message()
+    for header in part.get('headers') or []:
+        if header.get('name', '').lower() in ('content-type', 'content-disposition'):
+            headers[header['name']] = header.get('value', '')
+    return headers
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._pieces = []
+        self._hidden = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HIDDEN_TAGS:
+            self._hidden += 1
+        elif tag in BLOCK_TAGS:
+            self._pieces.append('\n')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._pieces.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in HIDDEN_TAGS:
+            self._hidden = max(0, self._hidden - 1)
+        elif tag in BLOCK_TAGS:
+            self._pieces.append('\n')
+
+    def handle_data(self, data):
+        if not self._hidden:
+            self._pieces.append(data)
+
+    def get_text(self):
+        text = ''.join(self._pieces)
+        lines = (re.sub(r'[ \t\r\f\v\xa0]+', ' ', line).strip() for line in text.split('\n'))
+        return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
@@ -1,14 +1,81 @@
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from django.conf import settings
+from django.utils import timezone
 from googleapiclient.errors import HttpError
-from allauth.socialaccount.models import SocialToken, SocialApp
-import base64
-import email
-from datetime import datetime
+from .events import publish
+from .gmail_mime import extract_text, message_date
+from .google_client import build_google_service
+from .google_quota import METHOD_COSTS, execute_batch, max_batch_calls
+from .models import GmailMessage, GmailSyncState
+from .response_cache import invalidate
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
 import logging
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+# Headers the views actually display; everything else stays on Gmail's side
+METADATA_HEADERS = ['Subject', 'From', 'Date']
+
+# Gmail rejects batches larger than 100 calls and recommends at most 50
+BATCH_SIZE = 50
+
+# Mailbox changes the inbox mirror cares about
+HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+
+
+class EmailBodyCache:
+    """
+    In-process LRU cache of decoded email bodies with a TTL.
+
+    Entries are evicted least-recently-used first once either the entry count
+    (``GMAIL_BODY_CACHE_SIZE``) or the total size in characters
+    (``GMAIL_BODY_CACHE_MAX_CHARS``) is exceeded, and are ignored once older
+    than ``GMAIL_BODY_CACHE_TTL`` seconds.
+    """
+    
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, body = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return body
+    
+    def set(self, key, body):
+        ttl = getattr(settings, 'GMAIL_BODY_CACHE_TTL', 600)
+        max_entries = getattr(settings, 'GMAIL_BODY_CACHE_SIZE', 200)
+        max_chars = getattr(settings, 'GMAIL_BODY_CACHE_MAX_CHARS', 4_000_000)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, body)
+            self._size += len(body)
+            while self._entries and (len(self._entries) > max_entries or self._size > max_chars):
+                self._remove(next(iter(self._entries)))
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+    
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+
+_body_cache = EmailBodyCache()
+
 
 class GmailService:
     def __init__(self, user):
@@ -17,88 +84,307 @@ class GmailService:
     
     def _build_service(self):
         """Build Gmail service using stored OAuth tokens"""
-        try:
-            # Get the social token from allauth - try different approaches
-            social_token = None
-            
-            # Try to get token by provider name
-            try:
-                social_token = SocialToken.objects.get(
-                    account__user=self.user,
-                    account__provider='google'
-                )
-            except SocialToken.DoesNotExist:
-                # Try to get token by provider ID (numeric)
-                social_token = SocialToken.objects.filter(
-                    account__user=self.user
-                ).first()
-            
-            if not social_token:
-                logger.warning(f"No social token found for user {self.user.email}")
-                return None
-            
-            # Get the Google app credentials
-            try:
-                google_app = SocialApp.objects.get(provider='google')
-            except SocialApp.DoesNotExist:
-                # Try to get by ID if provider name doesn't work
-                google_app = SocialApp.objects.first()
-            
-            if not google_app:
-                logger.error("No Google app configured in Django admin")
-                return None
-            
-            # Create credentials object
-            creds = Credentials(
-                token=social_token.token,
-                refresh_token=social_token.token_secret,
-                token_uri='https://oauth2.googleapis.com/token',
-                client_id=google_app.client_id,
-                client_secret=google_app.secret,
-            )
-            
-            logger.info(f"Building Gmail service for user {self.user.email}")
-            
-            # Build and return Gmail service
-            return build('gmail', 'v1', credentials=creds)
-            
-        except Exception as e:
-            logger.error(f"Error building Gmail service: {e}", exc_info=True)
-            return None
+        logger.info(f"Building Gmail service for user {self.user.email}")
+        return build_google_service(self.user, 'gmail', 'v1')
     
     def get_emails(self, max_results=10):
-        """Fetch recent emails"""
+        """
+        Return recent inbox emails from the local mirror.
+
+        The mirror is synced first if it is older than ``GMAIL_SYNC_INTERVAL``,
+        which usually costs a single ``history.list`` call, then read back with
+        one indexed query. Only metadata and Gmail's snippet are returned;
+        use ``get_email_body`` for the full text of a single message.
+        """
         if not self.service:
             return []
         
         try:
-            # Get list of messages
+            self.sync_if_stale()
+        except HttpError as error:
+            # Serve whatever the mirror already holds
+            logger.error(f"Gmail sync error: {error}", exc_info=True)
+        
+        rows = GmailMessage.objects.filter(user=self.user).order_by('-date')[:max_results]
+        return [self._row_to_email(row) for row in rows]
+    
+    def _row_to_email(self, row):
+        """Format a mirrored message like _extract_email_data does"""
+        return {
+            'id': row.message_id,
+            'subject': row.subject,
+            'sender': row.sender,
+            'date': row.date,
+            'snippet': row.snippet,
+        }
+    
+    def get_email_body(self, message_id):
+        """
+        Return the plain-text body of one message, fetching it on first use.
+
+        At most ``GMAIL_BODY_MAX_BYTES`` of the body are decoded, and the
+        result is kept in a shared LRU cache so reopening a message does not
+        hit Gmail again. Returns None if Gmail has no such message.
+        """
+        key = (self.user.pk, message_id)
+        body = _body_cache.get(key)
+        if body is not None:
+            return body
+        
+        try:
+            message = self.service.users().messages().get(userId='me', id=message_id, format='full').execute()
+        except HttpError as error:
+            if error.resp.status in (400, 404):
+                return None
+            raise
+        
+        body = self._extract_body(message.get('payload', {}))
+        _body_cache.set(key, body)
+        return body
+    
+    def sync_if_stale(self):
+        """
+        Sync the mirror unless it was synced within GMAIL_SYNC_INTERVAL seconds.
+
+        While a Gmail watch is active, push notifications mark the mirror
+        dirty when the inbox changes, so it is only re-checked every
+        GOOGLE_PUSH_SAFETY_INTERVAL seconds in case one was lost.
+        """
+        state, _ = GmailSyncState.objects.get_or_create(user=self.user)
+        if state.push_active:
+            interval = timedelta(seconds=getattr(settings, 'GOOGLE_PUSH_SAFETY_INTERVAL', 3600))
+        else:
+            interval = timedelta(seconds=getattr(settings, 'GMAIL_SYNC_INTERVAL', 60))
+        if state.last_synced_at and timezone.now() - state.last_synced_at < interval:
+            return state
+        return self.sync(state)
+    
+    def watch(self, topic_name):
+        """Start or renew push notifications for inbox changes to a Pub/Sub topic"""
+        response = self.service.users().watch(
+            userId='me',
+            body={'topicName': topic_name, 'labelIds': ['INBOX'], 'labelFilterBehavior': 'include'},
+        ).execute()
+        
+        state, _ = GmailSyncState.objects.get_or_create(user=self.user)
+        if not state.email_address:
+            profile = self.service.users().getProfile(userId='me').execute()
+            state.email_address = profile['emailAddress']
+        state.watch_expires_at = datetime.fromtimestamp(int(response['expiration']) / 1000, tz=dt_timezone.utc)
+        state.save(update_fields=['email_address', 'watch_expires_at'])
+        return state
+    
+    def sync(self, state=None):
+        """
+        Bring the local inbox mirror up to date.
+
+        Changes since the stored historyId are applied from ``history.list``.
+        Gmail only keeps history for a limited time, so an expired historyId
+        (HTTP 404) or a first sync falls back to a full resync.
+        """
+        if state is None:
+            state, _ = GmailSyncState.objects.get_or_create(user=self.user)
+        
+        if state.history_id:
+            try:
+                self._sync_history(state)
+                return state
+            except HttpError as error:
+                if error.resp.status != 404:
+                    raise
+                logger.info(f"Gmail history {state.history_id} expired for {self.user.email}; resyncing")
+        
+        self._sync_full(state)
+        return state
+    
+    def _sync_full(self, state):
+        """Replace the mirror with the newest inbox messages"""
+        # Read the history position first so nothing that changes while we
+        # list the inbox is skipped by the next incremental sync.
+        profile = self.service.users().getProfile(userId='me').execute()
+        mirror_size = getattr(settings, 'GMAIL_MIRROR_SIZE', 100)
+        
+        message_ids = []
+        page_token = None
+        while len(message_ids) < mirror_size:
             results = self.service.users().messages().list(
                 userId='me',
-                maxResults=max_results,
-                q='in:inbox'
+                labelIds=['INBOX'],
+                maxResults=min(500, mirror_size - len(message_ids)),
+                pageToken=page_token
+            ).execute()
+            message_ids.extend(message['id'] for message in results.get('messages', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+        
+        failed = self._store_messages(message_ids)
+        GmailMessage.objects.filter(user=self.user).exclude(message_id__in=message_ids).delete()
+        
+        now = timezone.now()
+        # Without a history position the next sync is another full one, which
+        # picks up the messages that could not be fetched this time
+        state.history_id = '' if failed else str(profile['historyId'])
+        state.email_address = profile.get('emailAddress', state.email_address)
+        state.last_synced_at = now
+        state.last_full_sync_at = now
+        state.save()
+        logger.info(f"Full Gmail sync stored {len(message_ids)} messages for {self.user.email}")
+        invalidate('emails', self.user.pk)
+        publish(self.user.pk, 'emails', 'synced')
+    
+    def _sync_history(self, state):
+        """Apply adds, deletes and label changes recorded since state.history_id"""
+        latest_labels = {}
+        deleted = set()
+        page_token = None
+        
+        while True:
+            response = self.service.users().history().list(
+                userId='me',
+                startHistoryId=state.history_id,
+                historyTypes=HISTORY_TYPES,
+                pageToken=page_token
             ).execute()
             
-            messages = results.get('messages', [])
-            emails = []
-            
-            for message in messages:
-                # Get full message details
-                msg = self.service.users().messages().get(
-                    userId='me',
-                    id=message['id']
-                ).execute()
-                
-                # Extract email data
-                email_data = self._extract_email_data(msg)
-                if email_data:
-                    emails.append(email_data)
-            
-            return emails
+            # Records are in chronological order, so the last label set seen
+            # for a message is its current one.
+            for record in response.get('history', []):
+                for key in ('messagesAdded', 'labelsAdded', 'labelsRemoved'):
+                    for change in record.get(key, []):
+                        message = change['message']
+                        if message['id'] not in deleted:
+                            latest_labels[message['id']] = message.get('labelIds', [])
+                for change in record.get('messagesDeleted', []):
+                    deleted.add(change['message']['id'])
+                    latest_labels.pop(change['message']['id'], None)
             
-        except HttpError as error:
-            logger.error(f"Gmail API error: {error}", exc_info=True)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        
+        in_inbox = {message_id for message_id, labels in latest_labels.items() if 'INBOX' in labels}
+        deleted.update(set(latest_labels) - in_inbox)
+        
+        existing = {
+            row.message_id: row
+            for row in GmailMessage.objects.filter(user=self.user, message_id__in=in_inbox)
+        }
+        for message_id, row in existing.items():
+            row.label_ids = latest_labels[message_id]
+        GmailMessage.objects.bulk_update(existing.values(), ['label_ids'])
+        
+        added = [message_id for message_id in in_inbox if message_id not in existing]
+        failed = self._store_messages(added)
+        if deleted:
+            GmailMessage.objects.filter(user=self.user, message_id__in=deleted).delete()
+        self._trim_mirror()
+        
+        # Replaying the same history next time is harmless, so only move past
+        # it once every added message is in the mirror
+        if failed:
+            logger.warning(
+                f"Could not fetch {len(failed)} new Gmail message(s) for {self.user.email}; "
+                f"keeping history {state.history_id} to retry"
+            )
+        else:
+            state.history_id = str(response['historyId'])
+        state.last_synced_at = timezone.now()
+        state.save()
+        
+        # Tabs refetch as soon as the event arrives; drop cached responses first
+        if added or existing or deleted:
+            invalidate('emails', self.user.pk)
+        if added:
+            publish(self.user.pk, 'emails', 'new', count=len(added))
+        elif existing or deleted:
+            publish(self.user.pk, 'emails', 'changed')
+    
+    def _store_messages(self, message_ids):
+        """
+        Fetch metadata for the given messages and upsert them into the mirror.
+        
+        Returns the IDs that could not be fetched, even after a retry.
+        """
+        if not message_ids:
             return []
+        
+        messages, failed = self._get_messages_batched(message_ids)
+        if failed:
+            retried, failed = self._get_messages_batched(failed)
+            messages.update(retried)
+        rows = []
+        for message_id, msg in messages.items():
+            if 'INBOX' not in msg.get('labelIds', []):
+                continue
+            email_data = self._extract_email_data(msg)
+            if not email_data:
+                continue
+            rows.append(GmailMessage(
+                user=self.user,
+                message_id=message_id,
+                thread_id=msg.get('threadId', ''),
+                subject=email_data['subject'][:1000],
+                sender=email_data['sender'][:500],
+                snippet=email_data['snippet'],
+                date=email_data['date'],
+                label_ids=msg.get('labelIds', []),
+            ))
+        
+        GmailMessage.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['user', 'message_id'],
+            update_fields=['thread_id', 'subject', 'sender', 'snippet', 'date', 'label_ids', 'synced_at'],
+        )
+        return failed
+    
+    def _trim_mirror(self):
+        """Keep only the newest GMAIL_MIRROR_SIZE messages"""
+        mirror_size = getattr(settings, 'GMAIL_MIRROR_SIZE', 100)
+        overflow = list(
+            GmailMessage.objects.filter(user=self.user)
+            .order_by('-date')
+            .values_list('pk', flat=True)[mirror_size:]
+        )
+        if overflow:
+            GmailMessage.objects.filter(pk__in=overflow).delete()
+    
+    def _get_messages_batched(self, message_ids):
+        """
+        Fetch metadata for several messages in as few HTTP round trips as possible.
+        
+        Returns ``(messages, failed)``. Messages deleted since they were listed
+        are simply left out; any other per-message error lands in ``failed``.
+        """
+        messages = {}
+        failed = []
+        
+        def handle_response(request_id, response, exception):
+            if exception is not None:
+                if isinstance(exception, HttpError) and exception.resp.status == 404:
+                    return
+                logger.warning(f"Error fetching Gmail message {request_id}: {exception}")
+                failed.append(request_id)
+                return
+            messages[request_id] = response
+        
+        batch_size = max_batch_calls('gmail', METHOD_COSTS['gmail.users.messages.get'], BATCH_SIZE)
+        for start in range(0, len(message_ids), batch_size):
+            batch = self.service.new_batch_http_request(callback=handle_response)
+            requests = []
+            for message_id in message_ids[start:start + batch_size]:
+                request = self.service.users().messages().get(
+                    userId='me',
+                    id=message_id,
+                    format='metadata',
+                    metadataHeaders=METADATA_HEADERS,
+                )
+                batch.add(request, request_id=message_id)
+                requests.append(request)
+            execute_batch(batch, requests)
+        
+        return messages, failed
     
     def _extract_email_data(self, message):
         """Extract relevant data from Gmail message"""
@@ -109,23 +395,12 @@ class GmailService:
             # Extract headers
             subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
             sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown Sender')
-            date_str = next((h['value'] for h in headers if h['name'] == 'Date'), '')
-            
-            # Parse date
-            try:
-                date = datetime.strptime(date_str.split(' (')[0], '%a, %d %b %Y %H:%M:%S %z')
-            except:
-                date = datetime.now()
-            
-            # Extract body
-            body = self._extract_body(payload)
             
             return {
                 'id': message['id'],
                 'subject': subject,
                 'sender': sender,
-                'date': date,
-                'body': body[:200] + '...' if len(body) > 200 else body,
+                'date': message_date(message) or timezone.now(),
                 'snippet': message.get('snippet', ''),
             }
             
@@ -134,20 +409,8 @@ class GmailService:
             return None
     
     def _extract_body(self, payload):
-        """Extract email body from payload"""
-        body = ""
-        
-        if 'parts' in payload:
-            for part in payload['parts']:
-                if part['mimeType'] == 'text/plain':
-                    data = part['body']['data']
-                    body = base64.urlsafe_b64decode(data).decode('utf-8')
-                    break
-        elif payload['mimeType'] == 'text/plain':
-            data = payload['body']['data']
-            body = base64.urlsafe_b64decode(data).decode('utf-8')
-        
-        return body
+        """Extract the readable text of a message, decoding at most GMAIL_BODY_MAX_BYTES"""
+        return extract_text(payload, max_bytes=getattr(settings, 'GMAIL_BODY_MAX_BYTES', 256 * 1024))
     
     def get_labels(self):
         """Get Gmail labels"""
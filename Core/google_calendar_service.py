@@ -1,13 +1,31 @@
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from googleapiclient.errors import HttpError
-from allauth.socialaccount.models import SocialToken, SocialApp
-from datetime import datetime, timedelta
+from .events import publish
+from .fanout import fetch_all
+from .google_client import build_google_service
+from .models import CalendarEvent, CalendarSyncState
+from .response_cache import invalidate
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import partial
+from itertools import islice
+import heapq
 import logging
+import secrets
+import uuid
 
 logger = logging.getLogger(__name__)
 
 
+class UnknownCalendarError(Exception):
+    """A calendar ID that is not in the user's calendar list"""
+    
+    def __init__(self, calendar_id):
+        super().__init__(f"Calendar {calendar_id} not found")
+        self.calendar_id = calendar_id
+
+
 class GoogleCalendarService:
     def __init__(self, user):
         self.user = user
@@ -15,51 +33,8 @@ class GoogleCalendarService:
     
     def _build_service(self):
         """Build Google Calendar service using stored OAuth tokens"""
-        try:
-            # Get the social token from allauth - try different approaches
-            social_token = None
-            
-            # Try to get token by provider name
-            try:
-                social_token = SocialToken.objects.get(
-                    account__user=self.user,
-                    account__provider='google'
-                )
-            except SocialToken.DoesNotExist:
-                # Try to get token by provider ID (numeric) - fallback
-                social_token = SocialToken.objects.filter(
-                    account__user=self.user
-                ).first()
-            
-            if not social_token:
-                logger.warning(f"No social token found for user {self.user.email}")
-                return None
-            
-            # Get the Google app credentials
-            try:
-                google_app = SocialApp.objects.get(provider='google')
-            except SocialApp.DoesNotExist:
-                # Try to get by ID if provider name doesn't work
-                google_app = SocialApp.objects.first()
-            
-            if not google_app:
-                logger.error("No Google app configured in Django admin")
-                return None
-            
-            creds = Credentials(
-                token=social_token.token,
-                refresh_token=social_token.token_secret,
-                token_uri='https://oauth2.googleapis.com/token',
-                client_id=google_app.client_id,
-                client_secret=google_app.secret,
-            )
-            
-            logger.info(f"Building Google Calendar service for user {self.user.email}")
-            return build('calendar', 'v3', credentials=creds)
-            
-        except Exception as e:
-            logger.error(f"Error building Google Calendar service: {e}", exc_info=True)
-            return None
+        logger.info(f"Building Google Calendar service for user {self.user.email}")
+        return build_google_service(self.user, 'calendar', 'v3')
     
     def get_calendars(self):
         """Get all calendars"""
@@ -67,81 +42,427 @@ class GoogleCalendarService:
             return []
         
         try:
-            results = self.service.calendarList().list().execute()
-            return results.get('items', [])
+            return list(self._iter_calendar_list())
         except HttpError as error:
             logger.error(f"Error getting calendars: {error}", exc_info=True)
             return []
     
-    def get_upcoming_events(self, max_results=10, days_ahead=7):
-        """Get upcoming events from primary calendar"""
+    def _iter_calendar_list(self):
+        """Yield every calendarList entry, page by page"""
+        page_token = None
+        while True:
+            results = self.service.calendarList().list(pageToken=page_token).execute()
+            yield from results.get('items', [])
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return
+    
+    def get_upcoming_events(self, max_results=10, days_ahead=7, calendar_id=None):
+        """Get upcoming events from one calendar, or all selected calendars"""
+        now = timezone.now()
+        return self.get_events_in_range(
+            now,
+            now + timedelta(days=days_ahead),
+            max_results=max_results,
+            calendar_id=calendar_id,
+        )
+    
+    def get_events_for_date(self, date, calendar_id=None):
+        """Get events for a specific date"""
+        start_of_day = datetime.combine(date, datetime.min.time(), tzinfo=dt_timezone.utc)
+        return self.get_events_in_range(start_of_day, start_of_day + timedelta(days=1), calendar_id=calendar_id)
+    
+    def get_events_in_range(self, start, end, max_results=None, calendar_id=None):
+        """
+        Return events overlapping [start, end) from the local event table.
+
+        With no ``calendar_id`` this aggregates every calendar the user has
+        selected: stale calendars are synced concurrently, then each
+        calendar's events are read in start order and combined with a lazy
+        k-way heap merge that stops once ``max_results`` events are produced.
+
+        The mirror keeps CALENDAR_SYNC_PAST_DAYS back to
+        CALENDAR_SYNC_FUTURE_DAYS ahead; a range reaching outside that window
+        is read live from Google instead.
+        """
         if not self.service:
             return []
         
+        calendars = self._get_calendars_to_read(calendar_id)
+        window_start, window_end = self._mirror_window()
+        if start < window_start or end > window_end:
+            streams = [self._iter_live_events(state, start, end, max_results) for state in calendars]
+        else:
+            self._sync_calendars(calendars)
+            streams = [self._iter_stored_events(state, start, end, max_results) for state in calendars]
+        merged = heapq.merge(*streams, key=lambda pair: pair[0].start)
+        if max_results:
+            merged = islice(merged, max_results)
+        
+        return [self._format_event(event, state) for event, state in merged]
+    
+    def sync_all(self, force=False, lead=1.0):
+        """
+        Sync every selected calendar (only stale ones unless ``force``), one after another.
+
+        ``lead`` scales the staleness interval, so the sync worker can refresh
+        a calendar shortly before readers would find it stale.
+        """
+        for state in self._get_calendars_to_read():
+            if force or self._is_stale(state, lead):
+                self.sync(state.calendar_id, state)
+    
+    def _iter_stored_events(self, state, start, end, limit=None):
+        """Yield (event, calendar state) pairs for one calendar in start order"""
+        events = CalendarEvent.objects.filter(
+            user=self.user,
+            calendar_id=state.calendar_id,
+            start__lt=end,
+            end__gt=start,
+        ).order_by('start')
+        if limit:
+            events = events[:limit]
+        for event in events.iterator():
+            yield event, state
+    
+    def _iter_live_events(self, state, start, end, limit=None):
+        """Yield (event, calendar state) pairs for one calendar straight from events.list"""
+        page_token = None
+        produced = 0
+        while True:
+            try:
+                response = self.service.events().list(
+                    calendarId=state.calendar_id,
+                    timeMin=start.isoformat(),
+                    timeMax=end.isoformat(),
+                    singleEvents=True,
+                    orderBy='startTime',
+                    maxResults=min(limit or 2500, 2500),
+                    pageToken=page_token,
+                ).execute()
+            except HttpError as error:
+                logger.error(f"Error listing events for calendar {state.calendar_id}: {error}", exc_info=True)
+                return
+            for event in response.get('items', []):
+                row = self._event_to_row(state.calendar_id, event)
+                if row is None:
+                    continue
+                yield row, state
+                produced += 1
+                if limit and produced >= limit:
+                    return
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return
+    
+    def _mirror_window(self):
+        """The time range the event table covers"""
+        now = timezone.now()
+        return (
+            now - timedelta(days=getattr(settings, 'CALENDAR_SYNC_PAST_DAYS', 30)),
+            now + timedelta(days=getattr(settings, 'CALENDAR_SYNC_FUTURE_DAYS', 180)),
+        )
+    
+    def _get_calendars_to_read(self, calendar_id=None):
+        """Return sync states for the requested calendar, or for every selected one"""
+        if calendar_id:
+            return [self._get_calendar_state(calendar_id)]
+        
+        states = list(CalendarSyncState.objects.filter(user=self.user))
+        if not any(state.summary for state in states) or any(self._full_sync_due(state) for state in states):
+            try:
+                states = self._discover_calendars()
+            except HttpError as error:
+                logger.error(f"Error listing calendars: {error}", exc_info=True)
+        
+        selected = [state for state in states if state.selected]
+        if not selected:
+            state, _ = CalendarSyncState.objects.get_or_create(user=self.user, calendar_id='primary')
+            selected = [state]
+        return selected
+    
+    def _get_calendar_state(self, calendar_id):
+        """
+        Return the sync state for one calendar from the user's list.
+        
+        The primary calendar is stored as 'primary', so its real ID (the
+        account's address) maps to that. Any other ID must already have been
+        discovered; raise UnknownCalendarError otherwise rather than start
+        mirroring an arbitrary calendar.
+        """
+        if calendar_id == 'primary' or (self.user.email and calendar_id.lower() == self.user.email.lower()):
+            state, _ = CalendarSyncState.objects.get_or_create(user=self.user, calendar_id='primary')
+            return state
+        
+        state = CalendarSyncState.objects.filter(user=self.user, calendar_id=calendar_id).first()
+        if state is None and not CalendarSyncState.objects.filter(user=self.user).exclude(summary='').exists():
+            # The calendar list has never been read for this user
+            try:
+                self._discover_calendars()
+            except HttpError as error:
+                logger.error(f"Error listing calendars: {error}", exc_info=True)
+            state = CalendarSyncState.objects.filter(user=self.user, calendar_id=calendar_id).first()
+        if state is None:
+            raise UnknownCalendarError(calendar_id)
+        return state
+    
+    def _discover_calendars(self):
+        """Record every calendar in the user's list along with its name and colour"""
+        states = []
+        for entry in self._iter_calendar_list():
+            # Keep the 'primary' alias so it matches state created before discovery
+            calendar_id = 'primary' if entry.get('primary') else entry['id']
+            state, _ = CalendarSyncState.objects.update_or_create(
+                user=self.user,
+                calendar_id=calendar_id,
+                defaults={
+                    'summary': entry.get('summaryOverride', entry.get('summary', ''))[:1000],
+                    'background_color': entry.get('backgroundColor', ''),
+                    'selected': bool(entry.get('selected') or entry.get('primary')),
+                },
+            )
+            states.append(state)
+        
+        known = [state.calendar_id for state in states]
+        CalendarSyncState.objects.filter(user=self.user).exclude(calendar_id__in=known).delete()
+        CalendarEvent.objects.filter(user=self.user).exclude(calendar_id__in=known).delete()
+        return states
+    
+    def _sync_calendars(self, calendars):
+        """Sync stale calendars, several at once when there is more than one"""
+        stale = [state for state in calendars if self._is_stale(state)]
+        if len(stale) == 1:
+            try:
+                self.sync(stale[0].calendar_id, stale[0])
+            except HttpError as error:
+                # Serve whatever the local table already holds
+                logger.error(f"Error syncing calendar {stale[0].calendar_id}: {error}", exc_info=True)
+            return
+        
+        _, pending = fetch_all(
+            {state.calendar_id: partial(_sync_calendar, self.user, state.calendar_id) for state in stale},
+            pool='calendar',
+        )
+        if pending:
+            logger.warning(f"Calendar sync still running for {', '.join(pending)}; serving stored events")
+    
+    def _format_event(self, event, state=None):
+        """Format a stored event for our application"""
+        return {
+            'id': event.event_id,
+            'title': event.title,
+            'description': event.description,
+            'start': event.start_raw,
+            'end': event.end_raw,
+            'location': event.location,
+            'attendees': event.attendees,
+            'htmlLink': event.html_link,
+            'colorId': event.color_id,
+            'calendarId': event.calendar_id,
+            'calendarName': state.summary if state else '',
+            'calendarColor': state.background_color if state else '',
+        }
+    
+    def _is_stale(self, state, lead=1.0):
+        if state.push_active:
+            # Channel notifications mark the calendar dirty; this only catches lost ones
+            interval = timedelta(seconds=getattr(settings, 'GOOGLE_PUSH_SAFETY_INTERVAL', 3600))
+        else:
+            interval = timedelta(seconds=getattr(settings, 'CALENDAR_SYNC_INTERVAL', 60))
+        return not state.last_synced_at or timezone.now() - state.last_synced_at >= interval * lead
+    
+    def _full_sync_due(self, state):
+        interval = timedelta(seconds=getattr(settings, 'CALENDAR_FULL_SYNC_INTERVAL', 86400))
+        return not state.last_full_sync_at or timezone.now() - state.last_full_sync_at >= interval
+    
+    def watch(self, state, address):
+        """
+        Open a push channel for a calendar's events, replacing any existing one.
+
+        Google posts to ``address`` (an HTTPS URL) whenever the calendar
+        changes; the random token lets the receiver verify the sender.
+        """
+        ttl = getattr(settings, 'GOOGLE_PUSH_CHANNEL_TTL', 7 * 86400)
+        channel_id = uuid.uuid4().hex
+        token = secrets.token_urlsafe(32)
+        response = self.service.events().watch(
+            calendarId=state.calendar_id,
+            body={
+                'id': channel_id,
+                'type': 'web_hook',
+                'address': address,
+                'token': token,
+                'params': {'ttl': str(ttl)},
+            },
+        ).execute()
+        
+        old_channel = (state.channel_id, state.channel_resource_id)
+        state.channel_id = channel_id
+        state.channel_token = token
+        state.channel_resource_id = response['resourceId']
+        state.channel_expires_at = datetime.fromtimestamp(int(response['expiration']) / 1000, tz=dt_timezone.utc)
+        state.save(update_fields=['channel_id', 'channel_token', 'channel_resource_id', 'channel_expires_at'])
+        
+        if all(old_channel):
+            self.stop_channel(*old_channel)
+        return state
+    
+    def renew_channels(self, address, renew_before):
+        """Open channels for selected calendars without one that outlives ``renew_before``"""
+        renewed = 0
+        for state in self._get_calendars_to_read():
+            if state.channel_expires_at and state.channel_expires_at > renew_before:
+                continue
+            self.watch(state, address)
+            renewed += 1
+        return renewed
+    
+    def stop_channel(self, channel_id, resource_id):
+        """Stop a push channel; channels that already expired are ignored"""
         try:
-            now = datetime.utcnow()
-            time_min = now.isoformat() + 'Z'
-            time_max = (now + timedelta(days=days_ahead)).isoformat() + 'Z'
-            
-            results = self.service.events().list(
-                calendarId='primary',
-                timeMin=time_min,
-                timeMax=time_max,
-                maxResults=max_results,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            
-            events = results.get('items', [])
-            
-            # Format events for our application
-            formatted_events = []
-            for event in events:
-                start = event['start'].get('dateTime', event['start'].get('date'))
-                end = event['end'].get('dateTime', event['end'].get('date'))
-                
-                formatted_event = {
-                    'id': event['id'],
-                    'title': event.get('summary', 'No Title'),
-                    'description': event.get('description', ''),
-                    'start': start,
-                    'end': end,
-                    'location': event.get('location', ''),
-                    'attendees': event.get('attendees', []),
-                    'htmlLink': event.get('htmlLink', ''),
-                    'colorId': event.get('colorId', ''),
-                }
-                formatted_events.append(formatted_event)
-            
-            return formatted_events
-            
+            self.service.channels().stop(body={'id': channel_id, 'resourceId': resource_id}).execute()
         except HttpError as error:
-            logger.error(f"Error getting events: {error}", exc_info=True)
-            return []
+            if error.resp.status != 404:
+                raise
     
-    def get_events_for_date(self, date):
-        """Get events for a specific date"""
-        if not self.service:
-            return []
+    def sync_if_stale(self, calendar_id='primary'):
+        """Sync a calendar unless it was synced within CALENDAR_SYNC_INTERVAL seconds"""
+        state, _ = CalendarSyncState.objects.get_or_create(user=self.user, calendar_id=calendar_id)
+        if not self._is_stale(state):
+            return state
+        return self.sync(calendar_id, state)
+    
+    def sync(self, calendar_id='primary', state=None):
+        """
+        Bring the local copy of a calendar up to date.
+
+        Uses the stored syncToken to fetch only changed and cancelled events.
+        A missing token, an expired one (HTTP 410) or a due periodic resync
+        triggers a full sync of the mirrored window.
+        """
+        if state is None:
+            state, _ = CalendarSyncState.objects.get_or_create(user=self.user, calendar_id=calendar_id)
         
-        try:
-            # Start and end of the day
-            start_of_day = datetime.combine(date, datetime.min.time())
-            end_of_day = datetime.combine(date, datetime.max.time())
-            
-            time_min = start_of_day.isoformat() + 'Z'
-            time_max = end_of_day.isoformat() + 'Z'
-            
-            results = self.service.events().list(
-                calendarId='primary',
-                timeMin=time_min,
-                timeMax=time_max,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            
-            return results.get('items', [])
+        if state.sync_token and not self._full_sync_due(state):
+            try:
+                self._sync_events(state, full=False)
+                return state
+            except HttpError as error:
+                if error.resp.status != 410:
+                    raise
+                logger.info(f"Sync token for calendar {calendar_id} expired for {self.user.email}; resyncing")
+        
+        self._sync_events(state, full=True)
+        return state
+    
+    def _sync_events(self, state, full):
+        """Run one events.list sync pass and apply it to the local table"""
+        now = timezone.now()
+        # Recurring events expand into instances, so only a bounded window
+        # ahead is stored; the periodic full sync moves the window forward.
+        window_start, horizon = self._mirror_window()
+        params = {
+            'calendarId': state.calendar_id,
+            'singleEvents': True,
+            'maxResults': 2500,
+        }
+        if full:
+            # Bounded at the horizon so open-ended recurrences are not
+            # expanded (and downloaded) forever
+            params['timeMin'] = window_start.isoformat()
+            params['timeMax'] = horizon.isoformat()
+        else:
+            params['syncToken'] = state.sync_token
+        
+        rows = []
+        removed = set()
+        page_token = None
+        while True:
+            response = self.service.events().list(pageToken=page_token, **params).execute()
+            for event in response.get('items', []):
+                row = None
+                if event.get('status') != 'cancelled':
+                    row = self._event_to_row(state.calendar_id, event)
+                if row is None or row.start >= horizon:
+                    removed.add(event['id'])
+                else:
+                    rows.append(row)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        
+        with transaction.atomic():
+            stored = CalendarEvent.objects.filter(user=self.user, calendar_id=state.calendar_id)
+            if full:
+                stored.exclude(event_id__in=[row.event_id for row in rows]).delete()
+            elif removed:
+                stored.filter(event_id__in=removed).delete()
+            CalendarEvent.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['user', 'calendar_id', 'event_id'],
+                update_fields=[
+                    'title', 'description', 'location', 'start', 'end', 'start_raw', 'end_raw',
+                    'all_day', 'attendees', 'html_link', 'color_id', 'synced_at',
+                ],
+            )
             
-        except HttpError as error:
-            logger.error(f"Error getting events for date: {error}", exc_info=True)
-            return []
+            state.sync_token = response.get('nextSyncToken', '')
+            state.last_synced_at = now
+            if full:
+                state.last_full_sync_at = now
+            state.save()
+        
+        logger.info(
+            f"{'Full' if full else 'Incremental'} sync of calendar {state.calendar_id} for {self.user.email}: "
+            f"{len(rows)} updated, {len(removed)} removed"
+        )
+        if full or rows or removed:
+            invalidate('calendar', self.user.pk)
+            publish(self.user.pk, 'calendar', 'synced', calendar_id=state.calendar_id)
+    
+    def _event_to_row(self, calendar_id, event):
+        """Build a CalendarEvent from an events.list item, or None if it has no usable times"""
+        start_raw = event.get('start', {}).get('dateTime', event.get('start', {}).get('date'))
+        end_raw = event.get('end', {}).get('dateTime', event.get('end', {}).get('date'))
+        if not start_raw or not end_raw:
+            return None
+        
+        try:
+            start = _parse_event_time(start_raw)
+            end = _parse_event_time(end_raw)
+        except ValueError:
+            logger.warning(f"Skipping event {event.get('id')} with unparseable times")
+            return None
+        
+        return CalendarEvent(
+            user=self.user,
+            calendar_id=calendar_id,
+            event_id=event['id'],
+            title=event.get('summary', 'No Title')[:1000],
+            description=event.get('description', ''),
+            location=event.get('location', '')[:1000],
+            start=start,
+            end=end,
+            start_raw=start_raw,
+            end_raw=end_raw,
+            all_day='dateTime' not in event.get('start', {}),
+            attendees=event.get('attendees', []),
+            html_link=event.get('htmlLink', ''),
+            color_id=event.get('colorId', ''),
+        )
+
+
+def _sync_calendar(user, calendar_id):
+    """Sync one calendar on a worker thread with its own client; httplib2 is not thread-safe"""
+    service = GoogleCalendarService(user)
+    if service.service:
+        service.sync_if_stale(calendar_id)
+
+
+def _parse_event_time(value):
+    """Parse an event dateTime, or an all-day date as midnight UTC"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed
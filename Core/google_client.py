@@ -1,14 +1,43 @@
+import json
 import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
 from typing import Optional
 
+import httplib2
 from allauth.socialaccount.models import SocialApp, SocialToken
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from google.auth.exceptions import RefreshError, TransportError
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+from .google_quota import request_builder as quota_request_builder
+from .google_transport import authorized_http, get_refresh_request
 
 logger = logging.getLogger(__name__)
 
 GOOGLE_TOKEN_URI = 'https://oauth2.googleapis.com/token'
 
+# APIs used by the service classes; their discovery documents are loaded once
+# per process when the app starts.
+PRELOADED_APIS = [
+    ('gmail', 'v1'),
+    ('calendar', 'v3'),
+    ('tasks', 'v1'),
+]
+
+_discovery_documents = {}
+_discovery_lock = threading.Lock()
+
+_credentials_cache = {}
+_credentials_lock = threading.Lock()
+_refresh_locks = defaultdict(threading.Lock)
+
 
 def _get_social_token(user) -> Optional[SocialToken]:
     """
@@ -46,8 +75,88 @@ def _get_social_token(user) -> Optional[SocialToken]:
     return fallback
 
 
-def build_google_credentials(user) -> Optional[Credentials]:
-    """Return a Google Credentials object for the specified user."""
+class CachedCredentials(Credentials):
+    """
+    Google credentials tied to the SocialToken row they were loaded from.
+
+    Whenever the token is refreshed, whether proactively by
+    ``build_google_credentials`` or by the transport after a 401, the new access
+    token and expiry are written back so other requests and processes pick
+    them up instead of refreshing again.
+    """
+
+    social_token_id = None
+
+    def refresh(self, request):
+        """
+        Refresh the access token at most once across concurrent callers.
+
+        Threads in this process queue on a per-token lock, and other processes
+        are serialised by a row lock on the SocialToken. Whoever gets the lock
+        second finds a fresh token already in place and reuses it instead of
+        calling the token endpoint again.
+        """
+        stale_token = self.token
+        with _get_refresh_lock(self.social_token_id):
+            if self.token != stale_token and not _expires_soon(self):
+                # Another thread refreshed these shared credentials meanwhile
+                return
+
+            with transaction.atomic():
+                row = (
+                    SocialToken.objects.select_for_update()
+                    .filter(pk=self.social_token_id)
+                    .first()
+                )
+                if row and row.token != stale_token and row.expires_at:
+                    self.token = row.token
+                    self.expiry = row.expires_at.astimezone(dt_timezone.utc).replace(tzinfo=None)
+                    if not _expires_soon(self):
+                        # Another process already refreshed and stored the token
+                        return
+
+                super().refresh(request)
+                _store_refreshed_token(self)
+
+
+def _get_refresh_lock(social_token_id) -> threading.Lock:
+    """Return the in-process lock guarding refreshes of one SocialToken."""
+    with _credentials_lock:
+        return _refresh_locks[social_token_id]
+
+
+def _utcnow() -> datetime:
+    """Naive UTC now, which is what google-auth compares expiry against."""
+    return timezone.now().astimezone(dt_timezone.utc).replace(tzinfo=None)
+
+
+def _store_refreshed_token(creds: CachedCredentials) -> None:
+    """Persist a refreshed access token and its expiry in a single UPDATE."""
+    if not creds.social_token_id:
+        return
+
+    fields = {
+        'token': creds.token,
+        'expires_at': creds.expiry.replace(tzinfo=dt_timezone.utc) if creds.expiry else None,
+    }
+    if creds.refresh_token:
+        fields['token_secret'] = creds.refresh_token
+
+    SocialToken.objects.filter(pk=creds.social_token_id).update(**fields)
+
+
+def _expires_soon(creds: Credentials) -> bool:
+    """Whether the access token is missing or within the refresh margin of expiring."""
+    if not creds.token:
+        return True
+    if creds.expiry is None:
+        return False
+    margin = timedelta(seconds=getattr(settings, 'GOOGLE_TOKEN_REFRESH_MARGIN', 300))
+    return creds.expiry - margin <= _utcnow()
+
+
+def _load_credentials(user) -> Optional[CachedCredentials]:
+    """Build credentials for the user from their stored SocialToken."""
     social_token = _get_social_token(user)
     if not social_token:
         logger.warning("No Google social token found for user %s", user.email)
@@ -59,28 +168,147 @@ def build_google_credentials(user) -> Optional[Credentials]:
         return None
 
     refresh_token = social_token.token_secret or None
-    creds = Credentials(
+    creds = CachedCredentials(
         token=social_token.token,
         refresh_token=refresh_token,
         token_uri=GOOGLE_TOKEN_URI,
         client_id=google_app.client_id,
         client_secret=google_app.secret,
     )
+    creds.social_token_id = social_token.pk
 
     if social_token.expires_at:
-        creds.expiry = social_token.expires_at
+        # google-auth expects a naive UTC expiry
+        creds.expiry = social_token.expires_at.astimezone(dt_timezone.utc).replace(tzinfo=None)
+
+    return creds
+
+
+def invalidate_credentials(user_id) -> None:
+    """Drop a user's cached credentials, e.g. after they sign in again."""
+    with _credentials_lock:
+        _credentials_cache.pop(user_id, None)
+
+
+def build_google_credentials(user) -> Optional[Credentials]:
+    """
+    Return a Google Credentials object for the specified user.
+
+    Credentials are cached per user for the life of the process. Tokens that
+    are about to expire are refreshed here, before any API call needs them, and
+    the refreshed token is written back to the user's SocialToken.
+    """
+    with _credentials_lock:
+        creds = _credentials_cache.get(user.pk)
+
+    if creds is None:
+        creds = _load_credentials(user)
+        if creds is None:
+            return None
+        with _credentials_lock:
+            _credentials_cache[user.pk] = creds
+
+    if creds.refresh_token and _expires_soon(creds):
+        try:
+            creds.refresh(get_refresh_request())
+            logger.info("Refreshed Google access token for %s", user.email)
+        except RefreshError as exc:
+            logger.warning("Google token refresh rejected for %s: %s", user.email, exc)
+            invalidate_credentials(user.pk)
+            return None
+        except TransportError as exc:
+            # Leave the stale token in place; the transport retries the refresh
+            logger.warning("Google token refresh failed for %s: %s", user.email, exc)
 
     return creds
 
 
+def _read_discovery_document(api_name: str, api_version: str) -> Optional[str]:
+    """Read a discovery document from the disk cache or the client's bundled copies."""
+    cache_dir = getattr(settings, 'GOOGLE_DISCOVERY_CACHE_DIR', None)
+    if cache_dir:
+        path = os.path.join(cache_dir, f'{api_name}.{api_version}.json')
+        try:
+            with open(path, 'r') as handle:
+                return handle.read()
+        except FileNotFoundError:
+            pass
+
+    return get_static_doc(api_name, api_version)
+
+
+def _warm_resource(resource, description) -> None:
+    """
+    Instantiate every nested resource once.
+
+    googleapiclient fills in default parameters on the shared document the
+    first time each method is built. Doing that up front means later builds
+    from concurrent threads only ever read the document.
+    """
+    for name, child_description in description.get('resources', {}).items():
+        _warm_resource(getattr(resource, name)(), child_description)
+
+
+def get_discovery_document(api_name: str, api_version: str) -> Optional[dict]:
+    """Return the parsed discovery document for an API, loading it at most once."""
+    key = (api_name, api_version)
+    document = _discovery_documents.get(key)
+    if document is not None:
+        return document
+
+    with _discovery_lock:
+        document = _discovery_documents.get(key)
+        if document is not None:
+            return document
+
+        content = _read_discovery_document(api_name, api_version)
+        if content is None:
+            logger.warning("No cached discovery document for Google %s %s", api_name, api_version)
+            return None
+
+        document = json.loads(content)
+        # An unauthenticated transport keeps the warm-up from looking up credentials
+        _warm_resource(build_from_document(document, http=httplib2.Http()), document)
+        _discovery_documents[key] = document
+        return document
+
+
+def preload_discovery_documents() -> None:
+    """Load the discovery documents for every API the app uses."""
+    for api_name, api_version in PRELOADED_APIS:
+        try:
+            get_discovery_document(api_name, api_version)
+        except Exception as exc:  # pragma: no cover - preload is best effort
+            logger.error("Error preloading Google %s discovery document: %s", api_name, exc, exc_info=True)
+
+
 def build_google_service(user, api_name: str, api_version: str):
-    """Build a Google API service client for the provided user."""
+    """
+    Build a Google API service client for the provided user.
+
+    The discovery document comes from the process-wide cache, so this only
+    binds the user's credentials to an already-parsed API description.
+    Requests made through the client are executed under the shared quota
+    and retry policy in ``google_quota``, over the calling thread's
+    keep-alive transport from ``google_transport``.
+    """
     creds = build_google_credentials(user)
     if not creds:
         return None
 
+    http = authorized_http(creds)
+    request_builder = quota_request_builder(api_name, user.pk)
     try:
-        return build(api_name, api_version, credentials=creds, cache_discovery=False)
+        document = get_discovery_document(api_name, api_version)
+        if document is None:
+            return build(
+                api_name,
+                api_version,
+                http=http,
+                cache_discovery=False,
+                requestBuilder=request_builder,
+            )
+        return build_from_document(document, http=http, requestBuilder=request_builder)
     except Exception as exc:  # pragma: no cover - discovery errors are logged
         logger.error(
             "Error building Google %s service for %s: %s",
@@ -90,4 +318,3 @@ def build_google_service(user, api_name: str, api_version: str):
             exc_info=True,
         )
         return None
-
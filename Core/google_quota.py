@@ -0,0 +1,365 @@
+"""
+Shared executor for Google API requests.
+
+Every request built by ``build_google_service`` runs through ``execute``,
+which does three things:
+
+- It takes quota from a per-user and a per-project token bucket sized to
+  Google's limits (``GOOGLE_API_QUOTAS``), so bursts are smoothed locally
+  instead of being rejected by Google.
+- It retries rate-limit, server and transport errors with jittered
+  exponential backoff, honouring ``Retry-After``.
+- It counts quota units, retries and errors per API, which ``quota_stats``
+  reports.
+
+Each call also passes through the API's circuit breaker (see
+``circuit_breaker``). When the breaker is open, the call fails fast instead
+of waiting on a struggling upstream. Per-user rate limits go to the user's
+own breaker instead, since they only mean that user is sending too much.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+
+import httplib2
+from django.conf import settings
+from google.auth.exceptions import TransportError
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+from .circuit_breaker import get_breaker, get_user_breaker
+
+logger = logging.getLogger(__name__)
+
+# Quota units charged per call where Google documents a cost other than one
+# (Gmail meters by units; Calendar and Tasks count every call as one)
+METHOD_COSTS = {
+    'gmail.users.getProfile': 1,
+    'gmail.users.history.list': 2,
+    'gmail.users.labels.list': 1,
+    'gmail.users.messages.get': 5,
+    'gmail.users.messages.list': 5,
+}
+
+# Calls that are safe to resend after a server or transport error; anything
+# else is only retried when Google rejected it before doing any work (429)
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE'}
+
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded'}
+USER_RATE_LIMIT_REASONS = {'userRateLimitExceeded'}
+RETRYABLE_STATUSES = {500, 502, 503, 504}
+TRANSPORT_ERRORS = (OSError, httplib2.HttpLib2Error, TransportError)
+
+# Error kinds that mean the upstream itself is unhealthy and count towards
+# tripping its circuit breaker; 'user_rate_limited' only trips the user's own
+BREAKER_FAILURES = {'rate_limited', 'server', 'transport'}
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+_stats = defaultdict(Counter)
+_stats_lock = threading.Lock()
+
+
+class LocalRateLimitError(HttpError):
+    """Raised when a call would have to wait too long for local quota; looks like a 429."""
+
+    def __init__(self, api, wait):
+        resp = httplib2.Response({'status': 429, 'retry-after': str(int(wait) + 1)})
+        content = json.dumps({'error': {'code': 429, 'message': f'Local {api} quota exhausted'}})
+        super().__init__(resp, content.encode())
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at ``rate`` tokens per second."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, cost, max_wait):
+        """
+        Take ``cost`` tokens and return how long the caller must wait before using them.
+
+        The balance may go negative so concurrent callers queue fairly. If the
+        wait would exceed ``max_wait`` nothing is taken and None is returned.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (cost - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self._tokens -= cost
+            return wait
+
+    def refund(self, cost):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + cost)
+
+
+class QuotaHttpRequest(HttpRequest):
+    """HttpRequest whose ``execute`` goes through the shared executor."""
+
+    quota_api = None
+    quota_user_id = None
+
+    def execute(self, http=None, num_retries=0):
+        return execute(
+            lambda: super(QuotaHttpRequest, self).execute(http=http),
+            self.quota_api,
+            self.quota_user_id,
+            cost=request_cost(self),
+            idempotent=self.method.upper() in IDEMPOTENT_METHODS,
+        )
+
+
+def request_builder(api, user_id):
+    """Return a ``requestBuilder`` for googleapiclient that tags requests with their quota owner"""
+
+    def build_request(*args, **kwargs):
+        request = QuotaHttpRequest(*args, **kwargs)
+        request.quota_api = api
+        request.quota_user_id = user_id
+        return request
+
+    return build_request
+
+
+def request_cost(request):
+    return METHOD_COSTS.get(getattr(request, 'methodId', None), 1)
+
+
+def execute(call, api, user_id, cost=1, idempotent=True):
+    """
+    Run ``call`` (a zero-argument function sending one HTTP request) under quota.
+
+    Rate limits are always retried; server and transport errors only when the
+    call is idempotent. Retries back off exponentially with full jitter, or
+    follow Google's ``Retry-After`` when it is longer. The last error is
+    re-raised once ``GOOGLE_API_MAX_RETRIES`` is spent.
+    """
+    max_retries = getattr(settings, 'GOOGLE_API_MAX_RETRIES', 3)
+    latency_slo = getattr(settings, 'GOOGLE_CIRCUIT_LATENCY_SLO', 5.0)
+    breaker = get_breaker(api, user_id)
+    user_breaker = get_user_breaker(api, user_id) if user_id is not None else breaker
+    attempt = 0
+    while True:
+        try:
+            breaker.before_call()
+        except HttpError:
+            _count(api, 'short_circuited')
+            raise
+        if user_breaker is not breaker:
+            try:
+                user_breaker.before_call()
+            except HttpError:
+                breaker.cancel()
+                _count(api, 'short_circuited')
+                raise
+        try:
+            _acquire(api, user_id, cost)
+        except HttpError:
+            _cancel(breaker, user_breaker)
+            raise
+
+        started = time.monotonic()
+        try:
+            response = call()
+        except Exception as exc:
+            kind = classify_error(exc)
+            _count(api, f'errors.{kind}')
+            if isinstance(exc, LocalRateLimitError):
+                _record(breaker, user_breaker, failed=False)
+            elif kind == 'user_rate_limited':
+                # Google answered, so the shared breaker learns nothing either way
+                if user_breaker is not breaker:
+                    breaker.cancel()
+                user_breaker.record(failed=True)
+            else:
+                _record(breaker, user_breaker, failed=kind in BREAKER_FAILURES)
+            delay = _retry_delay(exc, kind, attempt, idempotent)
+            if delay is None or attempt >= max_retries:
+                raise
+            attempt += 1
+            _count(api, 'retries')
+            logger.warning(
+                "Google %s request failed (%s); retry %d/%d in %.2fs",
+                api,
+                kind,
+                attempt,
+                max_retries,
+                delay,
+            )
+            time.sleep(delay)
+            continue
+        elapsed = time.monotonic() - started
+        if elapsed > latency_slo:
+            _count(api, 'slow')
+        _record(breaker, user_breaker, failed=elapsed > latency_slo)
+        _count(api, 'requests')
+        return response
+
+
+def execute_batch(batch, requests):
+    """Execute a BatchHttpRequest built from ``requests``, charging each call's quota"""
+    if not requests:
+        return None
+    first = requests[0]
+    return execute(
+        batch.execute,
+        getattr(first, 'quota_api', None),
+        getattr(first, 'quota_user_id', None),
+        cost=sum(request_cost(request) for request in requests),
+        # A batch may contain writes, so only resend it when it was rejected outright
+        idempotent=False,
+    )
+
+
+def max_batch_calls(api, call_cost, default):
+    """
+    How many calls of ``call_cost`` units one batch may hold.
+
+    A batch is charged its full cost up front, so it is kept within what
+    both buckets can hold at once; a larger one could never be admitted.
+    """
+    limits = getattr(settings, 'GOOGLE_API_QUOTAS', {}).get(api)
+    if not limits:
+        return default
+    capacity = min(limits['user_rate'], limits['project_rate'])
+    return max(1, min(default, int(capacity // call_cost)))
+
+
+def classify_error(exc):
+    """Sort an exception from a Google call into a coarse category"""
+    if isinstance(exc, HttpError):
+        status = exc.resp.status
+        reasons = _error_reasons(exc)
+        if status in (403, 429) and reasons and reasons <= USER_RATE_LIMIT_REASONS:
+            return 'user_rate_limited'
+        if status == 429 or (status == 403 and reasons & RATE_LIMIT_REASONS):
+            return 'rate_limited'
+        if status in RETRYABLE_STATUSES:
+            return 'server'
+        if status in (401, 403):
+            return 'auth'
+        if status in (404, 410):
+            return 'not_found'
+        if status in (409, 412):
+            return 'conflict'
+        return 'client'
+    if isinstance(exc, TRANSPORT_ERRORS):
+        return 'transport'
+    return 'other'
+
+
+def quota_stats():
+    """Return a snapshot of per-API counters: requests, units, waits, retries and errors"""
+    with _stats_lock:
+        return {api: dict(counter) for api, counter in _stats.items()}
+
+
+def _acquire(api, user_id, cost):
+    """Block until both the user and project buckets allow ``cost`` more units"""
+    limits = getattr(settings, 'GOOGLE_API_QUOTAS', {}).get(api)
+    if not limits:
+        _count(api, 'units', cost)
+        return
+
+    max_wait = getattr(settings, 'GOOGLE_QUOTA_MAX_WAIT', 2.0)
+    project_bucket = _get_bucket((api, None), limits['project_rate'])
+    user_bucket = _get_bucket((api, user_id), limits['user_rate'])
+
+    project_wait = project_bucket.reserve(cost, max_wait)
+    if project_wait is None:
+        _count(api, 'throttled')
+        raise LocalRateLimitError(api, cost / project_bucket.rate)
+    user_wait = user_bucket.reserve(cost, max_wait)
+    if user_wait is None:
+        project_bucket.refund(cost)
+        _count(api, 'throttled')
+        raise LocalRateLimitError(api, cost / user_bucket.rate)
+
+    wait = max(project_wait, user_wait)
+    _count(api, 'units', cost)
+    if wait:
+        _count(api, 'wait_ms', int(wait * 1000))
+        time.sleep(wait)
+
+
+def _get_bucket(key, rate):
+    bucket = _buckets.get(key)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.setdefault(key, TokenBucket(rate))
+    return bucket
+
+
+def _retry_delay(exc, kind, attempt, idempotent):
+    """Seconds to wait before retrying, or None if the error should not be retried"""
+    if kind in ('rate_limited', 'user_rate_limited'):
+        if isinstance(exc, LocalRateLimitError):
+            return None
+    elif kind in ('server', 'transport'):
+        if not idempotent:
+            return None
+    else:
+        return None
+
+    base = getattr(settings, 'GOOGLE_API_BACKOFF_BASE', 0.5)
+    cap = getattr(settings, 'GOOGLE_API_BACKOFF_MAX', 8.0)
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+
+    retry_after = _retry_after(exc)
+    if retry_after is not None:
+        if retry_after > cap:
+            # Waiting that long would hold a request thread hostage
+            return None
+        delay = max(delay, retry_after)
+    return delay
+
+
+def _retry_after(exc):
+    if not isinstance(exc, HttpError):
+        return None
+    value = exc.resp.get('retry-after')
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        # HTTP-date values are rare from Google; fall back to normal backoff
+        return None
+
+
+def _error_reasons(exc):
+    try:
+        error = json.loads(exc.content).get('error', {})
+    except (TypeError, ValueError, AttributeError):
+        return set()
+    return {detail.get('reason') for detail in error.get('errors', []) if isinstance(detail, dict)}
+
+
+def _record(breaker, user_breaker, failed):
+    """Record a call's outcome on the shared breaker; the user's only hears of successes"""
+    breaker.record(failed=failed)
+    if user_breaker is not breaker:
+        if failed:
+            user_breaker.cancel()
+        else:
+            user_breaker.record(failed=False)
+
+
+def _cancel(breaker, user_breaker):
+    breaker.cancel()
+    if user_breaker is not breaker:
+        user_breaker.cancel()
+
+
+def _count(api, name, amount=1):
+    with _stats_lock:
+        _stats[api][name] += amount
@@ -1,19 +1,72 @@
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from allauth.socialaccount.models import SocialToken, SocialApp
-from datetime import datetime
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from googleapiclient.errors import BatchError, HttpError
+from .circuit_breaker import CircuitOpenError
+from .events import publish
+from .fanout import submit
+from .google_client import build_google_service
+from .google_quota import LocalRateLimitError, execute_batch, max_batch_calls
+from .models import GoogleTask, TaskListSyncState
+from .response_cache import invalidate
+from datetime import datetime, timedelta
+import base64
+import json
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
+# Calls per Google batch request; the API accepts more, but smaller batches
+# keep a single slow call from holding up the whole response
+BATCH_SIZE = 50
+
+# Tasks per page when walking task lists
+PAGE_SIZE = 100
+
+
+class TaskConflictError(Exception):
+    """A task changed on Google's side since the etag an update was based on"""
+    
+    def __init__(self, task):
+        super().__init__(f"Task {task['id']} was modified elsewhere")
+        self.task = task
+
+
+# IDs of users with a background refresh already queued
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def refresh_in_background(user):
+    """Queue a mirror sync of the user's task lists unless one is already pending"""
+    with _refreshing_lock:
+        if user.pk in _refreshing:
+            return
+        _refreshing.add(user.pk)
+    
+    def run():
+        try:
+            # Each thread builds its own client; httplib2 is not thread-safe
+            service = GoogleTasksService(user)
+            if service.service:
+                service.sync_all()
+        except Exception as e:
+            logger.error(f"Background task sync failed for {user.email}: {e}", exc_info=True)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(user.pk)
+    
+    submit(run, pool='refresh')
+
 
 class GoogleTasksService:
     def __init__(self, user):
         self.user = user
         self.service = self._build_service()
     
-    def _format_task(self, task):
+    def _format_task(self, task, tasklist_id=None):
         """Format a Google Tasks task to our app format"""
         google_status = task.get('status')
         notes = task.get('notes', '')
@@ -37,55 +90,14 @@ class GoogleTasksService:
             'due': task.get('due'),
             'completed': task.get('completed'),
             'updated': task.get('updated'),
+            'etag': task.get('etag'),
+            'tasklist': tasklist_id,
         }
     
     def _build_service(self):
         """Build Google Tasks service using stored OAuth tokens"""
-        try:
-            # Get the social token from allauth - try different approaches
-            social_token = None
-            
-            # Try to get token by provider name
-            try:
-                social_token = SocialToken.objects.get(
-                    account__user=self.user,
-                    account__provider='google'
-                )
-            except SocialToken.DoesNotExist:
-                # Try to get token by provider ID (numeric) - fallback
-                social_token = SocialToken.objects.filter(
-                    account__user=self.user
-                ).first()
-            
-            if not social_token:
-                logger.warning(f"No social token found for user {self.user.email}")
-                return None
-            
-            # Get the Google app credentials
-            try:
-                google_app = SocialApp.objects.get(provider='google')
-            except SocialApp.DoesNotExist:
-                # Try to get by ID if provider name doesn't work
-                google_app = SocialApp.objects.first()
-            
-            if not google_app:
-                logger.error("No Google app configured in Django admin")
-                return None
-            
-            creds = Credentials(
-                token=social_token.token,
-                refresh_token=social_token.token_secret,
-                token_uri='https://oauth2.googleapis.com/token',
-                client_id=google_app.client_id,
-                client_secret=google_app.secret,
-            )
-            
-            logger.info(f"Building Google Tasks service for user {self.user.email}")
-            return build('tasks', 'v1', credentials=creds)
-            
-        except Exception as e:
-            logger.error(f"Error building Google Tasks service: {e}", exc_info=True)
-            return None
+        logger.info(f"Building Google Tasks service for user {self.user.email}")
+        return build_google_service(self.user, 'tasks', 'v1')
     
     def get_task_lists(self):
         """Get all task lists"""
@@ -93,35 +105,270 @@ class GoogleTasksService:
             return []
         
         try:
-            results = self.service.tasklists().list().execute()
-            return results.get('items', [])
+            return list(self.iter_task_lists())
         except HttpError as error:
             logger.error(f"Error getting task lists: {error}", exc_info=True)
             return []
     
-    def get_tasks(self, tasklist_id='@default', max_results=100):
-        """Get tasks from a specific task list"""
-        if not self.service:
-            return []
-        
-        try:
+    def iter_task_lists(self):
+        """Yield every task list, fetching further pages only as they are consumed"""
+        page_token = None
+        while True:
+            results = self.service.tasklists().list(maxResults=100, pageToken=page_token).execute()
+            yield from results.get('items', [])
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return
+    
+    def _iter_task_pages(self, tasklist_id, **params):
+        """Yield the raw items of each tasks.list page for one list, lazily"""
+        page_token = None
+        while True:
             results = self.service.tasks().list(
                 tasklist=tasklist_id,
-                maxResults=max_results,
-                showCompleted=True,
-                showHidden=True
+                maxResults=PAGE_SIZE,
+                pageToken=page_token,
+                **params
             ).execute()
+            yield results.get('items', [])
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return
+    
+    def iter_tasks(self, tasklist_ids=None):
+        """
+        Yield formatted tasks from every task list (or just ``tasklist_ids``).
+
+        Lists and pages are fetched lazily, so a consumer that stops early
+        never pays for the rest, and memory stays bounded by one page.
+        """
+        if tasklist_ids is None:
+            tasklist_ids = (task_list['id'] for task_list in self.iter_task_lists())
+        
+        for tasklist_id in tasklist_ids:
+            for items in self._iter_task_pages(tasklist_id, showCompleted=True, showHidden=True):
+                for task in items:
+                    yield self._format_task(task, tasklist_id)
+    
+    def get_tasks_page(self, tasklist_id=None, cursor=None, limit=100):
+        """
+        Return one page of tasks across all lists (or one list) from the mirror.
+
+        Pages are keyset-paginated on (list, position, task ID); the returned
+        ``next_cursor`` is opaque and ``None`` on the last page. The mirror is
+        filled by ``sync_all``, which walks every list and page with the same
+        lazy page iterator as ``iter_tasks``.
+        """
+        if not self.service:
+            return {'tasks': [], 'next_cursor': None}
+        
+        try:
+            if not TaskListSyncState.objects.filter(user=self.user, last_synced_at__isnull=False).exists():
+                self.sync_all()
+            elif any(self._is_stale(state) for state in TaskListSyncState.objects.filter(user=self.user)):
+                refresh_in_background(self.user)
+        except HttpError as error:
+            # Serve whatever the mirror already holds
+            logger.error(f"Error syncing tasks: {error}", exc_info=True)
+        
+        rows = GoogleTask.objects.filter(user=self.user)
+        if tasklist_id:
+            resolved = self._resolve_tasklist_id(tasklist_id)
+            rows = rows.filter(tasklist_id=resolved or tasklist_id)
+        if cursor:
+            last_list, last_position, last_id = _decode_cursor(cursor)
+            rows = rows.filter(
+                Q(tasklist_id__gt=last_list)
+                | Q(tasklist_id=last_list, position__gt=last_position)
+                | Q(tasklist_id=last_list, position=last_position, task_id__gt=last_id)
+            )
+        rows = list(rows.order_by('tasklist_id', 'position', 'task_id')[:limit + 1])
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1])
+        
+        return {
+            'tasks': [self._format_task(row.data, row.tasklist_id) for row in rows],
+            'next_cursor': next_cursor,
+        }
+    
+    def get_mirrored_task_lists(self):
+        """Return the task lists known to the mirror"""
+        return [
+            {'id': state.tasklist_id, 'title': state.title, 'is_default': state.is_default}
+            for state in TaskListSyncState.objects.filter(user=self.user).order_by('-is_default', 'title')
+        ]
+    
+    def sync_all(self, force=False, lead=1.0):
+        """
+        Sync every task list the user has (only stale ones unless ``force``).
+
+        The set of lists is rediscovered on the first sync and whenever a full
+        sweep is due, so new and deleted lists are picked up on the same
+        schedule as deleted tasks. ``lead`` scales the staleness interval, as
+        for calendars.
+        """
+        states = list(TaskListSyncState.objects.filter(user=self.user))
+        if not states or any(self._full_sync_due(state) for state in states):
+            states = self._discover_task_lists()
+        
+        for state in states:
+            if force or self._is_stale(state, lead):
+                self.sync(state)
+    
+    def _discover_task_lists(self):
+        """Create sync state for every task list and drop lists that no longer exist"""
+        self._get_sync_state('@default')
+        
+        states = []
+        for task_list in self.iter_task_lists():
+            state, _ = TaskListSyncState.objects.update_or_create(
+                user=self.user,
+                tasklist_id=task_list['id'],
+                defaults={'title': task_list.get('title', '')},
+            )
+            states.append(state)
+        
+        known = [state.tasklist_id for state in states]
+        TaskListSyncState.objects.filter(user=self.user).exclude(tasklist_id__in=known).delete()
+        GoogleTask.objects.filter(user=self.user).exclude(tasklist_id__in=known).delete()
+        return states
+    
+    def _get_sync_state(self, tasklist_id):
+        """Return the sync state for a list, resolving the '@default' alias to its real ID"""
+        if tasklist_id != '@default':
+            state, _ = TaskListSyncState.objects.get_or_create(user=self.user, tasklist_id=tasklist_id)
+            return state
+        
+        state = TaskListSyncState.objects.filter(user=self.user, is_default=True).first()
+        if state:
+            return state
+        
+        default_list = self.service.tasklists().get(tasklist='@default').execute()
+        state, _ = TaskListSyncState.objects.update_or_create(
+            user=self.user,
+            tasklist_id=default_list['id'],
+            defaults={'is_default': True},
+        )
+        return state
+    
+    def _resolve_tasklist_id(self, tasklist_id):
+        """Map '@default' to the real list ID once it is known, for mirror writes"""
+        if tasklist_id != '@default':
+            return tasklist_id
+        state = TaskListSyncState.objects.filter(user=self.user, is_default=True).first()
+        return state.tasklist_id if state else None
+    
+    def _full_sync_due(self, state):
+        interval = timedelta(seconds=getattr(settings, 'TASKS_FULL_SYNC_INTERVAL', 3600))
+        return not state.last_full_sync_at or timezone.now() - state.last_full_sync_at >= interval
+    
+    def _is_stale(self, state, lead=1.0):
+        interval = timedelta(seconds=getattr(settings, 'TASKS_SYNC_INTERVAL', 30))
+        return not state.last_synced_at or timezone.now() - state.last_synced_at >= interval * lead
+    
+    def sync(self, state):
+        """
+        Bring the mirror of one task list up to date.
+
+        Normally only tasks updated since the last sync are fetched
+        (``updatedMin``), including deleted ones so they can be dropped. Every
+        TASKS_FULL_SYNC_INTERVAL seconds a full sweep replaces the list, which
+        also reconciles deletions the delta feed no longer reports.
+        """
+        full = not state.updated_min or self._full_sync_due(state)
+        
+        params = {
+            'showCompleted': True,
+            'showHidden': True,
+        }
+        if not full:
+            params['updatedMin'] = state.updated_min.isoformat()
+            params['showDeleted'] = True
+        
+        now = timezone.now()
+        stored = GoogleTask.objects.filter(user=self.user, tasklist_id=state.tasklist_id)
+        seen = set()
+        deleted = set()
+        upserted = 0
+        newest = state.updated_min
+        # Each page is written as it arrives, so memory stays bounded by one
+        # page; only task IDs are kept for the deletion pass
+        for items in self._iter_task_pages(state.tasklist_id, **params):
+            rows = []
+            for task in items:
+                if task.get('deleted'):
+                    deleted.add(task['id'])
+                    continue
+                row = self._task_to_row(state.tasklist_id, task)
+                rows.append(row)
+                seen.add(row.task_id)
+                if row.updated and (newest is None or row.updated > newest):
+                    newest = row.updated
             
-            tasks = results.get('items', [])
-            
-            # Format tasks for our application
-            formatted_tasks = [self._format_task(task) for task in tasks]
-            
-            return formatted_tasks
+            # updatedMin is inclusive, and tasks written through from this app
+            # come back again; skip rows the mirror already has at that version
+            known = dict(stored.filter(task_id__in=[row.task_id for row in rows]).values_list('task_id', 'updated'))
+            rows = [
+                row for row in rows
+                if not (row.updated and known.get(row.task_id) and row.updated <= known[row.task_id])
+            ]
+            self._upsert_rows(rows)
+            upserted += len(rows)
+        
+        with transaction.atomic():
+            if full:
+                removed, _ = stored.exclude(task_id__in=seen).delete()
+            elif deleted:
+                removed, _ = stored.filter(task_id__in=deleted).delete()
+            else:
+                removed = 0
             
-        except HttpError as error:
-            logger.error(f"Error getting tasks: {error}", exc_info=True)
-            return []
+            # Google's own timestamps drive the watermark, so local clock skew
+            # cannot make the next delta skip an update. It only moves once
+            # every page is stored, so an interrupted sync is simply repeated.
+            state.updated_min = newest
+            state.last_synced_at = now
+            if full:
+                state.last_full_sync_at = now
+            state.save()
+        
+        logger.info(
+            f"{'Full' if full else 'Incremental'} sync of task list {state.tasklist_id} for {self.user.email}: "
+            f"{upserted} updated, {removed} deleted"
+        )
+        if upserted or removed:
+            invalidate('tasks', self.user.pk)
+            publish(self.user.pk, 'tasks', 'synced', tasklist=state.tasklist_id)
+        return state
+    
+    def _task_to_row(self, tasklist_id, task):
+        """Build a GoogleTask mirror row from a Tasks API resource"""
+        updated = task.get('updated')
+        return GoogleTask(
+            user=self.user,
+            tasklist_id=tasklist_id,
+            task_id=task['id'],
+            position=task.get('position', ''),
+            updated=datetime.fromisoformat(updated) if updated else None,
+            data=task,
+        )
+    
+    def _upsert_rows(self, rows):
+        GoogleTask.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['user', 'tasklist_id', 'task_id'],
+            update_fields=['position', 'updated', 'data', 'synced_at'],
+        )
+    
+    def _write_through(self, tasklist_id, task):
+        """Store a task Google just returned from a write"""
+        tasklist_id = self._resolve_tasklist_id(tasklist_id)
+        if tasklist_id:
+            self._upsert_rows([self._task_to_row(tasklist_id, task)])
     
     def create_task(self, title, description='', tasklist_id='@default', due=None, status='not-started'):
         """Create a new task"""
@@ -129,87 +376,136 @@ class GoogleTasksService:
             return None
         
         try:
-            task = {
-                'title': title,
-                'status': 'needsAction',  # Default to not completed
-            }
-            
-            # Add status marker to description if in-progress
-            if status == 'in-progress':
-                task['notes'] = f"[IN_PROGRESS] {description}".strip()
-            elif description:
-                task['notes'] = description
-            
-            if due:
-                task['due'] = due
-            
             result = self.service.tasks().insert(
                 tasklist=tasklist_id,
-                body=task
+                body=self._build_new_task(title, description, due, status)
             ).execute()
             
             logger.info(f"Created task: {title}")
+            self._write_through(tasklist_id, result)
             
             # Format the result to match our app format
-            return self._format_task(result)
+            return self._format_task(result, self._resolve_tasklist_id(tasklist_id))
             
         except HttpError as error:
             logger.error(f"Error creating task: {error}", exc_info=True)
             return None
     
-    def update_task(self, task_id, title=None, description=None, status=None, tasklist_id='@default'):
-        """Update an existing task"""
+    def _build_new_task(self, title, description='', due=None, status='not-started'):
+        """Build the insert body for a new task"""
+        task = {
+            'title': title,
+            'status': 'needsAction',  # Default to not completed
+        }
+        
+        # Add status marker to description if in-progress
+        if status == 'in-progress':
+            task['notes'] = f"[IN_PROGRESS] {description}".strip()
+        elif description:
+            task['notes'] = description
+        
+        if due:
+            task['due'] = due
+        
+        return task
+    
+    def update_task(self, task_id, title=None, description=None, status=None, tasklist_id='@default', etag=None):
+        """
+        Update an existing task with a single PATCH.
+
+        Only the changed fields are sent. The request is guarded by the task's
+        etag: the one passed in, or else the one in the local mirror. If the
+        task changed on Google's side since then, TaskConflictError carries
+        the fresh server copy instead of overwriting it.
+        """
         if not self.service:
             return None
         
         try:
-            # Get the current task first
-            task = self.service.tasks().get(
-                tasklist=tasklist_id,
-                task=task_id
-            ).execute()
+            mirrored = self._get_mirrored_task(tasklist_id, task_id)
             
-            # Update fields
-            if title:
-                task['title'] = title
+            # The current notes are only needed to move the status marker
+            # when the description itself is not being replaced.
+            current = mirrored
+            if current is None and description is None and status is not None:
+                current = self.service.tasks().get(
+                    tasklist=tasklist_id,
+                    task=task_id
+                ).execute()
             
-            # Handle status and description together
-            # We store 'in-progress' status in the notes field
-            if description is not None or status is not None:
-                current_notes = task.get('notes', '')
-                # Remove old status marker
-                current_notes = current_notes.replace('[IN_PROGRESS]', '').strip()
-                
-                # Use new description if provided, otherwise keep current
-                new_description = description if description is not None else current_notes
-                
-                # Add status marker if in-progress
-                if status == 'in-progress':
-                    task['notes'] = f"[IN_PROGRESS] {new_description}".strip()
-                else:
-                    task['notes'] = new_description
-                
-                # Set Google Tasks status
-                if status == 'done':
-                    task['status'] = 'completed'
-                elif status in ['not-started', 'in-progress']:
-                    task['status'] = 'needsAction'
-            
-            result = self.service.tasks().update(
+            body = self._build_patch(current, title, description, status)
+            request = self.service.tasks().patch(
                 tasklist=tasklist_id,
                 task=task_id,
-                body=task
-            ).execute()
+                body=body
+            )
+            etag = etag or (current or {}).get('etag')
+            if etag:
+                request.headers['If-Match'] = etag
+            result = request.execute()
             
             logger.info(f"Updated task: {task_id}")
+            self._write_through(tasklist_id, result)
             
             # Format the result to match our app format
-            return self._format_task(result)
+            return self._format_task(result, self._resolve_tasklist_id(tasklist_id))
             
         except HttpError as error:
+            if error.resp.status == 412:
+                self._raise_conflict(tasklist_id, task_id)
             logger.error(f"Error updating task: {error}", exc_info=True)
             return None
     
+    def _get_mirrored_task(self, tasklist_id, task_id):
+        """Return the mirrored Tasks API resource for a task, if any"""
+        row = GoogleTask.objects.filter(
+            user=self.user,
+            tasklist_id=self._resolve_tasklist_id(tasklist_id),
+            task_id=task_id
+        ).first()
+        return row.data if row else None
+    
+    def _build_patch(self, current, title=None, description=None, status=None):
+        """Build a PATCH body holding only the fields an update changes"""
+        body = {}
+        if title:
+            body['title'] = title
+        
+        # Handle status and description together
+        # We store 'in-progress' status in the notes field
+        if description is not None or status is not None:
+            current_notes = (current or {}).get('notes', '')
+            # Remove old status marker
+            current_notes = current_notes.replace('[IN_PROGRESS]', '').strip()
+            
+            # Use new description if provided, otherwise keep current
+            new_description = description if description is not None else current_notes
+            
+            # Add status marker if in-progress
+            if status == 'in-progress':
+                body['notes'] = f"[IN_PROGRESS] {new_description}".strip()
+            else:
+                body['notes'] = new_description
+            
+            # Set Google Tasks status
+            if status == 'done':
+                body['status'] = 'completed'
+            elif status in ['not-started', 'in-progress']:
+                body['status'] = 'needsAction'
+                body['completed'] = None
+        
+        return body
+    
+    def _raise_conflict(self, tasklist_id, task_id):
+        """Refresh a task whose etag no longer matches and report the conflict"""
+        fresh = self.service.tasks().get(
+            tasklist=tasklist_id,
+            task=task_id
+        ).execute()
+        self._write_through(tasklist_id, fresh)
+        logger.info(f"Update conflict on task {task_id}")
+        raise TaskConflictError(self._format_task(fresh, self._resolve_tasklist_id(tasklist_id)))
+    
     def delete_task(self, task_id, tasklist_id='@default'):
         """Delete a task"""
         if not self.service:
@@ -222,8 +518,193 @@ class GoogleTasksService:
             ).execute()
             
             logger.info(f"Deleted task: {task_id}")
+            GoogleTask.objects.filter(
+                user=self.user,
+                tasklist_id=self._resolve_tasklist_id(tasklist_id),
+                task_id=task_id
+            ).delete()
             return True
             
         except HttpError as error:
             logger.error(f"Error deleting task: {error}", exc_info=True)
             return False
+    
+    def bulk_apply(self, operations):
+        """
+        Apply many create/update/delete/move operations in batched requests.
+
+        Each operation is a dict with an ``op`` key and the same fields the
+        single-task methods take (``id``, ``title``, ``description``,
+        ``status``, ``etag``, ``parent``, ``previous``, ``tasklist``). They are
+        sent through Google batch requests of up to BATCH_SIZE calls (fewer
+        when the per-user Tasks quota is smaller), and one result per
+        operation is returned in input order, so partial failures are
+        reported rather than aborting the rest.
+        """
+        results = [None] * len(operations)
+        if not self.service:
+            return [self._bulk_error(index, op, 'Google Tasks not connected', 403) for index, op in enumerate(operations)]
+        
+        # Updates that move the in-progress marker need the current notes;
+        # fetch any the mirror does not have in one batch up front.
+        current = {}
+        to_fetch = []
+        for index, op in enumerate(operations):
+            if op.get('op') == 'update' and op.get('id'):
+                tasklist_id = op.get('tasklist', '@default')
+                mirrored = self._get_mirrored_task(tasklist_id, op['id'])
+                if mirrored is not None:
+                    current[index] = mirrored
+                elif op.get('description') is None and op.get('status') is not None:
+                    to_fetch.append((index, self.service.tasks().get(tasklist=tasklist_id, task=op['id'])))
+        fetched = self._execute_batched(to_fetch)
+        for index, (response, exception) in fetched.items():
+            if exception is None:
+                current[index] = response
+        
+        requests = []
+        for index, op in enumerate(operations):
+            try:
+                requests.append((index, self._bulk_request(op, current.get(index))))
+            except ValueError as e:
+                results[index] = self._bulk_error(index, op, str(e), 400)
+        
+        conflicts = []
+        for index, (response, exception) in self._execute_batched(requests).items():
+            op = operations[index]
+            tasklist_id = op.get('tasklist', '@default')
+            if exception is None:
+                results[index] = self._bulk_success(index, op, tasklist_id, response)
+            elif isinstance(exception, HttpError) and exception.resp.status == 412:
+                conflicts.append(index)
+            else:
+                status = _bulk_error_status(exception)
+                logger.error(f"Bulk task {op.get('op')} failed: {exception}")
+                results[index] = self._bulk_error(index, op, str(exception), status)
+        
+        # Report conflicts with the fresh server copy, as update_task does
+        fresh = self._execute_batched([
+            (index, self.service.tasks().get(tasklist=operations[index].get('tasklist', '@default'), task=operations[index]['id']))
+            for index in conflicts
+        ])
+        for index in conflicts:
+            op = operations[index]
+            response, exception = fresh.get(index, (None, None))
+            results[index] = self._bulk_error(index, op, 'This task was changed elsewhere', 409)
+            results[index]['conflict'] = True
+            if exception is None and response:
+                self._write_through(op.get('tasklist', '@default'), response)
+                results[index]['task'] = self._format_task(response, self._resolve_tasklist_id(op.get('tasklist', '@default')))
+        
+        for index, op in enumerate(operations):
+            if results[index] is None:
+                results[index] = self._bulk_error(index, op, 'No response from Google Tasks', 502)
+        
+        logger.info(
+            f"Bulk task request for {self.user.email}: "
+            f"{sum(1 for result in results if result['success'])}/{len(results)} succeeded"
+        )
+        return results
+    
+    def _bulk_request(self, op, current):
+        """Build the API request for one bulk operation, or raise ValueError if it is invalid"""
+        kind = op.get('op')
+        tasklist_id = op.get('tasklist', '@default')
+        
+        if kind == 'create':
+            if not op.get('title'):
+                raise ValueError('Title is required')
+            return self.service.tasks().insert(
+                tasklist=tasklist_id,
+                body=self._build_new_task(op['title'], op.get('description', ''), op.get('due'), op.get('status', 'not-started'))
+            )
+        
+        if kind not in ('update', 'delete', 'move'):
+            raise ValueError(f"Unknown operation: {kind}")
+        if not op.get('id'):
+            raise ValueError('Task id is required')
+        
+        if kind == 'update':
+            request = self.service.tasks().patch(
+                tasklist=tasklist_id,
+                task=op['id'],
+                body=self._build_patch(current, op.get('title'), op.get('description'), op.get('status'))
+            )
+            etag = op.get('etag') or (current or {}).get('etag')
+            if etag:
+                request.headers['If-Match'] = etag
+            return request
+        
+        if kind == 'delete':
+            return self.service.tasks().delete(tasklist=tasklist_id, task=op['id'])
+        
+        move_args = {key: op[key] for key in ('parent', 'previous') if op.get(key)}
+        return self.service.tasks().move(tasklist=tasklist_id, task=op['id'], **move_args)
+    
+    def _execute_batched(self, requests):
+        """Run (key, request) pairs in batches; return {key: (response, exception)}"""
+        responses = {}
+        
+        def handle_response(request_id, response, exception):
+            responses[int(request_id)] = (response, exception)
+        
+        # Chunks stay within the per-user quota so each can be admitted whole
+        batch_size = max_batch_calls('tasks', 1, BATCH_SIZE)
+        for start in range(0, len(requests), batch_size):
+            batch = self.service.new_batch_http_request(callback=handle_response)
+            chunk = requests[start:start + batch_size]
+            for key, request in chunk:
+                batch.add(request, request_id=str(key))
+            try:
+                execute_batch(batch, [request for _, request in chunk])
+            except Exception as e:
+                # The whole chunk failed (open breaker, quota, transport error);
+                # report it against every call that got no response of its own
+                logger.error(f"Google Tasks batch of {len(chunk)} calls failed: {e}")
+                for key, _ in chunk:
+                    responses.setdefault(key, (None, e))
+        
+        return responses
+    
+    def _bulk_success(self, index, op, tasklist_id, response):
+        result = {'index': index, 'op': op.get('op'), 'success': True}
+        if op.get('op') == 'delete':
+            GoogleTask.objects.filter(
+                user=self.user,
+                tasklist_id=self._resolve_tasklist_id(tasklist_id),
+                task_id=op['id']
+            ).delete()
+        else:
+            self._write_through(tasklist_id, response)
+            result['task'] = self._format_task(response, self._resolve_tasklist_id(tasklist_id))
+        return result
+    
+    def _bulk_error(self, index, op, error, status):
+        return {'index': index, 'op': op.get('op'), 'success': False, 'error': error, 'status': status}
+
+
+def _bulk_error_status(exception):
+    """HTTP status to report for one failed bulk operation"""
+    if isinstance(exception, (LocalRateLimitError, CircuitOpenError)):
+        return 503
+    if isinstance(exception, BatchError) or not isinstance(exception, HttpError):
+        # The batch itself failed (a BatchError's resp is the 200 envelope)
+        # or never reached Google
+        return 502
+    return exception.resp.status
+
+
+def _encode_cursor(row):
+    """Encode the keyset position after a mirror row as an opaque cursor"""
+    payload = json.dumps([row.tasklist_id, row.position, row.task_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    """Decode a cursor from _encode_cursor; raises ValueError if it is malformed"""
+    try:
+        tasklist_id, position, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    return str(tasklist_id), str(position), str(task_id)
+
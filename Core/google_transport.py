@@ -0,0 +1,163 @@
+"""
+Keep-alive HTTP transports shared by the Google service clients.
+
+Building a client used to create a fresh ``httplib2.Http`` each time, so
+every request view paid new TCP and TLS handshakes to googleapis.com.
+httplib2 is not thread-safe, so instead of one global transport each worker
+thread keeps its own and reuses it for every client it builds; the fan-out
+pools in ``fanout`` keep their threads alive, so their connections stay warm.
+
+OAuth token refreshes go through a single ``requests`` session whose urllib3
+connection pool is safe to share between threads.
+
+With ``GOOGLE_FAKE_TRANSPORT`` set, clients and token refreshes get a
+``FakeHttp`` instead, which answers every call with an empty but
+well-formed response. That lets the sync worker and views run locally
+without reaching Google.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+import httplib2
+import requests
+from django.conf import settings
+from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp, Request as HttpLib2Request
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http() -> httplib2.Http:
+    """
+    Return the calling thread's keep-alive transport, creating it on first use.
+
+    A transport idle for longer than ``GOOGLE_HTTP_MAX_IDLE`` seconds is
+    replaced, since Google drops idle connections and reusing a dead socket
+    costs a failed round trip.
+    """
+    if getattr(settings, 'GOOGLE_FAKE_TRANSPORT', False):
+        return FakeHttp()
+
+    now = time.monotonic()
+    http = getattr(_local, 'http', None)
+    if http is not None and now - _local.last_used > getattr(settings, 'GOOGLE_HTTP_MAX_IDLE', 60):
+        _close(http)
+        http = None
+    if http is None:
+        http = httplib2.Http(timeout=getattr(settings, 'GOOGLE_HTTP_TIMEOUT', 10))
+        _local.http = http
+    _local.last_used = now
+    return http
+
+
+def authorized_http(credentials) -> AuthorizedHttp:
+    """Wrap this thread's transport with the given user's credentials"""
+    return AuthorizedHttp(credentials, http=get_http())
+
+
+class _RefreshRequest(Request):
+    """google-auth request that defaults to GOOGLE_HTTP_TIMEOUT instead of two minutes"""
+
+    def __call__(self, url, method='GET', body=None, headers=None, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = getattr(settings, 'GOOGLE_HTTP_TIMEOUT', 10)
+        return super().__call__(url, method=method, body=body, headers=headers, timeout=timeout, **kwargs)
+
+
+def get_refresh_request() -> Request:
+    """Return a google-auth transport request backed by the shared pooled session"""
+    if getattr(settings, 'GOOGLE_FAKE_TRANSPORT', False):
+        return HttpLib2Request(FakeHttp())
+
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = getattr(settings, 'GOOGLE_HTTP_POOL_SIZE', 10)
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+                _session = session
+    return _RefreshRequest(session=_session)
+
+
+def _close(http):
+    for connection in list(http.connections.values()):
+        try:
+            connection.close()
+        except Exception as exc:
+            logger.debug("Error closing idle Google connection: %s", exc)
+    http.connections.clear()
+
+
+def _fake_expiration():
+    """A push channel expiry a week out, in epoch milliseconds as Google returns it"""
+    return str(int((time.time() + 7 * 86400) * 1000))
+
+
+# (path pattern, response body or function returning one) pairs for FakeHttp,
+# checked in order
+FAKE_RESPONSES = [
+    (r'/token$', {'access_token': 'fake-access-token', 'expires_in': 3600, 'token_type': 'Bearer'}),
+    (r'/gmail/v1/users/[^/]+/watch$', lambda: {'historyId': '1', 'expiration': _fake_expiration()}),
+    (r'/calendar/v3/calendars/[^/]+/events/watch$', lambda: {
+        'kind': 'api#channel',
+        'resourceId': 'fake-resource',
+        'expiration': _fake_expiration(),
+    }),
+    (r'/calendar/v3/channels/stop$', {}),
+    (r'/gmail/v1/users/[^/]+/profile$', {'emailAddress': 'fake@example.com', 'historyId': '1'}),
+    (r'/gmail/v1/users/[^/]+/history$', {'history': [], 'historyId': '1'}),
+    (r'/gmail/v1/users/[^/]+/messages$', {'messages': [], 'resultSizeEstimate': 0}),
+    (r'/gmail/v1/users/[^/]+/labels$', {'labels': []}),
+    (r'/calendar/v3/users/me/calendarList$', {
+        'items': [{'id': 'primary', 'primary': True, 'summary': 'Calendar', 'selected': True}],
+    }),
+    (r'/calendar/v3/calendars/[^/]+/events$', {'items': [], 'nextSyncToken': 'fake-sync-token'}),
+    (r'/tasks/v1/users/@me/lists/[^/]+$', {'id': 'fake-task-list', 'title': 'My Tasks'}),
+    (r'/tasks/v1/users/@me/lists$', {'items': [{'id': 'fake-task-list', 'title': 'My Tasks'}]}),
+    (r'/tasks/v1/lists/[^/]+/tasks$', {'items': []}),
+]
+
+
+class FakeHttp:
+    """
+    Stand-in for httplib2.Http that never touches the network.
+
+    Reads return empty collections shaped like Google's responses; anything
+    else gets an empty object. ``GOOGLE_FAKE_TRANSPORT_LATENCY`` seconds are
+    slept per call to imitate a real round trip.
+    """
+
+    def __init__(self):
+        self.timeout = getattr(settings, 'GOOGLE_HTTP_TIMEOUT', 10)
+        self.connections = {}
+        self.redirect_codes = httplib2.REDIRECT_CODES
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        latency = getattr(settings, 'GOOGLE_FAKE_TRANSPORT_LATENCY', 0)
+        if latency:
+            time.sleep(latency)
+
+        path = urlparse(uri).path
+        payload = next((canned for pattern, canned in FAKE_RESPONSES if re.search(pattern, path)), {})
+        if callable(payload):
+            payload = payload()
+        if method == 'DELETE':
+            return httplib2.Response({'status': 204}), b''
+        response = httplib2.Response({'status': 200, 'content-type': 'application/json'})
+        return response, json.dumps(payload).encode()
+
+    def add_credentials(self, *args, **kwargs):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from django.utils import timezone
+
+from Core.gmail_service import GmailService
+from Core.google_calendar_service import GoogleCalendarService
+from Core.models import GmailSyncState
+from Core.sync_worker import active_users
+
+
+class Command(BaseCommand):
+    help = "Open or renew Gmail watches and Calendar push channels before they expire"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--active-days',
+            type=int,
+            default=getattr(settings, 'SYNC_WORKER_ACTIVE_DAYS', 7),
+            help='Only renew for users who logged in within this many days',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Renew every channel, even ones that are not close to expiring',
+        )
+        parser.add_argument(
+            '--fake-transport',
+            action='store_true',
+            help='Answer Google API calls with canned responses instead of the network',
+        )
+
+    def handle(self, *args, **options):
+        if options['fake_transport']:
+            settings.GOOGLE_FAKE_TRANSPORT = True
+
+        topic = getattr(settings, 'GMAIL_PUSH_TOPIC', '')
+        base_url = getattr(settings, 'GOOGLE_PUSH_BASE_URL', '')
+        address = base_url.rstrip('/') + reverse('calendar_push') if base_url else ''
+        if not topic:
+            self.stdout.write(self.style.WARNING('GMAIL_PUSH_TOPIC is not set; skipping Gmail watches'))
+        if not address.startswith('https://'):
+            self.stdout.write(self.style.WARNING('GOOGLE_PUSH_BASE_URL is not an HTTPS URL; skipping Calendar channels'))
+            address = ''
+
+        renew_before = timezone.now() + timedelta(seconds=getattr(settings, 'GOOGLE_PUSH_RENEW_BEFORE', 86400))
+        if options['force']:
+            renew_before = timezone.now() + timedelta(days=365)
+
+        watches = channels = failures = 0
+        for user in active_users(options['active_days']):
+            try:
+                if topic:
+                    state = GmailSyncState.objects.filter(user=user).first()
+                    if not state or not state.watch_expires_at or state.watch_expires_at <= renew_before:
+                        gmail_service = GmailService(user)
+                        if gmail_service.service:
+                            gmail_service.watch(topic)
+                            watches += 1
+                if address:
+                    calendar_service = GoogleCalendarService(user)
+                    if calendar_service.service:
+                        channels += calendar_service.renew_channels(address, renew_before)
+            except Exception as e:
+                failures += 1
+                self.stderr.write(f"Failed to renew push channels for {user.email}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Renewed {watches} Gmail watch(es) and {channels} Calendar channel(s); {failures} user(s) failed"
+        ))
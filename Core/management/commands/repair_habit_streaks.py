@@ -0,0 +1,68 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from Core.models import STREAK_FIELDS, Habit, HabitCompletion
+
+
+class Command(BaseCommand):
+    help = "Recompute every habit's stored streak counters from its completions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-id',
+            type=int,
+            help='Only repair habits belonging to this user',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Habits loaded and updated per batch',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report habits whose counters are wrong without saving',
+        )
+
+    def handle(self, *args, **options):
+        habits = Habit.objects.order_by('pk')
+        if options['user_id']:
+            habits = habits.filter(user_id=options['user_id'])
+
+        checked = repaired = 0
+        last_pk = 0
+        while True:
+            batch = list(habits.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            # One query for the whole batch's completion dates
+            dates = defaultdict(list)
+            completions = (
+                HabitCompletion.objects.filter(habit_id__in=[habit.pk for habit in batch], completed=True)
+                .order_by('habit_id', 'date')
+                .values_list('habit_id', 'date')
+            )
+            for habit_id, date in completions:
+                dates[habit_id].append(date)
+
+            changed = []
+            for habit in batch:
+                counters = Habit.counters_from_dates(dates[habit.pk])
+                if counters != tuple(getattr(habit, field) for field in STREAK_FIELDS):
+                    for field, value in zip(STREAK_FIELDS, counters):
+                        setattr(habit, field, value)
+                    changed.append(habit)
+
+            checked += len(batch)
+            repaired += len(changed)
+            if changed and not options['dry_run']:
+                with transaction.atomic():
+                    Habit.objects.bulk_update(changed, STREAK_FIELDS)
+
+        verb = 'would be repaired' if options['dry_run'] else 'repaired'
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} habit(s); {repaired} {verb}"))
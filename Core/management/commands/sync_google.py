@@ -0,0 +1,63 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Core.sync_worker import SOURCES, SyncScheduler
+
+
+class Command(BaseCommand):
+    help = "Keep active users' Gmail, Calendar and Tasks mirrors fresh in the background"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Number of concurrent sync jobs (default: SYNC_WORKER_MAX_WORKERS)',
+        )
+        parser.add_argument(
+            '--active-days',
+            type=int,
+            help='Only sync users who logged in within this many days (default: SYNC_WORKER_ACTIVE_DAYS)',
+        )
+        parser.add_argument(
+            '--source',
+            action='append',
+            choices=sorted(SOURCES),
+            help='Sync only this source; may be repeated (default: all)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Sync everything that is due once, then exit',
+        )
+        parser.add_argument(
+            '--fake-transport',
+            action='store_true',
+            help='Answer Google API calls with canned empty responses instead of the network',
+        )
+
+    def handle(self, *args, **options):
+        if options['fake_transport']:
+            settings.GOOGLE_FAKE_TRANSPORT = True
+            self.stdout.write(self.style.WARNING('Using the fake Google transport; no data will be fetched'))
+
+        scheduler = SyncScheduler(
+            workers=options['workers'],
+            active_days=options['active_days'],
+            sources=options['source'],
+        )
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+        self.stdout.write(f"Sync worker started with {scheduler.workers} workers")
+        try:
+            scheduler.run(once=options['once'], stop_event=stop)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stdout.write("Waiting for running sync jobs to finish...")
+            scheduler.shutdown()
+        self.stdout.write(self.style.SUCCESS("Sync worker stopped"))
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.7 on 2026-10-17 02:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Core', '0002_goal_achievement_habit_timetracking_habitcompletion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GmailSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('history_id', models.CharField(blank=True, max_length=32)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('last_full_sync_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='gmail_sync_state', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GmailMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_id', models.CharField(max_length=64)),
+                ('thread_id', models.CharField(blank=True, max_length=64)),
+                ('subject', models.CharField(blank=True, max_length=1000)),
+                ('sender', models.CharField(blank=True, max_length=500)),
+                ('snippet', models.TextField(blank=True)),
+                ('date', models.DateTimeField()),
+                ('label_ids', models.JSONField(blank=True, default=list)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gmail_messages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['user', '-date'], name='Core_gmailm_user_id_bcbfe0_idx')],
+                'unique_together': {('user', 'message_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.7 on 2026-10-17 02:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Core', '0003_gmailsyncstate_gmailmessage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calendar_id', models.CharField(max_length=255)),
+                ('event_id', models.CharField(max_length=255)),
+                ('title', models.CharField(blank=True, max_length=1000)),
+                ('description', models.TextField(blank=True)),
+                ('location', models.CharField(blank=True, max_length=1000)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('start_raw', models.CharField(max_length=64)),
+                ('end_raw', models.CharField(max_length=64)),
+                ('all_day', models.BooleanField(default=False)),
+                ('attendees', models.JSONField(blank=True, default=list)),
+                ('html_link', models.CharField(blank=True, max_length=1000)),
+                ('color_id', models.CharField(blank=True, max_length=16)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['start'],
+                'indexes': [models.Index(fields=['user', 'start'], name='Core_calend_user_id_f5c010_idx')],
+                'unique_together': {('user', 'calendar_id', 'event_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CalendarSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calendar_id', models.CharField(max_length=255)),
+                ('sync_token', models.CharField(blank=True, max_length=512)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('last_full_sync_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_sync_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'calendar_id')},
+            },
+        ),
+    ]
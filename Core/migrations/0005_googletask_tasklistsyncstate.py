@@ -0,0 +1,49 @@
+# Generated by Django 5.0.7 on 2026-10-17 02:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Core', '0004_calendarevent_calendarsyncstate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoogleTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tasklist_id', models.CharField(max_length=255)),
+                ('task_id', models.CharField(max_length=255)),
+                ('position', models.CharField(blank=True, max_length=64)),
+                ('updated', models.DateTimeField(blank=True, null=True)),
+                ('data', models.JSONField(default=dict)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='google_tasks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['position'],
+                'indexes': [models.Index(fields=['user', 'tasklist_id', 'position'], name='Core_google_user_id_fe2002_idx')],
+                'unique_together': {('user', 'tasklist_id', 'task_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TaskListSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tasklist_id', models.CharField(max_length=255)),
+                ('is_default', models.BooleanField(default=False)),
+                ('updated_min', models.DateTimeField(blank=True, null=True)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('last_full_sync_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_sync_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'tasklist_id')},
+            },
+        ),
+    ]
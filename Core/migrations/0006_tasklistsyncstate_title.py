@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-17 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Core', '0005_googletask_tasklistsyncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tasklistsyncstate',
+            name='title',
+            field=models.CharField(blank=True, max_length=1024),
+        ),
+    ]
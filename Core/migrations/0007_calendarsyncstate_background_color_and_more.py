@@ -0,0 +1,28 @@
+# Generated by Django 5.0.7 on 2026-10-17 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Core', '0006_tasklistsyncstate_title'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarsyncstate',
+            name='background_color',
+            field=models.CharField(blank=True, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='calendarsyncstate',
+            name='selected',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='calendarsyncstate',
+            name='summary',
+            field=models.CharField(blank=True, max_length=1000),
+        ),
+    ]
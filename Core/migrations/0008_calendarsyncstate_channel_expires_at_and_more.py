@@ -0,0 +1,43 @@
+# Generated by Django 5.0.7 on 2026-10-17 02:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Core', '0007_calendarsyncstate_background_color_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarsyncstate',
+            name='channel_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='calendarsyncstate',
+            name='channel_id',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='calendarsyncstate',
+            name='channel_resource_id',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='calendarsyncstate',
+            name='channel_token',
+            field=models.CharField(blank=True, max_length=128),
+        ),
+        migrations.AddField(
+            model_name='gmailsyncstate',
+            name='email_address',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='gmailsyncstate',
+            name='watch_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.0.7 on 2026-10-17 02:58
+
+from django.db import migrations, models
+
+
+def backfill_streaks(apps, schema_editor):
+    """Fill the new counters from existing completions"""
+    Habit = apps.get_model('Core', 'Habit')
+    HabitCompletion = apps.get_model('Core', 'HabitCompletion')
+
+    counters = {}
+    completions = (
+        HabitCompletion.objects.filter(completed=True)
+        .order_by('habit_id', 'date')
+        .values_list('habit_id', 'date')
+    )
+    for habit_id, date in completions.iterator():
+        current, longest, previous, total = counters.get(habit_id, (0, 0, None, 0))
+        current = current + 1 if previous is not None and (date - previous).days == 1 else 1
+        counters[habit_id] = (current, max(longest, current), date, total + 1)
+
+    habits = list(Habit.objects.filter(pk__in=counters))
+    for habit in habits:
+        (
+            habit.current_streak,
+            habit.longest_streak,
+            habit.last_completed_date,
+            habit.total_completions,
+        ) = counters[habit.pk]
+    Habit.objects.bulk_update(
+        habits,
+        ['current_streak', 'longest_streak', 'last_completed_date', 'total_completions'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Core', '0008_calendarsyncstate_channel_expires_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='current_streak',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='last_completed_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='longest_streak',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='total_completions',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_streaks, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from datetime import timedelta
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 import uuid
@@ -112,6 +114,12 @@ class Habit(models.Model):
     color = models.CharField(max_length=20, default='blue', blank=True)  # For UI display
     icon = models.CharField(max_length=50, default='star', blank=True)  # Icon name
     is_active = models.BooleanField(default=True)
+    # Streak counters maintained by HabitCompletion.save/delete;
+    # manage.py repair_habit_streaks rebuilds them in bulk
+    current_streak = models.IntegerField(default=0)  # Run ending on last_completed_date
+    longest_streak = models.IntegerField(default=0)
+    last_completed_date = models.DateField(null=True, blank=True)
+    total_completions = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -121,48 +129,63 @@ class Habit(models.Model):
     def __str__(self):
         return f"{self.name} - {self.user.username}"
     
-    @property
-    def current_streak(self):
-        """Calculate current streak in days"""
-        completions = self.completions.filter(completed=True).order_by('-date')
-        if not completions.exists():
-            return 0
-        
-        streak = 0
-        today = timezone.now().date()
-        current_date = today
-        
-        for completion in completions:
-            if completion.date == current_date:
-                streak += 1
-                current_date = current_date - timezone.timedelta(days=1)
-            elif completion.date < current_date:
-                break
-        
-        return streak
+    @staticmethod
+    def counters_from_dates(dates):
+        """
+        Streak counters from ascending completion dates: (current streak,
+        longest streak, last completed date, total completions), where the
+        current streak is the run ending on the last completed date.
+        """
+        current = longest = total = 0
+        previous = None
+        for date in dates:
+            current = current + 1 if previous is not None and (date - previous).days == 1 else 1
+            longest = max(longest, current)
+            total += 1
+            previous = date
+        return current, longest, previous, total
     
-    @property
-    def longest_streak(self):
-        """Calculate longest streak ever"""
-        completions = self.completions.filter(completed=True).order_by('date')
-        if not completions.exists():
-            return 0
-        
-        max_streak = 0
-        current_streak = 0
-        prev_date = None
-        
-        for completion in completions:
-            if prev_date is None:
-                current_streak = 1
-            elif (completion.date - prev_date).days == 1:
-                current_streak += 1
-            else:
-                max_streak = max(max_streak, current_streak)
-                current_streak = 1
-            prev_date = completion.date
+    def streak_as_of(self, day):
+        """Current streak as seen on ``day``; the latest run only counts if it reaches that day"""
+        return self.current_streak if self.last_completed_date == day else 0
+    
+    def recompute_streaks(self, save=True):
+        """Rebuild the stored counters from this habit's completions"""
+        dates = self.completions.filter(completed=True).order_by('date').values_list('date', flat=True)
+        (
+            self.current_streak,
+            self.longest_streak,
+            self.last_completed_date,
+            self.total_completions,
+        ) = self.counters_from_dates(dates)
+        if save:
+            self.save(update_fields=STREAK_FIELDS)
+    
+    def apply_completion(self, date, completed):
+        """
+        Update the stored counters for one day's completion switching on or off.
         
-        return max(max_streak, current_streak)
+        Extending or trimming the latest run is done in place. Anything else
+        (backfilling an earlier day, or trimming what may be the longest run)
+        is rebuilt from the completions.
+        """
+        last = self.last_completed_date
+        if completed and (last is None or date > last):
+            self.current_streak = self.current_streak + 1 if last == date - timedelta(days=1) else 1
+            self.longest_streak = max(self.longest_streak, self.current_streak)
+            self.last_completed_date = date
+            self.total_completions += 1
+        elif not completed and date == last and 1 < self.current_streak < self.longest_streak:
+            self.current_streak -= 1
+            self.last_completed_date = date - timedelta(days=1)
+            self.total_completions -= 1
+        else:
+            self.recompute_streaks(save=False)
+        self.save(update_fields=STREAK_FIELDS)
+
+
+# Denormalized counters kept current by HabitCompletion writes
+STREAK_FIELDS = ['current_streak', 'longest_streak', 'last_completed_date', 'total_completions']
 
 
 class HabitCompletion(models.Model):
@@ -177,4 +200,163 @@ class HabitCompletion(models.Model):
         ordering = ['-date']
     
     def __str__(self):
-        return f"{self.habit.name} - {self.date} - {'Completed' if self.completed else 'Missed'}"
\ No newline at end of file
+        return f"{self.habit.name} - {self.date} - {'Completed' if self.completed else 'Missed'}"
+    
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = HabitCompletion.objects.filter(pk=self.pk).values_list('completed', 'date').first()
+            super().save(*args, **kwargs)
+            
+            was_completed, old_date = previous or (False, self.date)
+            if old_date != self.date:
+                # Moving a completion to another day touches two runs at once
+                self._locked_habit().recompute_streaks()
+            elif was_completed != self.completed:
+                self._locked_habit().apply_completion(self.date, self.completed)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            if self.completed:
+                self._locked_habit().apply_completion(self.date, False)
+        return result
+    
+    def _locked_habit(self):
+        # Serialize concurrent toggles of the same habit's counters
+        return Habit.objects.select_for_update().get(pk=self.habit_id)
+
+class GmailMessage(models.Model):
+    """Local copy of an inbox message's metadata, kept current by GmailService.sync"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='gmail_messages')
+    message_id = models.CharField(max_length=64)
+    thread_id = models.CharField(max_length=64, blank=True)
+    subject = models.CharField(max_length=1000, blank=True)
+    sender = models.CharField(max_length=500, blank=True)
+    snippet = models.TextField(blank=True)
+    date = models.DateTimeField()
+    label_ids = models.JSONField(default=list, blank=True)
+    synced_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['user', 'message_id']
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['user', '-date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} - {self.user.username}"
+
+
+class GmailSyncState(models.Model):
+    """Where a user's Gmail mirror left off in the mailbox history"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='gmail_sync_state')
+    history_id = models.CharField(max_length=32, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)  # None marks the mirror dirty
+    last_full_sync_at = models.DateTimeField(null=True, blank=True)
+    # Gmail watch (Pub/Sub push): notifications name the mailbox address
+    email_address = models.CharField(max_length=255, blank=True, db_index=True)
+    watch_expires_at = models.DateTimeField(null=True, blank=True)
+    
+    @property
+    def push_active(self):
+        return bool(self.watch_expires_at and self.watch_expires_at > timezone.now())
+    
+    def __str__(self):
+        return f"Gmail sync for {self.user.username} at {self.history_id or 'never'}"
+
+
+class CalendarEvent(models.Model):
+    """Local copy of a Google Calendar event, kept current with sync tokens"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='calendar_events')
+    calendar_id = models.CharField(max_length=255)
+    event_id = models.CharField(max_length=255)
+    title = models.CharField(max_length=1000, blank=True)
+    description = models.TextField(blank=True)
+    location = models.CharField(max_length=1000, blank=True)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    start_raw = models.CharField(max_length=64)  # As Google sent it: a dateTime, or a date for all-day events
+    end_raw = models.CharField(max_length=64)
+    all_day = models.BooleanField(default=False)
+    attendees = models.JSONField(default=list, blank=True)
+    html_link = models.CharField(max_length=1000, blank=True)
+    color_id = models.CharField(max_length=16, blank=True)
+    synced_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['user', 'calendar_id', 'event_id']
+        ordering = ['start']
+        indexes = [
+            models.Index(fields=['user', 'start']),
+        ]
+    
+    def __str__(self):
+        return f"{self.title} - {self.start}"
+
+
+class CalendarSyncState(models.Model):
+    """The sync token and display metadata for one of a user's calendars"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='calendar_sync_states')
+    calendar_id = models.CharField(max_length=255)
+    summary = models.CharField(max_length=1000, blank=True)
+    background_color = models.CharField(max_length=16, blank=True)
+    selected = models.BooleanField(default=True)  # Shown in the user's Google Calendar UI
+    sync_token = models.CharField(max_length=512, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)  # None marks the calendar dirty
+    last_full_sync_at = models.DateTimeField(null=True, blank=True)
+    # Push notification channel watching this calendar's events
+    channel_id = models.CharField(max_length=64, blank=True, db_index=True)
+    channel_token = models.CharField(max_length=128, blank=True)
+    channel_resource_id = models.CharField(max_length=255, blank=True)
+    channel_expires_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        unique_together = ['user', 'calendar_id']
+    
+    @property
+    def push_active(self):
+        return bool(self.channel_expires_at and self.channel_expires_at > timezone.now())
+    
+    def __str__(self):
+        return f"Calendar sync for {self.user.username}: {self.calendar_id}"
+
+
+class GoogleTask(models.Model):
+    """Local copy of a Google Tasks task; data holds the resource as Google returned it"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='google_tasks')
+    tasklist_id = models.CharField(max_length=255)
+    task_id = models.CharField(max_length=255)
+    position = models.CharField(max_length=64, blank=True)
+    updated = models.DateTimeField(null=True, blank=True)
+    data = models.JSONField(default=dict)
+    synced_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['user', 'tasklist_id', 'task_id']
+        ordering = ['position']
+        indexes = [
+            models.Index(fields=['user', 'tasklist_id', 'position']),
+        ]
+    
+    def __str__(self):
+        return f"{self.data.get('title', 'Untitled')} - {self.user.username}"
+
+
+class TaskListSyncState(models.Model):
+    """How far a user's copy of one task list has been synced"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='task_sync_states')
+    tasklist_id = models.CharField(max_length=255)
+    title = models.CharField(max_length=1024, blank=True)
+    is_default = models.BooleanField(default=False)
+    updated_min = models.DateTimeField(null=True, blank=True)  # Newest 'updated' seen; next delta starts here
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    last_full_sync_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        unique_together = ['user', 'tasklist_id']
+    
+    def __str__(self):
+        return f"Task sync for {self.user.username}: {self.tasklist_id}"
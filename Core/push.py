@@ -0,0 +1,102 @@
+"""
+Receivers for Google push notifications.
+
+Gmail delivers mailbox changes through a Cloud Pub/Sub push subscription,
+and Calendar through per-calendar web_hook channels. Neither notification
+carries the changed data. Each one only marks the matching mirror dirty
+(``last_synced_at = None``), drops the user's cached API responses and tells
+their open tabs to refetch. The next read or background sync then pulls just
+the changes through the usual history/syncToken delta sync.
+
+Recorded notifications can be replayed locally, for example::
+
+    curl -X POST 'http://localhost:8000/api/push/gmail/?token=<GMAIL_PUSH_VERIFICATION_TOKEN>' \\
+        -H 'Content-Type: application/json' \\
+        -d '{"message": {"data": "eyJlbWFpbEFkZHJlc3MiOiAidXNlckBleGFtcGxlLmNvbSIsICJoaXN0b3J5SWQiOiAiOTg3NiJ9",
+             "messageId": "1"}, "subscription": "projects/p/subscriptions/gmail"}'
+
+    curl -X POST http://localhost:8000/api/push/calendar/ \\
+        -H 'X-Goog-Channel-ID: <channel_id>' -H 'X-Goog-Channel-Token: <channel_token>' \\
+        -H 'X-Goog-Resource-ID: <channel_resource_id>' -H 'X-Goog-Resource-State: exists'
+"""
+import base64
+import binascii
+import hmac
+import json
+import logging
+
+from django.conf import settings
+
+from .events import publish
+from .models import CalendarSyncState, GmailSyncState
+from .response_cache import invalidate
+
+logger = logging.getLogger(__name__)
+
+
+class PushVerificationError(Exception):
+    """A notification's token or resource does not match what we registered"""
+
+
+def handle_gmail_notification(envelope, token):
+    """
+    Mark Gmail mirrors dirty for a Pub/Sub push of a Gmail watch notification.
+
+    ``token`` must equal ``GMAIL_PUSH_VERIFICATION_TOKEN``, which is set as a
+    query parameter on the subscription's push endpoint. Notifications older
+    than the mirror's current historyId are ignored. Returns how many mirrors
+    were marked.
+    """
+    expected = getattr(settings, 'GMAIL_PUSH_VERIFICATION_TOKEN', '')
+    if not expected or not hmac.compare_digest(token or '', expected):
+        raise PushVerificationError('Invalid Pub/Sub verification token')
+
+    try:
+        data = json.loads(base64.b64decode(envelope['message']['data']))
+        address = data['emailAddress']
+        history_id = int(data['historyId'])
+    except (KeyError, TypeError, ValueError, binascii.Error) as e:
+        raise ValueError(f'Malformed Gmail notification: {e}')
+
+    marked = 0
+    for state in GmailSyncState.objects.filter(email_address__iexact=address):
+        if state.history_id and int(state.history_id) >= history_id:
+            continue
+        GmailSyncState.objects.filter(pk=state.pk).update(last_synced_at=None)
+        invalidate('emails', state.user_id)
+        publish(state.user_id, 'emails', 'changed')
+        marked += 1
+
+    logger.info(f"Gmail notification for {address} at history {history_id}: {marked} mirror(s) marked dirty")
+    return marked
+
+
+def handle_calendar_notification(headers):
+    """
+    Mark one calendar dirty for a Calendar channel notification.
+
+    The channel ID locates the calendar; its token and resource ID must match
+    the ones stored when the channel was opened. Returns False for the 'sync'
+    handshake Google sends when a channel starts, True otherwise. Raises
+    LookupError for channels we do not know.
+    """
+    channel_id = headers.get('X-Goog-Channel-ID', '')
+    state = CalendarSyncState.objects.filter(channel_id=channel_id).first() if channel_id else None
+    if state is None:
+        raise LookupError(f'Unknown calendar channel {channel_id!r}')
+
+    if not hmac.compare_digest(headers.get('X-Goog-Channel-Token', ''), state.channel_token):
+        raise PushVerificationError('Invalid calendar channel token')
+
+    resource_state = headers.get('X-Goog-Resource-State', '')
+    if resource_state == 'sync':
+        return False
+
+    if headers.get('X-Goog-Resource-ID', '') != state.channel_resource_id:
+        raise PushVerificationError('Calendar notification for an unexpected resource')
+
+    CalendarSyncState.objects.filter(pk=state.pk).update(last_synced_at=None)
+    invalidate('calendar', state.user_id)
+    publish(state.user_id, 'calendar', 'changed', calendar_id=state.calendar_id)
+    logger.info(f"Calendar notification ({resource_state}) marked {state.calendar_id} dirty for user {state.user_id}")
+    return True
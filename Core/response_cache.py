@@ -0,0 +1,155 @@
+"""
+Per-user stale-while-revalidate cache for the Google-backed JSON endpoints.
+
+A cached response younger than its section's TTL (``API_CACHE_TTLS``) is
+served as is. Within the following ``API_CACHE_STALE_WINDOW`` seconds it is
+still served immediately while a background refresh replaces it; after
+that the view runs inline again. Both sync and async views can be wrapped.
+Every cached response carries an ETag so
+browsers revalidate with If-None-Match and get a 304 when nothing changed.
+
+Writes invalidate a section for one user by bumping a version number that is
+part of every cache key, which drops all query-string variants at once.
+
+Entries live in Django's default cache. The local-memory backend configured
+out of the box is private to each process, so a write handled by one web
+process, or a push received while ``sync_google`` runs separately, only
+invalidates that process's copy; the others keep serving theirs until the
+TTL runs out. Deployments with more than one process point ``CACHES`` at a
+shared backend such as Redis, Memcached or the database cache.
+"""
+from functools import wraps
+import hashlib
+import logging
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from .fanout import submit
+
+logger = logging.getLogger(__name__)
+
+# How long a background refresh may hold its lock before another is allowed
+REFRESH_LOCK_TIMEOUT = 60
+
+
+def swr_cache(section):
+    """Cache a GET view's successful JSON responses per user and query string"""
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                key = await sync_to_async(_cache_key)(section, request)
+                entry = await cache.aget(key)
+                if entry is None:
+                    response = await view(request, *args, **kwargs)
+                    entry = await sync_to_async(_store)(key, section, response)
+                    if entry is None:
+                        return response
+                elif time.time() - entry['stored_at'] >= _ttl(section):
+                    await sync_to_async(_refresh_in_background)(key, section, view, request, args, kwargs)
+                return _respond(request, entry)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = _cache_key(section, request)
+            entry = cache.get(key)
+            if entry is None:
+                response = view(request, *args, **kwargs)
+                entry = _store(key, section, response)
+                if entry is None:
+                    return response
+            elif time.time() - entry['stored_at'] >= _ttl(section):
+                _refresh_in_background(key, section, view, request, args, kwargs)
+            return _respond(request, entry)
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate(section, user_id):
+    """Drop every cached response for ``section`` belonging to one user"""
+    version_key = _version_key(section, user_id)
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        # No version yet means nothing cached under a version other than 1
+        cache.set(version_key, 2, timeout=None)
+
+
+def _respond(request, entry):
+    if entry['etag'] in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    # Let the browser keep a copy but always revalidate it with us
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _store(key, section, response):
+    """Cache a successful response; return the stored entry, or None if it was not cacheable"""
+    if response.status_code != 200 or getattr(response, 'streaming', False):
+        return None
+    entry = {
+        'content': response.content,
+        'content_type': response.get('Content-Type', 'application/json'),
+        'etag': '"%s"' % hashlib.md5(response.content).hexdigest(),
+        'stored_at': time.time(),
+    }
+    timeout = _ttl(section) + getattr(settings, 'API_CACHE_STALE_WINDOW', 300)
+    cache.set(key, entry, timeout=timeout)
+    return entry
+
+
+def _refresh_in_background(key, section, view, request, args, kwargs):
+    """Re-run the view off the request thread, once per key at a time"""
+    lock_key = f'{key}:refreshing'
+    if not cache.add(lock_key, True, timeout=REFRESH_LOCK_TIMEOUT):
+        return
+
+    # The original request belongs to its worker; hand the view a minimal copy
+    refresh_request = HttpRequest()
+    refresh_request.method = 'GET'
+    refresh_request.path = request.path
+    refresh_request.GET = request.GET.copy()
+    refresh_request.user = request.user
+
+    if iscoroutinefunction(view):
+        view = async_to_sync(view)
+
+    def run():
+        try:
+            _store(key, section, view(refresh_request, *args, **kwargs))
+        except Exception as e:
+            logger.error(f"Background refresh of {section} failed: {e}", exc_info=True)
+        finally:
+            cache.delete(lock_key)
+
+    # Async views await Google fetches on the 'google' pool; running their
+    # refresh there too could leave every slot waiting on work queued behind it
+    submit(run, pool='swr')
+
+
+def _cache_key(section, request):
+    user_id = request.user.pk
+    version = cache.get(_version_key(section, user_id)) or 1
+    query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+    return f'api:{section}:{user_id}:{version}:{query}'
+
+
+def _version_key(section, user_id):
+    return f'api:{section}:{user_id}:version'
+
+
+def _ttl(section):
+    return getattr(settings, 'API_CACHE_TTLS', {}).get(section, 30)
@@ -1,5 +1,9 @@
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from allauth.account.signals import user_signed_up
+from allauth.socialaccount.models import SocialToken
+
+from .google_client import invalidate_credentials
 
 @receiver(user_signed_up)
 def handle_user_signed_up(request, sociallogin, user, **kwargs):
@@ -17,4 +21,11 @@ def handle_user_signed_up(request, sociallogin, user, **kwargs):
     # You can perform additional tasks here, like:
     # - Send welcome email
     # - Create user profile
-    # - Log analytics event
\ No newline at end of file
+    # - Log analytics event
+
+
+@receiver(post_save, sender=SocialToken)
+@receiver(post_delete, sender=SocialToken)
+def handle_social_token_changed(sender, instance, **kwargs):
+    # A new login stores a fresh token; drop any cached credentials for the user
+    invalidate_credentials(instance.account.user_id)
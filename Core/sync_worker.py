@@ -0,0 +1,286 @@
+"""
+Background refresh of the Gmail, Calendar and Tasks mirrors.
+
+``SyncScheduler`` keeps one job per (user, source) in a priority queue keyed
+by when the job is next due, with recently active users first among jobs due
+at the same moment. Jobs run on a bounded thread pool and write straight into
+the mirror tables the views read from. The worker re-syncs each source a
+little before the views would consider it stale (``SYNC_WORKER_LEAD``), so
+requests normally find fresh data and never wait on Google.
+
+Users who have not logged in recently are refreshed less often, and every
+due time is jittered so users don't all hit Google at once.
+
+Most Google traffic comes from this process, so it logs the quota counters
+from ``google_quota.quota_stats`` every ``SYNC_WORKER_STATS_INTERVAL``
+seconds and when it stops.
+"""
+import heapq
+import logging
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .gmail_service import GmailService
+from .google_calendar_service import GoogleCalendarService
+from .google_quota import quota_stats
+from .google_tasks_service import GoogleTasksService
+from .models import CalendarSyncState, GmailSyncState, TaskListSyncState
+
+logger = logging.getLogger(__name__)
+
+
+def sync_gmail(user):
+    service = GmailService(user)
+    if service.service:
+        service.sync()
+
+
+def sync_calendar(user):
+    service = GoogleCalendarService(user)
+    if service.service:
+        # Calendars and lists that are still fresh, or covered by push, are skipped
+        service.sync_all(lead=getattr(settings, 'SYNC_WORKER_LEAD', 0.8))
+
+
+def sync_tasks(user):
+    service = GoogleTasksService(user)
+    if service.service:
+        service.sync_all(lead=getattr(settings, 'SYNC_WORKER_LEAD', 0.8))
+
+
+def active_users(days):
+    """Users with a Google token who logged in within ``days`` days"""
+    cutoff = timezone.now() - timedelta(days=days)
+    return User.objects.filter(
+        last_login__gte=cutoff,
+        socialaccount__socialtoken__isnull=False,
+    ).distinct()
+
+
+# source -> (sync function, interval setting, default interval, sync state
+# model, push channel expiry field or None if Google offers no push for it)
+SOURCES = {
+    'gmail': (sync_gmail, 'GMAIL_SYNC_INTERVAL', 60, GmailSyncState, 'watch_expires_at'),
+    'calendar': (sync_calendar, 'CALENDAR_SYNC_INTERVAL', 60, CalendarSyncState, 'channel_expires_at'),
+    'tasks': (sync_tasks, 'TASKS_SYNC_INTERVAL', 30, TaskListSyncState, None),
+}
+
+# Sync state rows each source actually syncs; hidden calendars never are
+SOURCE_FILTERS = {
+    'calendar': {'selected': True},
+}
+
+
+class SyncScheduler:
+    def __init__(self, workers=None, active_days=None, sources=None):
+        self.workers = workers or getattr(settings, 'SYNC_WORKER_MAX_WORKERS', 4)
+        self.active_days = active_days or getattr(settings, 'SYNC_WORKER_ACTIVE_DAYS', 7)
+        self.sources = sources or list(SOURCES)
+        self._queue = []
+        self._queued = {}
+        self._running = {}
+        self._failures = {}
+        self._users = {}
+        self._pushed = set()
+        self._users_loaded_at = None
+        self._scheduled_at = None
+        self._stats_logged_at = time.monotonic()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='google-sync')
+
+    def run(self, once=False, stop_event=None):
+        """
+        Run the loop until ``stop_event`` is set.
+
+        With ``once`` every active user's sources that are currently due are
+        synced a single time and the call returns when they finish.
+        """
+        self.load_users()
+        if once:
+            self.start_due_jobs(bounded=False)
+            while self._running:
+                self.collect(timeout=None)
+            return
+
+        refresh_every = getattr(settings, 'SYNC_WORKER_USER_REFRESH', 60)
+        dirty_check_every = getattr(settings, 'SYNC_WORKER_DIRTY_CHECK', 5)
+        stats_every = getattr(settings, 'SYNC_WORKER_STATS_INTERVAL', 300)
+        while not (stop_event and stop_event.is_set()):
+            if time.monotonic() - self._stats_logged_at >= stats_every:
+                self.log_quota_stats()
+            if time.monotonic() - self._users_loaded_at >= refresh_every:
+                self.load_users()
+            elif time.monotonic() - self._scheduled_at >= dirty_check_every:
+                self.schedule()
+            self.start_due_jobs()
+            if len(self._running) >= self.workers:
+                # Nothing more can start until a job finishes
+                self.collect(timeout=1.0)
+            else:
+                self.collect(timeout=self._seconds_until_next_due())
+
+    def shutdown(self, wait_for_jobs=True):
+        self._executor.shutdown(wait=wait_for_jobs, cancel_futures=True)
+        self.log_quota_stats()
+
+    def log_quota_stats(self):
+        """Log this process's Google API usage since it started"""
+        self._stats_logged_at = time.monotonic()
+        for api, counters in sorted(quota_stats().items()):
+            usage = ', '.join(f'{name}={value}' for name, value in sorted(counters.items()))
+            logger.info(f"Google {api} usage: {usage}")
+
+    def load_users(self):
+        """Pick up newly active users and schedule their sources"""
+        close_old_connections()
+        self._users = {user.pk: user for user in active_users(self.active_days)}
+        self._users_loaded_at = time.monotonic()
+        self.schedule()
+
+    def schedule(self):
+        """
+        Queue sources that are not queued yet, and move dirty ones to the front.
+
+        A mirror is dirty when it has never synced or a push notification
+        cleared its ``last_synced_at``; those run straight away.
+        """
+        self._scheduled_at = time.monotonic()
+        now = time.time()
+        for source in self.sources:
+            status = self._sync_status(source)
+            for user_id in self._users:
+                key = (user_id, source)
+                if self._is_running(user_id, source):
+                    continue
+                synced_at, dirty, pushed = status.get(user_id, (None, True, False))
+                if pushed:
+                    self._pushed.add(key)
+                else:
+                    self._pushed.discard(key)
+                if (dirty or not synced_at) and key not in self._failures:
+                    if self._queued.get(key, now + 1) > now:
+                        self._push(user_id, source, now, jitter=False)
+                elif key not in self._queued and synced_at:
+                    self._push(user_id, source, synced_at.timestamp() + self._interval(user_id, source))
+
+    def start_due_jobs(self, bounded=True):
+        """
+        Submit due jobs, most overdue first.
+
+        When ``bounded`` only as many jobs as there are workers are in flight,
+        so the rest stay in priority order instead of the pool's FIFO queue.
+        """
+        now = time.time()
+        while self._queue and self._queue[0][0] <= now:
+            if bounded and len(self._running) >= self.workers:
+                break
+            due, _, user_id, source = heapq.heappop(self._queue)
+            if self._queued.get((user_id, source)) != due:
+                # Superseded by an earlier rescheduling of the same job
+                continue
+            del self._queued[(user_id, source)]
+            user = self._users.get(user_id)
+            if user is None:
+                # No longer active; dropped until they log in again
+                continue
+            future = self._executor.submit(self._run_job, user, source)
+            self._running[future] = (user_id, source)
+
+    def collect(self, timeout):
+        """Wait for running jobs to finish (up to ``timeout``) and schedule their next run"""
+        if not self._running:
+            if timeout:
+                time.sleep(timeout)
+            return
+
+        done, _ = wait(list(self._running), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            user_id, source = self._running.pop(future)
+            key = (user_id, source)
+            interval = self._interval(user_id, source)
+            if future.result():
+                self._failures.pop(key, None)
+            else:
+                # Back off a failing user/source, up to ten intervals
+                self._failures[key] = self._failures.get(key, 0) + 1
+                interval *= min(2 ** self._failures[key], 10)
+            if user_id in self._users:
+                self._push(user_id, source, time.time() + interval)
+
+    def _run_job(self, user, source):
+        """Run one sync; returns whether it succeeded"""
+        sync = SOURCES[source][0]
+        close_old_connections()
+        started = time.monotonic()
+        try:
+            sync(user)
+            logger.info(f"Synced {source} for {user.email} in {time.monotonic() - started:.2f}s")
+            return True
+        except Exception as e:
+            logger.error(f"Background {source} sync failed for {user.email}: {e}", exc_info=True)
+            return False
+        finally:
+            close_old_connections()
+
+    def _push(self, user_id, source, due, jitter=True):
+        if jitter:
+            due += random.uniform(0, getattr(settings, 'SYNC_WORKER_JITTER', 0.1) * self._interval(user_id, source))
+        last_login = self._users[user_id].last_login
+        # Among jobs due at the same time, the most recently active user goes first
+        priority = -last_login.timestamp() if last_login else 0
+        heapq.heappush(self._queue, (due, priority, user_id, source))
+        self._queued[(user_id, source)] = due
+
+    def _interval(self, user_id, source):
+        _, setting, default, _, _ = SOURCES[source]
+        if (user_id, source) in self._pushed:
+            # Notifications mark the mirror dirty; polling only catches lost ones
+            interval = getattr(settings, 'GOOGLE_PUSH_SAFETY_INTERVAL', 3600)
+        else:
+            interval = getattr(settings, setting, default) * getattr(settings, 'SYNC_WORKER_LEAD', 0.8)
+        user = self._users.get(user_id)
+        idle_after = timedelta(hours=getattr(settings, 'SYNC_WORKER_IDLE_AFTER_HOURS', 24))
+        if user and (not user.last_login or timezone.now() - user.last_login > idle_after):
+            interval *= getattr(settings, 'SYNC_WORKER_IDLE_MULTIPLIER', 10)
+        return interval
+
+    def _sync_status(self, source):
+        """
+        Per user, in one query: (oldest sync time, whether any mirror is
+        dirty, whether every mirror has a live push channel).
+        """
+        _, _, _, model, push_field = SOURCES[source]
+        annotations = {
+            'synced': Min('last_synced_at'),
+            'dirty': Count('pk', filter=Q(last_synced_at__isnull=True)),
+        }
+        if push_field:
+            annotations['push_until'] = Min(push_field)
+            annotations['unwatched'] = Count('pk', filter=Q(**{f'{push_field}__isnull': True}))
+        rows = (
+            model.objects.filter(user_id__in=list(self._users), **SOURCE_FILTERS.get(source, {}))
+            .values('user_id')
+            .annotate(**annotations)
+        )
+
+        now = timezone.now()
+        status = {}
+        for row in rows:
+            pushed = bool(push_field and not row['unwatched'] and row['push_until'] > now)
+            status[row['user_id']] = (row['synced'], bool(row['dirty']), pushed)
+        return status
+
+    def _is_running(self, user_id, source):
+        return (user_id, source) in self._running.values()
+
+    def _seconds_until_next_due(self):
+        if not self._queue:
+            return 1.0
+        return max(0.0, min(self._queue[0][0] - time.time(), 1.0))
@@ -9,13 +9,25 @@ urlpatterns = [
     # Google Tasks API endpoints
     path('api/tasks/', views.get_tasks, name='get_tasks'),
     path('api/tasks/create/', views.create_task, name='create_task'),
+    path('api/tasks/bulk/', views.bulk_tasks, name='bulk_tasks'),
     path('api/tasks/<str:task_id>/update/', views.update_task, name='update_task'),
     path('api/tasks/<str:task_id>/delete/', views.delete_task, name='delete_task'),
 
     # Gmail and Calendar API endpoints
     path('api/emails/', views.get_emails, name='get_emails'),
+    path('api/emails/<str:message_id>/', views.get_email_body, name='get_email_body'),
     path('api/calendar/', views.get_calendar_events, name='get_calendar_events'),
+
+    # Live change events for open dashboards
+    path('api/stream/', views.event_stream, name='event_stream'),
+
+    # Google push notification receivers
+    path('api/push/gmail/', views.gmail_push, name='gmail_push'),
+    path('api/push/calendar/', views.calendar_push, name='calendar_push'),
     
+    # Goals, achievements, time tracking and habits in one request
+    path('api/dashboard/', views.get_dashboard, name='get_dashboard'),
+
     # Goals API endpoints
     path('api/goals/', views.get_goals, name='get_goals'),
     path('api/goals/create/', views.create_goal, name='create_goal'),
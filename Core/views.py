@@ -1,42 +1,75 @@
+from django.conf import settings
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
+from django.utils.html import json_script
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.db import transaction
 from django.utils import timezone
-from django.db.models import Sum, Count, Q, Avg
-from django.db.models.functions import TruncDate
 import json
+import time
 from datetime import datetime, timedelta
 from .gmail_service import GmailService
-from .google_tasks_service import GoogleTasksService
-from .google_calendar_service import GoogleCalendarService
-from .models import Goal, Achievement, TimeTracking, Habit, HabitCompletion
+from .google_tasks_service import GoogleTasksService, TaskConflictError
+from .google_calendar_service import GoogleCalendarService, UnknownCalendarError
+from .circuit_breaker import is_degraded
+from .dashboard import (
+    SECTIONS as DASHBOARD_SECTIONS,
+    load_achievements,
+    load_goals,
+    load_habits,
+    load_time_tracking,
+    serialize_goal,
+    serialize_habit,
+    serialize_time_entry,
+)
+from .decorators import async_login_required
+from .events import format_sse, get_broker, publish
+from .fanout import MISSED, as_ready, gather_all, run_in_pool
+from .push import PushVerificationError, handle_calendar_notification, handle_gmail_notification
+from .response_cache import invalidate, swr_cache
+from .models import Goal, Achievement, TimeTracking, Habit, HabitCompletion, STREAK_FIELDS
 import logging
 
 logger = logging.getLogger(__name__)
 
-@login_required
-def Home(request):
+# Upper bound on operations accepted by /api/tasks/bulk/ in one request
+BULK_TASKS_MAX_OPERATIONS = 500
+
+# Default and maximum page sizes for /api/tasks/
+TASKS_PAGE_SIZE = 100
+TASKS_MAX_PAGE_SIZE = 500
+
+
+def _publish(request, section, action, object_id=None):
+    """Tell the user's other open tabs about a change made by this request"""
+    publish(request.user.pk, section, action, object_id, origin=request.headers.get('X-Client-Id'))
+
+
+# Which circuit breaker decides whether each Home section is stale
+HOME_SECTION_APIS = {'emails': 'gmail', 'tasks': 'tasks', 'events': 'calendar'}
+
+
+@async_login_required
+async def Home(request):
     # Get user's profile picture and email from Google OAuth
     from allauth.socialaccount.models import SocialAccount
     
     # Default values
     user_data = {}
-    emails = []
-    tasks = []
-    calendar_events = []
+    sources = {}
     
     try:
         # Get the social account data - try by user first (provider ID might be numeric)
-        social_account = SocialAccount.objects.filter(user=request.user).first()
+        social_account = await SocialAccount.objects.filter(user=request.user).afirst()
         
         if social_account:
             extra_data = social_account.extra_data
             
-            # Store ALL data from Google
-            all_data = extra_data
-            
             # Extract all available data from Google
             user_data = {
                 'email': extra_data.get('email', request.user.email),
@@ -48,30 +81,14 @@ def Home(request):
                 'locale': extra_data.get('locale', ''),
             }
             
-            # Try to fetch Gmail emails
-            try:
-                gmail_service = GmailService(request.user)
-                emails = gmail_service.get_emails(10)
-                logger.info(f"Fetched {len(emails)} emails for user {request.user.email}")
-            except Exception as e:
-                logger.error(f"Error fetching emails for user {request.user.email}: {e}", exc_info=True)
-                emails = []
-            
-            # Try to fetch Google Tasks
-            try:
-                tasks_service = GoogleTasksService(request.user)
-                tasks = tasks_service.get_tasks()
-                logger.info(f"Fetched {len(tasks)} tasks for user {request.user.email}")
-            except Exception as e:
-                logger.error(f"Error fetching tasks for user {request.user.email}: {e}", exc_info=True)
-            
-            # Try to fetch Google Calendar events
-            try:
-                calendar_service = GoogleCalendarService(request.user)
-                calendar_events = calendar_service.get_upcoming_events(max_results=20, days_ahead=30)
-                logger.info(f"Fetched {len(calendar_events)} calendar events for user {request.user.email}")
-            except Exception as e:
-                logger.error(f"Error fetching calendar events for user {request.user.email}: {e}", exc_info=True)
+            # Gmail, Tasks and Calendar load concurrently; anything that misses
+            # its deadline is left for the frontend to lazy-load.
+            user = request.user
+            sources = {
+                'emails': lambda: GmailService(user).get_emails(10),
+                'tasks': lambda: GoogleTasksService(user).get_tasks_page(limit=TASKS_PAGE_SIZE),
+                'events': lambda: GoogleCalendarService(user).get_upcoming_events(max_results=20, days_ahead=30),
+            }
         else:
             raise SocialAccount.DoesNotExist
         
@@ -82,28 +99,85 @@ def Home(request):
             'picture': '',
         }
 
-    serialized_emails = []
-    for email in emails:
-        email_copy = email.copy()
-        email_date = email_copy.get('date')
-        if isinstance(email_date, datetime):
-            email_copy['date'] = email_date.isoformat()
-        serialized_emails.append(email_copy)
-
-    initial_payload = {
-        'user': user_data,
-        'emails': serialized_emails,
-        'tasks': tasks,
-        'events': calendar_events,
-    }
-
-    context = {
-        'user_data': user_data,
-        'initial_payload': initial_payload,
-    }
-
+    context = {'user_data': user_data}
+    timeouts = getattr(settings, 'GOOGLE_FETCH_TIMEOUTS', None)
+
+    if getattr(settings, 'HOME_STREAMING', True) and isinstance(request, ASGIRequest):
+        # Render the shell before returning so its CSRF cookie goes out with
+        # the headers; the data sections follow as they become ready.
+        shell = render_to_string('index_shell.html', context, request)
+        boot = render_to_string('index_boot.html', context, request)
+        stream = _stream_home(request.user, user_data, sources, timeouts, shell, boot)
+        return StreamingHttpResponse(stream, content_type='text/html; charset=utf-8')
+
+    # Under WSGI an async stream would be buffered to completion anyway
+    results, pending = await gather_all(sources, timeouts=timeouts, pool='home')
+    initial_sections = [('initial-user', user_data)]
+    for name in sources:
+        if name in results:
+            initial_sections.append((f'initial-{name}', _home_section(name, results[name])))
+    initial_sections.append(('initial-status', _home_status(request.user, sources, results, pending)))
+    _log_home(request.user, results, pending)
+
+    context['initial_sections'] = initial_sections
     return render(request, 'index.html', context)
 
+
+async def _stream_home(user, user_data, sources, timeouts, shell, boot):
+    """Yield the page shell, then each data section as soon as it loads"""
+    yield shell
+    yield json_script(user_data, 'initial-user')
+    results = {}
+    pending = []
+    async for name, result in as_ready(sources, timeouts=timeouts, pool='home'):
+        if result is MISSED:
+            pending.append(name)
+            continue
+        results[name] = result
+        yield json_script(_home_section(name, result), f'initial-{name}')
+    yield json_script(_home_status(user, sources, results, pending), 'initial-status')
+    _log_home(user, results, pending)
+    yield boot
+
+
+def _home_section(name, result):
+    """Turn one Home loader's result into its initial payload value"""
+    if name == 'emails':
+        serialized_emails = []
+        for email in result or []:
+            email_copy = email.copy()
+            email_date = email_copy.get('date')
+            if isinstance(email_date, datetime):
+                email_copy['date'] = email_date.isoformat()
+            serialized_emails.append(email_copy)
+        return serialized_emails
+    if name == 'tasks':
+        # Only the first page; the frontend asks for more on demand
+        return (result or {}).get('tasks', [])
+    return result or []
+
+
+def _home_status(user, sources, results, pending):
+    """
+    Sections still to lazy-load, those served from mirrors while their API's
+    circuit is open, and the cursor for the next page of tasks.
+    """
+    stale = [name for name in sources if is_degraded(HOME_SECTION_APIS[name], user.pk)]
+    tasks_cursor = (results.get('tasks') or {}).get('next_cursor')
+    return {'pending': pending, 'stale': stale, 'tasks_cursor': tasks_cursor}
+
+
+def _log_home(user, results, pending):
+    tasks_page = results.get('tasks') or {}
+    logger.info(
+        "Fetched %d emails, %d tasks, %d calendar events for user %s (pending: %s)",
+        len(results.get('emails') or []),
+        len(tasks_page.get('tasks', [])),
+        len(results.get('events') or []),
+        user.email,
+        ', '.join(pending) or 'none',
+    )
+
 def LoginView(request):
     return render(request, 'login.html')
 
@@ -134,9 +208,11 @@ def create_task(request):
                 'needs_reauth': True
             }, status=403)
         
-        result = tasks_service.create_task(title, description)
+        result = tasks_service.create_task(title, description, tasklist_id=data.get('tasklist') or '@default')
+        invalidate('tasks', request.user.pk)
         
         if result:
+            _publish(request, 'tasks', 'created', result.get('id'))
             return JsonResponse({'success': True, 'task': result})
         else:
             return JsonResponse({'error': 'Failed to create task'}, status=500)
@@ -157,13 +233,29 @@ def update_task(request, task_id):
         status = data.get('status')
         
         tasks_service = GoogleTasksService(request.user)
-        result = tasks_service.update_task(task_id, title, description, status)
+        result = tasks_service.update_task(
+            task_id,
+            title,
+            description,
+            status,
+            tasklist_id=data.get('tasklist') or '@default',
+            etag=data.get('etag'),
+        )
+        invalidate('tasks', request.user.pk)
         
         if result:
+            _publish(request, 'tasks', 'updated', task_id)
             return JsonResponse({'success': True, 'task': result})
         else:
             return JsonResponse({'error': 'Failed to update task'}, status=500)
             
+    except TaskConflictError as e:
+        invalidate('tasks', request.user.pk)
+        return JsonResponse({
+            'error': 'This task was changed elsewhere. The latest version has been loaded.',
+            'conflict': True,
+            'task': e.task,
+        }, status=409)
     except Exception as e:
         logger.error(f"Error updating task: {e}", exc_info=True)
         return JsonResponse({'error': str(e)}, status=500)
@@ -175,9 +267,11 @@ def delete_task(request, task_id):
     """Delete a task from Google Tasks"""
     try:
         tasks_service = GoogleTasksService(request.user)
-        success = tasks_service.delete_task(task_id)
+        success = tasks_service.delete_task(task_id, tasklist_id=request.GET.get('tasklist') or '@default')
+        invalidate('tasks', request.user.pk)
         
         if success:
+            _publish(request, 'tasks', 'deleted', task_id)
             return JsonResponse({'success': True})
         else:
             return JsonResponse({'error': 'Failed to delete task'}, status=500)
@@ -188,30 +282,115 @@ def delete_task(request, task_id):
 
 
 @login_required
-def get_tasks(request):
-    """Get all tasks from Google Tasks"""
+@require_http_methods(["POST"])
+def bulk_tasks(request):
+    """Apply a list of create/update/delete/move operations to Google Tasks"""
     try:
+        data = json.loads(request.body)
+        operations = data.get('operations')
+        
+        if not isinstance(operations, list) or not operations:
+            return JsonResponse({'error': 'operations must be a non-empty list'}, status=400)
+        if len(operations) > BULK_TASKS_MAX_OPERATIONS:
+            return JsonResponse({'error': f'At most {BULK_TASKS_MAX_OPERATIONS} operations per request'}, status=400)
+        if not all(isinstance(op, dict) for op in operations):
+            return JsonResponse({'error': 'Each operation must be an object'}, status=400)
+        
         tasks_service = GoogleTasksService(request.user)
-
+        
         if not tasks_service.service:
             return JsonResponse({
                 'error': 'Google Tasks not connected. Please sign out and sign in again to grant Tasks permission.',
                 'needs_reauth': True
             }, status=403)
         
-        tasks = tasks_service.get_tasks()
-        return JsonResponse({'tasks': tasks})
+        results = tasks_service.bulk_apply(operations)
+        invalidate('tasks', request.user.pk)
+        failed = sum(1 for result in results if not result['success'])
+        if failed < len(results):
+            _publish(request, 'tasks', 'bulk')
+        
+        return JsonResponse({
+            'success': failed == 0,
+            'results': results,
+            'succeeded': len(results) - failed,
+            'failed': failed,
+        })
+            
+    except Exception as e:
+        logger.error(f"Error applying bulk task operations: {e}", exc_info=True)
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def _load_tasks_page(user, tasklist_id, cursor, limit):
+    """Build the service and read one page on the same pool thread"""
+    tasks_service = GoogleTasksService(user)
+    if not tasks_service.service:
+        return None
+    page = tasks_service.get_tasks_page(tasklist_id=tasklist_id, cursor=cursor, limit=limit)
+    return page, tasks_service.get_mirrored_task_lists()
+
+
+@async_login_required
+@swr_cache('tasks')
+async def get_tasks(request):
+    """
+    Get tasks from every Google Tasks list, one cursor-paginated page at a time.
+
+    Accepts ?list= to restrict to one task list, ?limit= for the page size and
+    ?cursor= taken from the previous page's next_cursor.
+    """
+    try:
+        try:
+            limit = min(int(request.GET.get('limit', TASKS_PAGE_SIZE)), TASKS_MAX_PAGE_SIZE)
+        except ValueError:
+            return JsonResponse({'error': 'limit must be an integer'}, status=400)
+        
+        try:
+            result = await run_in_pool(
+                _load_tasks_page,
+                request.user,
+                tasklist_id=request.GET.get('list'),
+                cursor=request.GET.get('cursor'),
+                limit=max(limit, 1),
+                pool='api',
+            )
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        if result is None:
+            return JsonResponse({
+                'error': 'Google Tasks not connected. Please sign out and sign in again to grant Tasks permission.',
+                'needs_reauth': True
+            }, status=403)
+        page, lists = result
+        
+        return JsonResponse({
+            'tasks': page['tasks'],
+            'next_cursor': page['next_cursor'],
+            'lists': lists,
+            'stale': is_degraded('tasks', request.user.pk),
+        })
     except Exception as e:
         logger.error(f"Error getting tasks: {e}", exc_info=True)
         return JsonResponse({'error': str(e)}, status=500)
 
 
-@login_required
-def get_emails(request):
+def _load_emails(user, max_results):
+    gmail_service = GmailService(user)
+    if not gmail_service.service:
+        return None
+    return gmail_service.get_emails(max_results)
+
+
+@async_login_required
+@swr_cache('emails')
+async def get_emails(request):
     """Expose recent Gmail messages via JSON."""
     try:
-        gmail_service = GmailService(request.user)
-        if not gmail_service.service:
+        # Bodies are loaded per message from get_email_body when opened
+        emails = await run_in_pool(_load_emails, request.user, 25, pool='api')
+        if emails is None:
             return JsonResponse(
                 {
                     'error': 'Gmail not connected. Please sign out and sign back in to grant Gmail permission.',
@@ -220,7 +399,6 @@ def get_emails(request):
                 status=403,
             )
 
-        emails = gmail_service.get_emails(25)
         serialized = []
         for email in emails:
             email_date = email.get('date')
@@ -234,22 +412,171 @@ def get_emails(request):
                     'sender': email.get('sender'),
                     'snippet': email.get('snippet', ''),
                     'date': email_date,
-                    'body': email.get('body', ''),
                 }
             )
 
-        return JsonResponse({'emails': serialized})
+        return JsonResponse({'emails': serialized, 'stale': is_degraded('gmail', request.user.pk)})
     except Exception as exc:
         logger.error("Error getting emails: %s", exc, exc_info=True)
         return JsonResponse({'error': str(exc)}, status=500)
 
 
 @login_required
-def get_calendar_events(request):
+def get_email_body(request, message_id):
+    """Return the full text body of one Gmail message."""
+    try:
+        gmail_service = GmailService(request.user)
+        if not gmail_service.service:
+            return JsonResponse(
+                {
+                    'error': 'Gmail not connected. Please sign out and sign back in to grant Gmail permission.',
+                    'needs_reauth': True,
+                },
+                status=403,
+            )
+
+        body = gmail_service.get_email_body(message_id)
+        if body is None:
+            return JsonResponse({'error': 'Email not found'}, status=404)
+
+        return JsonResponse({'id': message_id, 'body': body})
+    except Exception as exc:
+        logger.error("Error getting email %s: %s", message_id, exc, exc_info=True)
+        return JsonResponse({'error': str(exc)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def gmail_push(request):
+    """Receive Gmail watch notifications from a Pub/Sub push subscription."""
+    try:
+        envelope = json.loads(request.body)
+        handle_gmail_notification(envelope, request.GET.get('token'))
+    except PushVerificationError as exc:
+        logger.warning("Rejected Gmail push notification: %s", exc)
+        return JsonResponse({'error': str(exc)}, status=403)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    except Exception as exc:
+        logger.error("Error handling Gmail push notification: %s", exc, exc_info=True)
+        return JsonResponse({'error': str(exc)}, status=500)
+
+    # Any 2xx acknowledges the message so Pub/Sub stops redelivering it
+    return HttpResponse(status=204)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def calendar_push(request):
+    """Receive Google Calendar channel notifications."""
+    try:
+        handle_calendar_notification(request.headers)
+    except LookupError as exc:
+        return JsonResponse({'error': str(exc)}, status=404)
+    except PushVerificationError as exc:
+        logger.warning("Rejected Calendar push notification: %s", exc)
+        return JsonResponse({'error': str(exc)}, status=403)
+    except Exception as exc:
+        logger.error("Error handling Calendar push notification: %s", exc, exc_info=True)
+        return JsonResponse({'error': str(exc)}, status=500)
+
+    return HttpResponse(status=204)
+
+
+@async_login_required
+async def event_stream(request):
+    """
+    Stream the user's change events as server-sent events.
+
+    Browsers reconnect on their own and resume from Last-Event-ID. Each
+    connection ends after SSE_STREAM_MAX_AGE seconds so long-lived streams
+    get spread across workers.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    heartbeat = getattr(settings, 'SSE_HEARTBEAT', 15)
+    broker = get_broker()
+    if isinstance(request, ASGIRequest):
+        stream = _async_sse(broker.listen(request.user.pk, last_event_id, heartbeat))
+    else:
+        # Under WSGI an async iterator would be buffered to completion
+        stream = _sync_sse(broker.listen_sync(request.user.pk, last_event_id, heartbeat))
+
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def _async_sse(events):
+    deadline = time.monotonic() + getattr(settings, 'SSE_STREAM_MAX_AGE', 300)
+    yield f"retry: {getattr(settings, 'SSE_RETRY_MS', 3000)}\n\n"
+    try:
+        async for event in events:
+            yield format_sse(event)
+            if time.monotonic() >= deadline:
+                break
+    finally:
+        await events.aclose()
+
+
+def _sync_sse(events):
+    deadline = time.monotonic() + getattr(settings, 'SSE_STREAM_MAX_AGE', 300)
+    yield f"retry: {getattr(settings, 'SSE_RETRY_MS', 3000)}\n\n"
+    try:
+        for event in events:
+            yield format_sse(event)
+            if time.monotonic() >= deadline:
+                break
+    finally:
+        events.close()
+
+
+def _parse_range_bound(value):
+    """Parse an ISO date or datetime query parameter into an aware datetime"""
+    parsed = datetime.fromisoformat(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _load_calendar_events(user, date_range, calendar_id):
+    calendar_service = GoogleCalendarService(user)
+    if not calendar_service.service:
+        return None
+    if date_range:
+        return calendar_service.get_events_in_range(*date_range, calendar_id=calendar_id)
+    return calendar_service.get_upcoming_events(max_results=20, days_ahead=30, calendar_id=calendar_id)
+
+
+@async_login_required
+@swr_cache('calendar')
+async def get_calendar_events(request):
     """Return upcoming Google Calendar events as JSON."""
     try:
-        calendar_service = GoogleCalendarService(request.user)
-        if not calendar_service.service:
+        # Optional ?start=&end= (ISO dates or datetimes) select an arbitrary range
+        # and ?calendar= a single calendar; otherwise all selected calendars
+        start_param = request.GET.get('start')
+        end_param = request.GET.get('end')
+        date_range = None
+        if start_param or end_param:
+            try:
+                range_start = _parse_range_bound(start_param) if start_param else timezone.now()
+                range_end = _parse_range_bound(end_param) if end_param else range_start + timedelta(days=30)
+            except ValueError:
+                return JsonResponse({'error': 'start and end must be ISO 8601 dates'}, status=400)
+            date_range = (range_start, range_end)
+
+        try:
+            events = await run_in_pool(
+                _load_calendar_events,
+                request.user,
+                date_range,
+                request.GET.get('calendar'),
+                pool='api',
+            )
+        except UnknownCalendarError as e:
+            return JsonResponse({'error': str(e)}, status=404)
+        if events is None:
             return JsonResponse(
                 {
                     'error': 'Google Calendar not connected. Please sign out and sign back in to grant Calendar permission.',
@@ -257,14 +584,44 @@ def get_calendar_events(request):
                 },
                 status=403,
             )
-
-        events = calendar_service.get_upcoming_events(max_results=20, days_ahead=30)
-        return JsonResponse({'events': events})
+        return JsonResponse({'events': events, 'stale': is_degraded('calendar', request.user.pk)})
     except Exception as exc:
         logger.error("Error getting calendar events: %s", exc, exc_info=True)
         return JsonResponse({'error': str(exc)}, status=500)
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Dashboard API Endpoint
+# ─────────────────────────────────────────────────────────────────────────────
+@login_required
+def get_dashboard(request):
+    """
+    Goals, achievements, time tracking and habits in one response.
+
+    ?sections= takes a comma-separated subset (default: all) and ?days= the
+    time tracking window. Each section costs a fixed number of queries.
+    """
+    try:
+        requested = request.GET.get('sections')
+        sections = [name.strip() for name in requested.split(',') if name.strip()] if requested else list(DASHBOARD_SECTIONS)
+        unknown = [name for name in sections if name not in DASHBOARD_SECTIONS]
+        if unknown:
+            return JsonResponse({
+                'error': f"Unknown section(s): {', '.join(unknown)}",
+                'sections': list(DASHBOARD_SECTIONS),
+            }, status=400)
+        
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            return JsonResponse({'error': 'days must be an integer'}, status=400)
+        
+        return JsonResponse({name: DASHBOARD_SECTIONS[name](request.user, days) for name in sections})
+    except Exception as e:
+        logger.error(f"Error getting dashboard: {e}", exc_info=True)
+        return JsonResponse({'error': str(e)}, status=500)
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Goals API Endpoints
 # ─────────────────────────────────────────────────────────────────────────────
@@ -272,25 +629,7 @@ def get_calendar_events(request):
 def get_goals(request):
     """Get all goals for the user"""
     try:
-        goals = Goal.objects.filter(user=request.user)
-        goals_data = []
-        for goal in goals:
-            goals_data.append({
-                'id': goal.id,
-                'title': goal.title,
-                'description': goal.description,
-                'target_value': float(goal.target_value),
-                'current_value': float(goal.current_value),
-                'unit': goal.unit,
-                'status': goal.status,
-                'category': goal.category,
-                'deadline': goal.deadline.isoformat() if goal.deadline else None,
-                'progress_percentage': goal.progress_percentage,
-                'is_overdue': goal.is_overdue,
-                'created_at': goal.created_at.isoformat(),
-                'updated_at': goal.updated_at.isoformat(),
-            })
-        return JsonResponse({'goals': goals_data})
+        return JsonResponse({'goals': load_goals(request.user)})
     except Exception as e:
         logger.error(f"Error getting goals: {e}", exc_info=True)
         return JsonResponse({'error': str(e)}, status=500)
@@ -310,23 +649,10 @@ def create_goal(request):
             current_value=data.get('current_value', 0),
             unit=data.get('unit', 'points'),
             category=data.get('category', ''),
-            deadline=datetime.fromisoformat(data['deadline']) if data.get('deadline') else None,
+            deadline=_parse_range_bound(data['deadline']) if data.get('deadline') else None,
         )
-        return JsonResponse({
-            'success': True,
-            'goal': {
-                'id': goal.id,
-                'title': goal.title,
-                'description': goal.description,
-                'target_value': float(goal.target_value),
-                'current_value': float(goal.current_value),
-                'unit': goal.unit,
-                'status': goal.status,
-                'category': goal.category,
-                'deadline': goal.deadline.isoformat() if goal.deadline else None,
-                'progress_percentage': goal.progress_percentage,
-            }
-        })
+        _publish(request, 'goals', 'created', goal.id)
+        return JsonResponse({'success': True, 'goal': serialize_goal(goal)})
     except Exception as e:
         logger.error(f"Error creating goal: {e}", exc_info=True)
         return JsonResponse({'error': str(e)}, status=500)
@@ -357,7 +683,7 @@ def update_goal(request, goal_id):
         if 'category' in data:
             goal.category = data['category']
         if 'deadline' in data:
-            goal.deadline = datetime.fromisoformat(data['deadline']) if data['deadline'] else None
+            goal.deadline = _parse_range_bound(data['deadline']) if data['deadline'] else None
         
         goal.save()
         
@@ -372,22 +698,9 @@ def update_goal(request, goal_id):
                     'icon': 'trophy-fill',
                 }
             )
+        _publish(request, 'goals', 'updated', goal.id)
         
-        return JsonResponse({
-            'success': True,
-            'goal': {
-                'id': goal.id,
-                'title': goal.title,
-                'description': goal.description,
-                'target_value': float(goal.target_value),
-                'current_value': float(goal.current_value),
-                'unit': goal.unit,
-                'status': goal.status,
-                'category': goal.category,
-                'deadline': goal.deadline.isoformat() if goal.deadline else None,
-                'progress_percentage': goal.progress_percentage,
-            }
-        })
+        return JsonResponse({'success': True, 'goal': serialize_goal(goal)})
     except Goal.DoesNotExist:
         return JsonResponse({'error': 'Goal not found'}, status=404)
     except Exception as e:
@@ -402,6 +715,7 @@ def delete_goal(request, goal_id):
     try:
         goal = Goal.objects.get(id=goal_id, user=request.user)
         goal.delete()
+        _publish(request, 'goals', 'deleted', goal_id)
         return JsonResponse({'success': True})
     except Goal.DoesNotExist:
         return JsonResponse({'error': 'Goal not found'}, status=404)
@@ -414,17 +728,7 @@ def delete_goal(request, goal_id):
 def get_achievements(request):
     """Get all achievements for the user"""
     try:
-        achievements = Achievement.objects.filter(user=request.user)
-        achievements_data = []
-        for achievement in achievements:
-            achievements_data.append({
-                'id': achievement.id,
-                'title': achievement.title,
-                'description': achievement.description,
-                'icon': achievement.icon,
-                'unlocked_at': achievement.unlocked_at.isoformat(),
-            })
-        return JsonResponse({'achievements': achievements_data})
+        return JsonResponse({'achievements': load_achievements(request.user)})
     except Exception as e:
         logger.error(f"Error getting achievements: {e}", exc_info=True)
         return JsonResponse({'error': str(e)}, status=500)
@@ -438,67 +742,7 @@ def get_time_tracking(request):
     """Get time tracking data with analytics"""
     try:
         days = int(request.GET.get('days', 30))
-        start_date = timezone.now() - timedelta(days=days)
-        
-        # Get all time tracking entries
-        entries = TimeTracking.objects.filter(
-            user=request.user,
-            start_time__gte=start_date
-        ).order_by('-start_time')
-        
-        entries_data = []
-        for entry in entries:
-            entries_data.append({
-                'id': entry.id,
-                'activity_type': entry.activity_type,
-                'description': entry.description,
-                'start_time': entry.start_time.isoformat(),
-                'end_time': entry.end_time.isoformat() if entry.end_time else None,
-                'duration_minutes': entry.duration_minutes,
-                'created_at': entry.created_at.isoformat(),
-            })
-        
-        # Calculate analytics
-        total_minutes = entries.aggregate(Sum('duration_minutes'))['duration_minutes__sum'] or 0
-        total_hours = total_minutes / 60
-        
-        # Daily breakdown
-        daily_data = entries.values('start_time__date').annotate(
-            total_minutes=Sum('duration_minutes')
-        ).order_by('start_time__date')
-        
-        daily_breakdown = []
-        for day in daily_data:
-            daily_breakdown.append({
-                'date': day['start_time__date'].isoformat(),
-                'total_minutes': day['total_minutes'] or 0,
-            })
-        
-        # Activity type breakdown
-        activity_breakdown = entries.values('activity_type').annotate(
-            total_minutes=Sum('duration_minutes')
-        )
-        
-        activity_data = {}
-        for activity in activity_breakdown:
-            activity_data[activity['activity_type']] = activity['total_minutes'] or 0
-        
-        # Weekly averages
-        weeks = days // 7 if days >= 7 else 1
-        avg_daily_minutes = total_minutes / days if days > 0 else 0
-        avg_weekly_hours = (total_minutes / weeks) / 60 if weeks > 0 else 0
-        
-        return JsonResponse({
-            'entries': entries_data,
-            'analytics': {
-                'total_minutes': total_minutes,
-                'total_hours': round(total_hours, 2),
-                'avg_daily_minutes': round(avg_daily_minutes, 2),
-                'avg_weekly_hours': round(avg_weekly_hours, 2),
-                'daily_breakdown': daily_breakdown,
-                'activity_breakdown': activity_data,
-            }
-        })
+        return JsonResponse(load_time_tracking(request.user, days))
     except Exception as e:
         logger.error(f"Error getting time tracking: {e}", exc_info=True)
         return JsonResponse({'error': str(e)}, status=500)
@@ -517,17 +761,8 @@ def create_time_entry(request):
             start_time=datetime.fromisoformat(data['start_time']) if data.get('start_time') else timezone.now(),
             end_time=datetime.fromisoformat(data['end_time']) if data.get('end_time') else None,
         )
-        return JsonResponse({
-            'success': True,
-            'entry': {
-                'id': entry.id,
-                'activity_type': entry.activity_type,
-                'description': entry.description,
-                'start_time': entry.start_time.isoformat(),
-                'end_time': entry.end_time.isoformat() if entry.end_time else None,
-                'duration_minutes': entry.duration_minutes,
-            }
-        })
+        _publish(request, 'time_entries', 'created', entry.id)
+        return JsonResponse({'success': True, 'entry': serialize_time_entry(entry)})
     except Exception as e:
         logger.error(f"Error creating time entry: {e}", exc_info=True)
         return JsonResponse({'error': str(e)}, status=500)
@@ -549,18 +784,9 @@ def update_time_entry(request, entry_id):
             entry.description = data['description']
         
         entry.save()
+        _publish(request, 'time_entries', 'updated', entry.id)
         
-        return JsonResponse({
-            'success': True,
-            'entry': {
-                'id': entry.id,
-                'activity_type': entry.activity_type,
-                'description': entry.description,
-                'start_time': entry.start_time.isoformat(),
-                'end_time': entry.end_time.isoformat() if entry.end_time else None,
-                'duration_minutes': entry.duration_minutes,
-            }
-        })
+        return JsonResponse({'success': True, 'entry': serialize_time_entry(entry)})
     except TimeTracking.DoesNotExist:
         return JsonResponse({'error': 'Entry not found'}, status=404)
     except Exception as e:
@@ -575,6 +801,7 @@ def delete_time_entry(request, entry_id):
     try:
         entry = TimeTracking.objects.get(id=entry_id, user=request.user)
         entry.delete()
+        _publish(request, 'time_entries', 'deleted', entry_id)
         return JsonResponse({'success': True})
     except TimeTracking.DoesNotExist:
         return JsonResponse({'error': 'Entry not found'}, status=404)
@@ -590,23 +817,7 @@ def delete_time_entry(request, entry_id):
 def get_habits(request):
     """Get all habits with streak information"""
     try:
-        habits = Habit.objects.filter(user=request.user)
-        habits_data = []
-        for habit in habits:
-            habits_data.append({
-                'id': habit.id,
-                'name': habit.name,
-                'description': habit.description,
-                'frequency': habit.frequency,
-                'target_count': habit.target_count,
-                'color': habit.color,
-                'icon': habit.icon,
-                'is_active': habit.is_active,
-                'current_streak': habit.current_streak,
-                'longest_streak': habit.longest_streak,
-                'created_at': habit.created_at.isoformat(),
-            })
-        return JsonResponse({'habits': habits_data})
+        return JsonResponse({'habits': load_habits(request.user)})
     except Exception as e:
         logger.error(f"Error getting habits: {e}", exc_info=True)
         return JsonResponse({'error': str(e)}, status=500)
@@ -657,21 +868,8 @@ def create_habit(request):
             color=data.get('color', 'blue'),
             icon=data.get('icon', 'star'),
         )
-        return JsonResponse({
-            'success': True,
-            'habit': {
-                'id': habit.id,
-                'name': habit.name,
-                'description': habit.description,
-                'frequency': habit.frequency,
-                'target_count': habit.target_count,
-                'color': habit.color,
-                'icon': habit.icon,
-                'is_active': habit.is_active,
-                'current_streak': habit.current_streak,
-                'longest_streak': habit.longest_streak,
-            }
-        })
+        _publish(request, 'habits', 'created', habit.id)
+        return JsonResponse({'success': True, 'habit': serialize_habit(habit)})
     except Exception as e:
         logger.error(f"Error creating habit: {e}", exc_info=True)
         return JsonResponse({'error': str(e)}, status=500)
@@ -700,23 +898,14 @@ def update_habit(request, habit_id):
         if 'is_active' in data:
             habit.is_active = data['is_active']
         
-        habit.save()
+        # Leave the streak counters alone; a completion toggled since the
+        # habit was loaded may already have moved them
+        habit.save(update_fields=[field.name for field in Habit._meta.concrete_fields
+                                  if not field.primary_key and field.name not in STREAK_FIELDS])
+        habit.refresh_from_db(fields=STREAK_FIELDS)
+        _publish(request, 'habits', 'updated', habit.id)
         
-        return JsonResponse({
-            'success': True,
-            'habit': {
-                'id': habit.id,
-                'name': habit.name,
-                'description': habit.description,
-                'frequency': habit.frequency,
-                'target_count': habit.target_count,
-                'color': habit.color,
-                'icon': habit.icon,
-                'is_active': habit.is_active,
-                'current_streak': habit.current_streak,
-                'longest_streak': habit.longest_streak,
-            }
-        })
+        return JsonResponse({'success': True, 'habit': serialize_habit(habit)})
     except Habit.DoesNotExist:
         return JsonResponse({'error': 'Habit not found'}, status=404)
     except Exception as e:
@@ -731,6 +920,7 @@ def delete_habit(request, habit_id):
     try:
         habit = Habit.objects.get(id=habit_id, user=request.user)
         habit.delete()
+        _publish(request, 'habits', 'deleted', habit_id)
         return JsonResponse({'success': True})
     except Habit.DoesNotExist:
         return JsonResponse({'error': 'Habit not found'}, status=404)
@@ -744,23 +934,30 @@ def delete_habit(request, habit_id):
 def toggle_habit_completion(request, habit_id):
     """Toggle habit completion for today"""
     try:
-        habit = Habit.objects.get(id=habit_id, user=request.user)
         today = timezone.now().date()
         
-        completion, created = HabitCompletion.objects.get_or_create(
-            habit=habit,
-            date=today,
-            defaults={'completed': True}
-        )
-        
-        if not created:
-            completion.completed = not completion.completed
-            completion.save()
+        # Lock the habit so concurrent toggles flip and count one at a time;
+        # HabitCompletion.save keeps the habit's streak counters current
+        with transaction.atomic():
+            habit = Habit.objects.select_for_update().get(id=habit_id, user=request.user)
+            completion, created = HabitCompletion.objects.get_or_create(
+                habit=habit,
+                date=today,
+                defaults={'completed': True}
+            )
+            
+            if not created:
+                completion.completed = not completion.completed
+                completion.save()
+        habit.refresh_from_db(fields=STREAK_FIELDS)
+        _publish(request, 'habits', 'toggled', habit.id)
         
         return JsonResponse({
             'success': True,
             'completed': completion.completed,
-            'current_streak': habit.current_streak,
+            'current_streak': habit.streak_as_of(today),
+            'longest_streak': habit.longest_streak,
+            'total_completions': habit.total_completions,
         })
     except Habit.DoesNotExist:
         return JsonResponse({'error': 'Habit not found'}, status=404)
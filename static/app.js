@@ -9,19 +9,45 @@ const { useState, useEffect, useCallback, useMemo, useRef } = React;
 // ─────────────────────────────────────────────────────────────────────────────
 const CONFIG = window.__INITIAL_DATA__ || {
   user: { email: '', name: '', givenName: '', picture: '' },
-  routes: { logout: '/logout/', apiEmails: '/api/emails/', apiTasks: '/api/tasks/', apiTasksCreate: '/api/tasks/create/', apiCalendar: '/api/calendar/' },
+  routes: { logout: '/logout/', apiEmails: '/api/emails/', apiTasks: '/api/tasks/', apiTasksCreate: '/api/tasks/create/', apiCalendar: '/api/calendar/', apiStream: '/api/stream/', apiDashboard: '/api/dashboard/' },
   csrfToken: ''
 };
 
+// The server writes each initial data section as its own json_script element,
+// streamed in after the page shell as soon as that section is ready
+const INITIAL_SECTIONS = ['user', 'emails', 'tasks', 'events', 'status'];
+
+// Matches TASKS_PAGE_SIZE and TASKS_MAX_PAGE_SIZE in Core/views.py
+const TASKS_PAGE_SIZE = 100;
+const TASKS_MAX_PAGE_SIZE = 500;
+function readInitialPayload() {
+  const payload = {};
+  INITIAL_SECTIONS.forEach(name => {
+    const el = document.getElementById(`initial-${name}`);
+    if (!el) return;
+    const value = JSON.parse(el.textContent);
+    // "status" carries the pending and stale section lists and the tasks cursor
+    if (name === 'status') Object.assign(payload, value);
+    else payload[name] = value;
+  });
+  return payload;
+}
+
+// Identifies this tab so it can ignore stream events caused by its own writes
+const CLIENT_ID = window.crypto?.randomUUID?.() || Math.random().toString(36).slice(2);
+
 // ─────────────────────────────────────────────────────────────────────────────
 // API Helpers
 // ─────────────────────────────────────────────────────────────────────────────
 async function apiFetch(url, options = {}) {
-  const headers = { 'Content-Type': 'application/json', 'X-CSRFToken': CONFIG.csrfToken, ...options.headers };
+  const headers = { 'Content-Type': 'application/json', 'X-CSRFToken': CONFIG.csrfToken, 'X-Client-Id': CLIENT_ID, ...options.headers };
   const res = await fetch(url, { ...options, headers });
   if (!res.ok) {
     const err = await res.json().catch(() => ({}));
-    throw new Error(err.error || `Request failed: ${res.status}`);
+    const error = new Error(err.error || `Request failed: ${res.status}`);
+    error.status = res.status;
+    error.data = err;
+    throw error;
   }
   return res.json();
 }
@@ -707,6 +733,25 @@ const InboxTab = ({ emails, loading, onRefresh }) => {
   const [sortBy, setSortBy] = useState('date'); // 'date', 'sender', 'subject'
   const [sortOrder, setSortOrder] = useState('desc'); // 'asc', 'desc'
   const [filterSender, setFilterSender] = useState('');
+  const [bodies, setBodies] = useState({});
+  const [bodyLoading, setBodyLoading] = useState(false);
+
+  // The listing only carries snippets; fetch the full body when a message is opened
+  useEffect(() => {
+    const id = selectedEmail?.id;
+    if (!id || bodies[id] !== undefined) return;
+    let cancelled = false;
+    setBodyLoading(true);
+    apiFetch(`${CONFIG.routes.apiEmails}${encodeURIComponent(id)}/`)
+      .then(data => {
+        if (!cancelled) setBodies(prev => ({ ...prev, [id]: data.body || '' }));
+      })
+      .catch(err => console.error('Failed to load email body', err))
+      .finally(() => {
+        if (!cancelled) setBodyLoading(false);
+      });
+    return () => { cancelled = true; };
+  }, [selectedEmail?.id]);
 
   const formatDate = (dateStr) => {
     if (!dateStr) return '';
@@ -924,7 +969,7 @@ const InboxTab = ({ emails, loading, onRefresh }) => {
                     </div>
                   </div>
                   <div className="email-detail__body">
-                    {selectedEmail.body || selectedEmail.snippet || 'No content available'}
+                    {bodies[selectedEmail.id] || (bodyLoading ? 'Loading...' : selectedEmail.snippet || 'No content available')}
                   </div>
                 </div>
               </div>
@@ -939,7 +984,7 @@ const InboxTab = ({ emails, loading, onRefresh }) => {
 // ─────────────────────────────────────────────────────────────────────────────
 // Tasks Tab - Drag and Drop
 // ─────────────────────────────────────────────────────────────────────────────
-const TasksTab = ({ tasks, loading, onRefresh, onCreateTask, onUpdateTask, onDeleteTask }) => {
+const TasksTab = ({ tasks, loading, hasMore, loadingMore, onLoadMore, onRefresh, onCreateTask, onUpdateTask, onDeleteTask }) => {
   const [showModal, setShowModal] = useState(false);
   const [newTaskTitle, setNewTaskTitle] = useState('');
   const [newTaskDesc, setNewTaskDesc] = useState('');
@@ -1208,6 +1253,15 @@ const TasksTab = ({ tasks, loading, onRefresh, onCreateTask, onUpdateTask, onDel
         })}
       </div>
 
+      {hasMore && (
+        <div className="text-center mt-4">
+          <button className="btn btn-outline-secondary btn-sm" onClick={onLoadMore} disabled={loadingMore}>
+            <Icon name={loadingMore ? 'arrow-repeat' : 'chevron-down'} size={14} className={loadingMore ? 'spin' : ''} />
+            <span className="ms-2">Load more tasks</span>
+          </button>
+        </div>
+      )}
+
       {/* New Task Modal */}
       {showModal && (
         <div className="modal-backdrop show" onClick={() => setShowModal(false)}>
@@ -2815,11 +2869,13 @@ const HabitsTab = ({ habits, loading, onRefresh, onCreateHabit, onUpdateHabit, o
 // Main App Component
 // ─────────────────────────────────────────────────────────────────────────────
 const App = () => {
-  const initialPayload = CONFIG.initialPayload || {};
+  const initialPayload = useMemo(readInitialPayload, []);
   
   const [activeTab, setActiveTab] = useState('overview');
   const [emails, setEmails] = useState(initialPayload.emails || []);
   const [tasks, setTasks] = useState(initialPayload.tasks || []);
+  const [tasksCursor, setTasksCursor] = useState(initialPayload.tasks_cursor || null);
+  const [loadingMoreTasks, setLoadingMoreTasks] = useState(false);
   const [events, setEvents] = useState(initialPayload.events || []);
   const [goals, setGoals] = useState([]);
   const [achievements, setAchievements] = useState([]);
@@ -2828,10 +2884,14 @@ const App = () => {
   const [pomodoroCount, setPomodoroCount] = useState(0);
   const [focusMins, setFocusMins] = useState(25);
   
+  // Sections the server could not fetch within its deadline arrive as "pending"
+  const pendingSections = initialPayload.pending || [];
+  const needsFetch = (key) => pendingSections.includes(key) || !initialPayload[key]?.length;
+  
   const [loading, setLoading] = useState({ 
-    emails: !initialPayload.emails?.length, 
-    tasks: !initialPayload.tasks?.length, 
-    events: !initialPayload.events?.length,
+    emails: needsFetch('emails'), 
+    tasks: needsFetch('tasks'), 
+    events: needsFetch('events'),
     goals: true,
     achievements: true,
     timeTracking: true,
@@ -2839,13 +2899,10 @@ const App = () => {
   });
 
   useEffect(() => {
-    if (!initialPayload.emails?.length) fetchEmails();
-    if (!initialPayload.tasks?.length) fetchTasks();
-    if (!initialPayload.events?.length) fetchEvents();
-    fetchGoals();
-    fetchAchievements();
-    fetchTimeTracking();
-    fetchHabits();
+    if (needsFetch('emails')) fetchEmails();
+    if (needsFetch('tasks')) fetchTasks();
+    if (needsFetch('events')) fetchEvents();
+    fetchDashboard();
   }, []);
 
   const fetchEmails = async () => {
@@ -2863,8 +2920,12 @@ const App = () => {
   const fetchTasks = async () => {
     setLoading(prev => ({ ...prev, tasks: true }));
     try {
-      const data = await apiFetch(CONFIG.routes.apiTasks);
+      // /api/tasks/ is cursor-paginated across all task lists; refetch as
+      // many tasks as are already shown so a refresh keeps loaded pages
+      const limit = Math.min(Math.max(tasks.length, TASKS_PAGE_SIZE), TASKS_MAX_PAGE_SIZE);
+      const data = await apiFetch(`${CONFIG.routes.apiTasks}?limit=${limit}`);
       setTasks(data.tasks || []);
+      setTasksCursor(data.next_cursor || null);
     } catch (err) {
       console.error('Failed to fetch tasks:', err);
     } finally {
@@ -2872,6 +2933,23 @@ const App = () => {
     }
   };
 
+  const loadMoreTasks = async () => {
+    if (!tasksCursor) return;
+    setLoadingMoreTasks(true);
+    try {
+      const data = await apiFetch(`${CONFIG.routes.apiTasks}?cursor=${encodeURIComponent(tasksCursor)}`);
+      setTasks(prev => {
+        const known = new Set(prev.map(t => t.id));
+        return [...prev, ...(data.tasks || []).filter(t => !known.has(t.id))];
+      });
+      setTasksCursor(data.next_cursor || null);
+    } catch (err) {
+      console.error('Failed to load more tasks:', err);
+    } finally {
+      setLoadingMoreTasks(false);
+    }
+  };
+
   const fetchEvents = async () => {
     setLoading(prev => ({ ...prev, events: true }));
     try {
@@ -2895,32 +2973,56 @@ const App = () => {
   };
 
   const handleUpdateTask = async (taskId, updates) => {
+    // Send the etag we last saw so the server can reject stale edits
+    const current = tasks.find(t => t.id === taskId);
     // Optimistic update
     setTasks(prev => prev.map(t => t.id === taskId ? { ...t, ...updates } : t));
     
     try {
       const data = await apiFetch(`/api/tasks/${taskId}/update/`, {
         method: 'PUT',
-        body: JSON.stringify(updates)
+        body: JSON.stringify({ ...updates, etag: current?.etag, tasklist: current?.tasklist })
       });
       if (data.task) {
         setTasks(prev => prev.map(t => t.id === taskId ? data.task : t));
       }
     } catch (err) {
-      // Revert on error
-      fetchTasks();
+      if (err.status === 409 && err.data?.task) {
+        // Someone else changed the task; show their version
+        setTasks(prev => prev.map(t => t.id === taskId ? err.data.task : t));
+      } else {
+        // Revert on error
+        fetchTasks();
+      }
     }
   };
 
   const handleDeleteTask = async (taskId) => {
+    const tasklist = tasks.find(t => t.id === taskId)?.tasklist;
     setTasks(prev => prev.filter(t => t.id !== taskId));
     try {
-      await apiFetch(`/api/tasks/${taskId}/delete/`, { method: 'DELETE' });
+      const query = tasklist ? `?tasklist=${encodeURIComponent(tasklist)}` : '';
+      await apiFetch(`/api/tasks/${taskId}/delete/${query}`, { method: 'DELETE' });
     } catch (err) {
       fetchTasks();
     }
   };
 
+  // Goals, achievements, time tracking and habits arrive in one request
+  const fetchDashboard = async () => {
+    try {
+      const data = await apiFetch(CONFIG.routes.apiDashboard);
+      setGoals(data.goals || []);
+      setAchievements(data.achievements || []);
+      setTimeData(data.time_tracking || null);
+      setHabits(data.habits || []);
+    } catch (err) {
+      console.error('Failed to fetch dashboard:', err);
+    } finally {
+      setLoading(prev => ({ ...prev, goals: false, achievements: false, timeTracking: false, habits: false }));
+    }
+  };
+
   // Goals handlers
   const fetchGoals = async () => {
     setLoading(prev => ({ ...prev, goals: true }));
@@ -3055,6 +3157,45 @@ const App = () => {
     return false;
   };
 
+  // Refetch only the sections the server's event stream says have changed
+  const streamHandlers = useRef({});
+  const fetchDashboardRef = useRef(fetchDashboard);
+  fetchDashboardRef.current = fetchDashboard;
+  streamHandlers.current = {
+    emails: fetchEmails,
+    tasks: fetchTasks,
+    calendar: fetchEvents,
+    goals: () => { fetchGoals(); fetchAchievements(); },
+    time_entries: fetchTimeTracking,
+    habits: fetchHabits,
+  };
+
+  useEffect(() => {
+    if (!window.EventSource || !CONFIG.routes.apiStream) return;
+    // EventSource reconnects by itself and resumes with Last-Event-ID
+    const source = new EventSource(CONFIG.routes.apiStream);
+    const timers = {};
+    Object.keys(streamHandlers.current).forEach(section => {
+      source.addEventListener(section, (e) => {
+        const data = JSON.parse(e.data || '{}');
+        if (data.origin === CLIENT_ID) return;
+        // Coalesce bursts (a bulk edit, a multi-calendar sync) into one refetch
+        clearTimeout(timers[section]);
+        timers[section] = setTimeout(() => streamHandlers.current[section](), 250);
+      });
+    });
+    // Missed events could not be replayed; refresh everything once
+    source.addEventListener('resync', () => {
+      const { emails, tasks, calendar } = streamHandlers.current;
+      [emails, tasks, calendar].forEach(handler => handler());
+      fetchDashboardRef.current();
+    });
+    return () => {
+      source.close();
+      Object.values(timers).forEach(clearTimeout);
+    };
+  }, []);
+
   const counts = {
     emails: emails.length,
     tasks: tasks.filter(t => t.status !== 'done').length,
@@ -3151,6 +3292,9 @@ const App = () => {
           <TasksTab
             tasks={tasks}
             loading={loading.tasks}
+            hasMore={!!tasksCursor}
+            loadingMore={loadingMoreTasks}
+            onLoadMore={loadMoreTasks}
             onRefresh={fetchTasks}
             onCreateTask={handleCreateTask}
             onUpdateTask={handleUpdateTask}